@@ -1,16 +1,276 @@
 # ai_predictor.py
+import copy
+import hashlib
 import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
 import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
 from sklearn.exceptions import NotFittedError
 from datetime import datetime, timedelta
+from database_manager import SCHEMA_VERSION, CATEGORY_RULE_FLAGS, category_rule_alternative, validate_category_rule
+
+# Arka plan yeniden eğitim zamanlaması: yeni etiketli işlemler geldikçe son bildirimin üzerinden
+# TRAINING_DEBOUNCE saniye geçmeden eğitim başlamaz (art arda eklemeler tek eğitimde toplanır).
+# En az TRAINING_MIN_NEW_ROWS yeni satır biriktiğinde ya da ilk bekleyen satırın üzerinden
+# TRAINING_MAX_DELAY saniye geçtiğinde model yeniden eğitilir.
+TRAINING_DEBOUNCE = 2.0
+TRAINING_MIN_NEW_ROWS = 20
+TRAINING_MAX_DELAY = 300.0
+
+# Çevrimiçi (artımlı) öğrenme: HashingVectorizer sözlük tutmadığından yeni satırlar modele partial_fit ile
+# eklenebilir. Son ACCURACY_WINDOW yeni satırda, eğitimden önce yapılan tahminlerin doğruluğu izlenir;
+# pencere ilk kez ACCURACY_MIN_SAMPLES satıra ulaştığında ölçülen doğruluk referans alınır ve doğruluk
+# referansın ACCURACY_TOLERANCE kadar altına düşerse model tüm veriyle baştan eğitilir.
+# Vektörler normalize edilmez (ham kelime sayıları) ve düşük bir yumuşatma kullanılır: l2 normu ve alpha=1 ile
+# 2**14 sütuna dağılan yumuşatma kelimeleri bastırıp tahmini sınıf önceliğine (en kalabalık kategoriye) kaydırır.
+# Ardışık düzen değiştiğinde ONLINE_PIPELINE_VERSION artırılır; eski sürümle kaydedilmiş modeller yeniden eğitilir.
+ONLINE_HASHING_FEATURES = 2 ** 14
+ONLINE_NB_ALPHA = 0.01
+ONLINE_PIPELINE_VERSION = 2
+ACCURACY_WINDOW = 200
+ACCURACY_MIN_SAMPLES = 50
+ACCURACY_TOLERANCE = 0.15
+
+# Model dosyaları veritabanı dosyasının yanındaki MODEL_DIR altında; veritabanı, kullanıcı ve şema sürümü başına
+# ayrı bir klasörde tutulur (bkz. _default_model_dir). Yüklenen modeller
+# süreç içinde en fazla MODEL_CACHE_MAX_ENTRIES kayıt ve toplam MODEL_CACHE_MAX_BYTES (dosya boyutuyla ölçülen)
+# sınırıyla önbellekte kalır; kullanıcı değiştirildiğinde model diskten yeniden okunmaz.
+MODEL_DIR = "models"
+MODEL_CACHE_MAX_ENTRIES = 8
+MODEL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _default_model_dir(db_manager, user_id):
+    """
+    Kullanıcının model klasörünü döner. Klasör, veritabanının çözümlenmiş yolunun özetiyle ayrılır; aynı user_id'yi
+    taşıyan iki veritabanı birbirinin modelini okumaz veya ezmez. Bellek içi veritabanlarının kalıcı bir yolu
+    olmadığından modelleri o DatabaseManager örneğine ayrılır.
+    """
+    db_name = db_manager.db_name
+    if db_name == ":memory:" or db_name.startswith("file:"):
+        base_dir, identity = os.getcwd(), f"{db_name}#{id(db_manager)}"
+    else:
+        db_path = os.path.realpath(db_name)
+        base_dir, identity = os.path.dirname(db_path), db_path
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(base_dir, MODEL_DIR, f"db_{digest}", f"user_{user_id}_v{SCHEMA_VERSION}")
+
+
+class ModelCache:
+    """
+    Yüklenmiş modeller için LRU önbellek. Kayıtlar model dosyasının yoluyla tutulur; değer (model, vektörleyici,
+    durum) üçlüsüdür. Boyut olarak modelin diske yazılmış dosyalarının toplam boyutu kullanılır. Kayıt sayısı veya
+    toplam boyut sınırı aşılınca en uzun süredir kullanılmayan model atılır.
+    """
+
+    def __init__(self, max_entries=MODEL_CACHE_MAX_ENTRIES, max_bytes=MODEL_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Önbellekteki (model, vektörleyici, durum) üçlüsünü veya None döner."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, artifacts, size):
+        """Modeli önbelleğe koyar; aynı anahtardaki eski model değiştirilir."""
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (artifacts, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def discard(self, key):
+        """Anahtardaki modeli önbellekten çıkarır."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        """Tüm modelleri atar."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """İsabet, ıska, kayıt sayısı ve toplam boyutu döner."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+
+# Süreç genelinde paylaşılan model önbelleği
+MODEL_CACHE = ModelCache()
+
+# predict_categories sonuçları (normalize açıklama, top_k) anahtarıyla en fazla bu kadar kayıt saklanır
+PREDICTION_MEMO_SIZE = 4096
+
+
+def _normalize_description(description):
+    """
+    Tahmin önbelleği anahtarı: küçük harf ve tek boşluk. Vektörleyici de büyük/küçük harfi ve boşlukları
+    ayırt etmediğinden aynı anahtara düşen açıklamalar aynı tahmini alır.
+    """
+    return " ".join(description.lower().split())
+
+
+class TrainingScheduler:
+    """
+    Model eğitimini Tk iş parçacığı dışında, tek bir arka plan iş parçacığında çalıştırır.
+    notify() yeni etiketli satırları biriktirir ve eğitimi eşiklere göre zamanlar; request_now() bekleyen
+    bir eğitimi beklemeden (yine arka planda) başlatır. Aynı anda en fazla bir eğitim çalışır.
+    """
+
+    def __init__(self, train, debounce=TRAINING_DEBOUNCE, min_new_rows=TRAINING_MIN_NEW_ROWS,
+                 max_delay=TRAINING_MAX_DELAY):
+        self.debounce = debounce
+        self.min_new_rows = min_new_rows
+        self.max_delay = max_delay
+        self._train = train
+        self._condition = threading.Condition()
+        self._pending_rows = 0
+        self._first_pending_at = None
+        self._last_notified_at = None
+        self._forced = False
+        self._callbacks = []
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="fingo-ai-training", daemon=True)
+        self._thread.start()
+
+    def notify(self, new_rows=1):
+        """Yeni (veya değişen) etiketli satırları bildirir."""
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending_rows:
+                self._first_pending_at = now
+            self._pending_rows += new_rows
+            self._last_notified_at = now
+            self._condition.notify()
+
+    def request_now(self, callback=None):
+        """
+        Eğitimi eşikleri beklemeden başlatır. callback verilirse eğitim bitince eğitim iş parçacığından çağrılır
+        (Tkinter arayüzüne dokunacaksa root.after ile ana iş parçacığına aktarılmalıdır).
+        """
+        with self._condition:
+            self._forced = True
+            if callback is not None:
+                self._callbacks.append(callback)
+            self._condition.notify()
+
+    def _seconds_until_due(self, now):
+        """Eğitime kalan süreyi döner; bekleyen iş yoksa None."""
+        if self._forced:
+            return 0
+        if not self._pending_rows:
+            return None
+        due_at = self._last_notified_at + self.debounce
+        if self._pending_rows < self.min_new_rows:
+            due_at = max(due_at, self._first_pending_at + self.max_delay)
+        return max(0.0, due_at - now)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    wait = self._seconds_until_due(time.monotonic())
+                    if wait == 0:
+                        break
+                    self._condition.wait(wait)
+                full = self._forced  # Açık istekler tam eğitim, eşikle tetiklenenler artımlı eğitim yapar
+                self._pending_rows = 0
+                self._forced = False
+                callbacks, self._callbacks = self._callbacks, []
+            try:
+                self._train(full)
+            except Exception as e:
+                print(f"Hata: Arka plan model eğitimi başarısız oldu: {e}")
+            for callback in callbacks:
+                callback()
+
+    def stop(self, timeout=None):
+        """İş parçacığını durdurur; süren bir eğitim varsa en fazla timeout saniye bitmesini bekler."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+
+class CategoryRuleEngine:
+    """
+    Kullanıcının kategori kurallarını (bkz. DatabaseManager.get_category_rules) tek bir düzenli ifadede derler.
+    Her kural, metnin başına bağlı bir ileri bakış (lookahead) alternatifi olur; alternatifler öncelik sırasıyla
+    denendiğinden açıklamada herhangi bir yerde eşleşen en öncelikli kural kazanır. Anahtar kelimeler
+    düz metin olarak aranır. Büyük/küçük harf, anahtar kelimelerde Türkçe ı/İ farkı da gözetilmez.
+    Birleşik ifadeye uymayan bir kural (örn: denetimden önce eklenmiş) yalnızca kendisi atlanır.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self._targets = {}  # grup adı -> (kural ID'si, kategori)
+        alternatives = []
+        for rule_id, pattern, is_regex, category, _ in self.rules:
+            if category is None:
+                continue
+            error = validate_category_rule(pattern, is_regex)
+            if error:
+                print(f"UYARI: '{pattern}' kategori kuralı atlanıyor, {error}.")
+                continue
+            alternatives.append(category_rule_alternative(rule_id, pattern, is_regex))
+            self._targets[f"rule_{rule_id}"] = (rule_id, category)
+        self._pattern = self._compile(alternatives)
+
+    @staticmethod
+    def _compile(alternatives):
+        if not alternatives:
+            return None
+        try:
+            return re.compile("|".join(alternatives), CATEGORY_RULE_FLAGS)
+        except re.error:
+            pass
+        # Kurallar tek başına derlenip birlikte derlenemiyorsa, diğerleriyle çakışanlar tek tek ayıklanır
+        compiled = []
+        for alternative in alternatives:
+            try:
+                re.compile("|".join(compiled + [alternative]), CATEGORY_RULE_FLAGS)
+                compiled.append(alternative)
+            except re.error as e:
+                print(f"UYARI: Bir kategori kuralı diğer kurallarla birlikte derlenemedi, atlanıyor: {e}")
+        return re.compile("|".join(compiled), CATEGORY_RULE_FLAGS) if compiled else None
+
+    def match(self, description):
+        """Açıklamaya uyan en öncelikli kuralın (kural ID'si, kategori) çiftini veya None döner."""
+        if self._pattern is None:
+            return None
+        match = self._pattern.match(description)
+        return self._targets[match.lastgroup] if match else None
 
 
 class AIPredictor:
-    def __init__(self, db_manager, user_id, model_path="category_model.joblib",
-                 vectorizer_path="tfidf_vectorizer.joblib"):
+    def __init__(self, db_manager, user_id, model_path=None, vectorizer_path=None, state_path=None, online=False,
+                 model_cache=MODEL_CACHE):
         """
         Yapay zeka modelini başlatır. Kayıtlı bir model varsa yükler, yoksa eğitir.
         Args:
@@ -18,13 +278,33 @@ class AIPredictor:
             user_id (int): Mevcut kullanıcının ID'si.
             model_path (str): Eğitilmiş modelin kaydedileceği/yükleneceği dosya yolu.
             vectorizer_path (str): TF-IDF vektörleyicin kaydedileceği/yükleneceği dosya yolu.
+            state_path (str): Eğitim durumunun (son eğitilen işlem ID'si, doğruluk penceresi) dosya yolu.
+                Verilmeyen yollar veritabanına, kullanıcıya ve şema sürümüne özel klasörde oluşturulur
+                (bkz. _default_model_dir).
+            online (bool): True ise model HashingVectorizer ile kurulur ve yeni işlemlerle artımlı eğitilir.
+            model_cache (ModelCache): Yüklenen modellerin tutulduğu önbellek; None ise önbellek kullanılmaz.
         """
         self.model = None
         self.vectorizer = None
-        self.model_path = model_path
-        self.vectorizer_path = vectorizer_path
+        model_dir = _default_model_dir(db_manager, user_id)
+        self.model_path = model_path or os.path.join(model_dir, "category_model.joblib")
+        self.vectorizer_path = vectorizer_path or os.path.join(model_dir, "vectorizer.joblib")
+        self.state_path = state_path or os.path.join(model_dir, "category_model_state.joblib")
+        self.model_cache = model_cache
+        # Önbellek anahtarı mutlak yoldur: çalışma dizini değişse de aynı dosya aynı kayda karşılık gelir
+        self._cache_key = os.path.abspath(self.model_path)
+        self.online = online
+        self.state = None  # {"mode", "watermark", "window", "baseline"}
         self.db_manager = db_manager  # DatabaseManager örneğini alıyoruz
         self.user_id = user_id
+        self.scheduler = None  # İlk arka plan eğitim isteğinde başlatılır
+        self._train_lock = threading.Lock()  # Eşzamanlı iki eğitimi önler
+        self._prediction_memo = OrderedDict()  # (normalize açıklama, top_k) -> [(kategori, olasılık), ...]
+        self._memo_model = None  # Önbellekteki tahminleri üreten model; model değişince önbellek boşaltılır
+        self._memo_lock = threading.Lock()
+        self._rule_engine = None  # Kurallar değişince yeniden derlenir
+        self._rule_hits = Counter()  # Henüz yazılmamış kural eşleşmeleri (bkz. flush_rule_hits)
+        self._rule_hits_lock = threading.Lock()
 
         # Debug çıktısı: Uygulama çalışma dizinini göster
         print(f"DEBUG: AIPredictor başlatıldı. Çalışma dizini: {os.getcwd()}")
@@ -33,77 +313,220 @@ class AIPredictor:
         # ayrı bir metoda taşıdık, böylece UI hazır olduğunda çağrılabilir.
         # self.load_or_train_model() # Bu satır fingo_app.py'ye taşındı
 
-    def load_or_train_model(self, force_retrain=False):
+    def load_or_train_model(self, force_retrain=False, background=False):
         """
         Kayıtlı modeli veya vektörleyiciyi yükler. Eğer yoksa veya yeniden eğitim istenirse,
         veritabanından verileri çekip modeli eğitir ve kaydeder.
         Args:
             force_retrain (bool): True ise model ve vektörleyici yüklü olsa bile yeniden eğitir.
+            background (bool): True ise eğitim arka planda yapılır; bu sırada eski model tahminde kullanılır.
         """
         if self.model and self.vectorizer and not force_retrain:
             print("Yapay zeka modeli ve vektörleyici zaten yüklü.")
             return
 
-        # Model ve vektörleyiciyi yüklemeyi dene
-        if os.path.exists(self.model_path) and os.path.exists(self.vectorizer_path) and not force_retrain:
+        # Model ve vektörleyiciyi önce önbellekten, yoksa diskten yüklemeyi dene
+        artifacts = None if force_retrain or self.model_cache is None else self.model_cache.get(self._cache_key)
+        if artifacts is None and os.path.exists(self.model_path) and os.path.exists(self.vectorizer_path) \
+                and not force_retrain:
+            try:
+                state = joblib.load(self.state_path) if os.path.exists(self.state_path) else None
+                artifacts = (joblib.load(self.model_path), joblib.load(self.vectorizer_path), state)
+                self._cache_artifacts(artifacts)
+            except Exception as e:
+                print(f"Hata: Kayıtlı model veya vektörleyici yüklenirken sorun oluştu: {e}. Yeniden eğitiliyor.")
+        if artifacts is not None:
             try:
-                self.model = joblib.load(self.model_path)
-                self.vectorizer = joblib.load(self.vectorizer_path)
+                model, vectorizer, state = artifacts
+                if self._mode() != (state["mode"] if state else "batch") or (self.online and state is None):
+                    # Kayıtlı model diğer kipte eğitilmiş (veya artımlı eğitim için durum dosyası yok)
+                    raise ValueError("kayıtlı model bu eğitim kipiyle uyumsuz")
+                self.model = model
+                self.vectorizer = vectorizer
+                self.state = state
                 print("Kayıtlı yapay zeka modeli ve vektörleyici yüklendi.")
+                if self.online:
+                    # Son kayıttan sonra eklenip henüz öğrenilmemiş işlemleri modele kat (yalnızca yeni satırlar okunur)
+                    self._train_model(full=False)
                 return
             except Exception as e:
                 print(f"Hata: Kayıtlı model veya vektörleyici yüklenirken sorun oluştu: {e}. Yeniden eğitiliyor.")
                 self.model = None
                 self.vectorizer = None
+                self.state = None
 
         # Model yoksa veya yüklenemediyse veya yeniden eğitim isteniyorsa eğit
         print("Kayıtlı model bulunamadı veya yeniden eğitim isteniyor, model eğitiliyor.")
-        self._train_model()
+        if background:
+            self.retrain_in_background()
+        else:
+            self._train_model()
 
-    def _train_model(self):
+    def _get_scheduler(self):
+        if self.scheduler is None:
+            self.scheduler = TrainingScheduler(self._train_model)
+        return self.scheduler
+
+    def notify_labeled_rows(self, count=1):
         """
-        Veritabanından işlem verilerini çekerek kategorizasyon modelini eğitir.
+        Eklenen, güncellenen veya silinen etiketli (kategorili) işlemleri bildirir. Model her işlemde değil,
+        yeterli değişiklik biriktiğinde veya belirli bir süre geçtiğinde arka planda yeniden eğitilir.
         """
+        if count:
+            self._get_scheduler().notify(count)
+
+    def retrain_in_background(self, callback=None):
+        """Modeli eşikleri beklemeden arka planda yeniden eğitir; callback eğitim bitince çağrılır."""
+        self._get_scheduler().request_now(callback)
+
+    def shutdown(self, timeout=5.0):
+        """
+        Arka plan eğitim iş parçacığını durdurur ve birikmiş kural eşleşmelerini yazar
+        (veritabanı kapatılmadan önce çağrılmalıdır).
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop(timeout)
+            self.scheduler = None
+        self.flush_rule_hits()
+
+    def flush_rule_hits(self):
+        """
+        Tahminlerde biriken kural eşleşme sayılarını tek bir toplu yazmayla veritabanına aktarır. Tahminler
+        veritabanına yazmaz; sayaçlar burada, DatabaseManager'ın bağlantısının iş parçacığından yazılır.
+        """
+        with self._rule_hits_lock:
+            hits, self._rule_hits = self._rule_hits, Counter()
+        if hits:
+            self.db_manager.record_category_rule_hits(hits, self.user_id)
+
+    def _mode(self):
+        return f"online-v{ONLINE_PIPELINE_VERSION}" if self.online else "batch"
+
+    def _train_model(self, full=True):
+        """
+        Veritabanından işlem verilerini çekerek kategorizasyon modelini eğitir. Yeni model yerel değişkenlerde
+        eğitilip diske kaydedildikten sonra tek adımda devreye alınır; eğitim sürerken predict_category eski
+        modeli kullanmaya devam eder. Eğitim başarısız olursa eski model korunur.
+        Args:
+            full (bool): False ise ve çevrimiçi kipte bir model yüklüyse, yalnızca son eğitimden sonra eklenen
+                işlemlerle artımlı eğitim yapılır. Yeni bir kategori görülürse veya doğruluk düşerse yine
+                tüm veriyle baştan eğitilir.
+        """
+        with self._train_lock:
+            if self.online and not full and self.model and self.state:
+                self._partial_fit_and_swap_model()
+            else:
+                self._fit_and_swap_model()
+
+    def _build_pipeline(self):
+        if self.online:
+            # Sözlüksüz (durumsuz) vektörleyici: yeni kelimeler için yeniden fit gerektirmez
+            vectorizer = HashingVectorizer(n_features=ONLINE_HASHING_FEATURES, alternate_sign=False, norm=None)
+            classifier = MultinomialNB(alpha=ONLINE_NB_ALPHA)
+        else:
+            vectorizer = TfidfVectorizer(max_features=1000)  # En çok geçen 1000 kelimeyi kullan
+            classifier = MultinomialNB()
+        return vectorizer, Pipeline([
+            ('vectorizer', vectorizer),
+            ('classifier', classifier)
+        ])
+
+    def _cache_artifacts(self, artifacts):
+        if self.model_cache is not None:
+            size = sum(os.path.getsize(path) for path in (self.model_path, self.vectorizer_path, self.state_path)
+                       if os.path.exists(path))
+            self.model_cache.put(self._cache_key, artifacts, size)
+
+    def _save_and_swap(self, model, vectorizer, state):
+        # Modeli, vektörleyiciyi ve durumu önce geçici dosyalara yazıp yerlerine taşı; yarım yazılmış dosya kalmaz
+        for obj, path in ((model, self.model_path), (vectorizer, self.vectorizer_path), (state, self.state_path)):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            joblib.dump(obj, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        self.vectorizer = vectorizer
+        self.model = model
+        self.state = state
+        self._cache_artifacts((model, vectorizer, state))
+
+    def _fit_and_swap_model(self):
         # Sadece kategori ve açıklaması olan işlemleri çek
-        data = self.db_manager.get_all_transactions_for_ai_training(self.user_id)
+        data = self.db_manager.get_ai_training_rows_since(self.user_id)
 
         if not data:
             print("UYARI: Yapay zeka modeli eğitimi için veri bulunamadı. Lütfen işlem ekleyin.")
             self.model = None
             self.vectorizer = None
+            self.state = None
             return
 
         # En az N (örneğin 10) farklı işlem veya yeterli çeşitlilikte veri olması önerilir
         # Daha iyi bir çeşitlilik kontrolü için benzersiz kategori sayısına bakılabilir.
-        descriptions = [item[0] for item in data]
-        categories = [item[1] for item in data]
+        descriptions = [item[1] for item in data]
+        categories = [item[2] for item in data]
 
         if len(descriptions) < 10 or len(set(categories)) < 2:
             print(
                 "UYARI: Yapay zeka modeli eğitimi için yeterli veya çeşitli veri bulunamadı (en az 10 işlem ve 2 farklı kategori gerekli). Lütfen daha fazla işlem ekleyin.")
             self.model = None
             self.vectorizer = None
+            self.state = None
             return
 
         try:
-            # Pipeline oluştur: TF-IDF vektörleyici ve Naive Bayes sınıflandırıcı
-            self.vectorizer = TfidfVectorizer(max_features=1000)  # En çok geçen 1000 kelimeyi kullan
-            self.model = Pipeline([
-                ('vectorizer', self.vectorizer),
-                ('classifier', MultinomialNB())
-            ])
+            # Pipeline oluştur: vektörleyici ve Naive Bayes sınıflandırıcı
+            vectorizer, model = self._build_pipeline()
 
             # Modeli eğit
-            self.model.fit(descriptions, categories)
+            model.fit(descriptions, categories)
 
-            # Modeli ve vektörleyiciyi kaydet
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.vectorizer, self.vectorizer_path)
+            # Filigran: modelin gördüğü son işlem ID'si; artımlı eğitim buradan devam eder
+            state = {"mode": self._mode(), "watermark": data[-1][0], "window": [], "baseline": None}
+            self._save_and_swap(model, vectorizer, state)
             print("Yapay zeka modeli başarıyla eğitildi ve kaydedildi.")
         except Exception as e:
             print(f"Hata: Model eğitilirken veya kaydedilirken bir sorun oluştu: {e}")
-            self.model = None
-            self.vectorizer = None
+
+    def _partial_fit_and_swap_model(self):
+        data = self.db_manager.get_ai_training_rows_since(self.user_id, self.state["watermark"])
+        if not data:
+            return
+
+        descriptions = [item[1] for item in data]
+        categories = [item[2] for item in data]
+        classifier = self.model.named_steps['classifier']
+
+        # partial_fit sınıf kümesini genişletemez; yeni kategori varsa tam eğitim gerekir
+        if not set(categories) <= set(classifier.classes_):
+            print("Yeni kategori bulundu, yapay zeka modeli baştan eğitiliyor.")
+            self._fit_and_swap_model()
+            return
+
+        try:
+            # Önce tahmin et, sonra öğren: pencere modelin görmediği satırlardaki doğruluğu ölçer
+            predictions = self.model.predict(descriptions)
+            window = (self.state["window"] + [p == c for p, c in zip(predictions, categories)])[-ACCURACY_WINDOW:]
+            baseline = self.state["baseline"]
+            accuracy = sum(window) / len(window)
+            if baseline is None and len(window) >= ACCURACY_MIN_SAMPLES:
+                baseline = accuracy
+            elif baseline is not None and accuracy < baseline - ACCURACY_TOLERANCE:
+                print(f"Yapay zeka modelinin doğruluğu düştü (%{accuracy * 100:.0f}, referans "
+                      f"%{baseline * 100:.0f}), model baştan eğitiliyor.")
+                self._fit_and_swap_model()
+                return
+
+            # Yüklü modeli değiştirmeden kopyası üzerinde eğit; tahminler eğitim bitene kadar eski modelle yapılır
+            classifier = copy.deepcopy(classifier)
+            classifier.partial_fit(self.vectorizer.transform(descriptions), categories)
+            model = Pipeline([
+                ('vectorizer', self.vectorizer),
+                ('classifier', classifier)
+            ])
+            state = {"mode": self._mode(), "watermark": data[-1][0], "window": window, "baseline": baseline}
+            self._save_and_swap(model, self.vectorizer, state)
+            print(f"Yapay zeka modeli {len(data)} yeni işlemle güncellendi.")
+        except Exception as e:
+            print(f"Hata: Model artımlı eğitilirken veya kaydedilirken bir sorun oluştu: {e}")
 
     def predict_category(self, description):
         """
@@ -113,26 +536,106 @@ class AIPredictor:
         Returns:
             str or None: Tahmin edilen kategori adı veya model eğitilmemişse None.
         """
-        if self.model and self.vectorizer:  # Model ve vektörleyici yüklü ve geçerli mi kontrol et
-            try:
-                # model zaten bir Pipeline, bu yüzden doğrudan predict çağrılabilir.
-                predicted_category = self.model.predict([description])[0]
-                return predicted_category
-            except NotFittedError:
-                print("UYARI: Model eğitilmemiş, tahmin yapılamıyor (NotFittedError).")
-                return None
-            except Exception as e:
-                print(f"Hata: Kategori tahmini yapılırken sorun oluştu: {e}")
-                return None
-        else:
+        predictions = self.predict_categories([description])[0]
+        return predictions[0][0] if predictions else None
+
+    def predict_categories(self, descriptions, top_k=1):
+        """
+        Açıklama listesinin kategorilerini tek seferde tahmin eder. Önce kullanıcının kategori kuralları denenir;
+        kurala uyan açıklamalar doğrudan o kategoriyi alır ve kuralın eşleşme sayacı artırılır. Kalan açıklamalardan
+        önbellekte olmayan benzersiz olanlar tek bir vektörleştirme ve predict_proba çağrısıyla işlenir. Model
+        sonuçları normalize açıklamaya göre LRU önbellekte tutulur; model yeniden eğitilip değiştiğinde önbellek
+        boşaltılır.
+        Args:
+            descriptions (list): İşlem açıklamaları.
+            top_k (int): Her açıklama için döndürülecek en olası kategori sayısı.
+        Returns:
+            list: Her açıklama için olasılığa göre azalan [(kategori, olasılık), ...] listesi (kural eşleşmesinde
+                [(kategori, 1.0)]); tahmin yapılamazsa boş liste.
+        """
+        engine = self._get_rule_engine()
+        results = [None] * len(descriptions)
+        unmatched = []  # kurala uymayan açıklamaların listedeki sıraları
+        hits = Counter()  # Bu çağrıdaki eşleşmeler; veritabanına flush_rule_hits ile toplu yazılır
+        for index, description in enumerate(descriptions):
+            rule = engine.match(description)
+            if rule is not None:
+                results[index] = [(rule[1], 1.0)]
+                hits[rule[0]] += 1
+            else:
+                unmatched.append(index)
+        if hits:
+            with self._rule_hits_lock:
+                self._rule_hits.update(hits)
+        if unmatched:
+            predictions = self._predict_with_model([descriptions[index] for index in unmatched], top_k)
+            for index, prediction in zip(unmatched, predictions):
+                results[index] = prediction
+        return results
+
+    def _get_rule_engine(self):
+        rules = self.db_manager.get_category_rules(self.user_id)  # Önbellekten okunur
+        if self._rule_engine is None or self._rule_engine.rules != tuple(rules):
+            self._rule_engine = CategoryRuleEngine(rules)
+        return self._rule_engine
+
+    def _predict_with_model(self, descriptions, top_k):
+        model = self.model  # Arka plan eğitimi modeli değiştirse de bu çağrı tek bir model üzerinden yürür
+        if not (model and self.vectorizer):  # Model ve vektörleyici yüklü ve geçerli mi kontrol et
             print(
                 "UYARI: Yapay zeka modeli başlatılamadı veya eğitilmediği için tahmin yapılamıyor. Model veya vektörleyici eksik/bozuk.")
-            return None
+            return [[] for _ in descriptions]
+
+        results = [None] * len(descriptions)
+        pending = {}  # önbellekte olmayan anahtar -> açıklamanın listedeki sıraları
+        with self._memo_lock:
+            if self._memo_model is not model:
+                self._prediction_memo.clear()
+                self._memo_model = model
+            for index, description in enumerate(descriptions):
+                key = (_normalize_description(description), top_k)
+                cached = self._prediction_memo.get(key)
+                if cached is not None:
+                    self._prediction_memo.move_to_end(key)
+                    results[index] = list(cached)
+                else:
+                    pending.setdefault(key, []).append(index)
+        if not pending:
+            return results
+
+        keys = list(pending)
+        try:
+            # model zaten bir Pipeline; vektörleştirme ve tahmin tüm açıklamalar için tek çağrıda yapılır
+            probabilities = model.predict_proba([key[0] for key in keys])
+            classes = model.classes_
+        except NotFittedError:
+            print("UYARI: Model eğitilmemiş, tahmin yapılamıyor (NotFittedError).")
+            return [result or [] for result in results]
+        except Exception as e:
+            print(f"Hata: Kategori tahmini yapılırken sorun oluştu: {e}")
+            return [result or [] for result in results]
+
+        with self._memo_lock:
+            for key, row in zip(keys, probabilities):
+                ranking = sorted(zip(classes, row), key=lambda item: item[1], reverse=True)[:top_k]
+                ranking = [(str(category), float(probability)) for category, probability in ranking]
+                for index in pending[key]:
+                    results[index] = list(ranking)
+                if self._memo_model is model:  # Tahmin sürerken model değiştiyse eski sonuçlar saklanmaz
+                    self._prediction_memo[key] = ranking
+            while len(self._prediction_memo) > PREDICTION_MEMO_SIZE:
+                self._prediction_memo.popitem(last=False)
+        return results
 
     def analyze_and_suggest_savings(self):
         """
         Kullanıcının finansal verilerini analiz eder ve tasarruf önerileri sunar.
+        Kullanıcının verisi son analizden beri değişmediyse önbellekteki rapor döner.
         """
+        return self.db_manager.cached_report(self.user_id, "savings_analysis", (datetime.now().strftime('%Y-%m'),),
+                                             self._build_savings_report)
+
+    def _build_savings_report(self):
         report = []
         report.append("--- Tasarruf Analizi ve Finansal Sağlık Raporu ---\n")
 
@@ -142,50 +645,19 @@ class AIPredictor:
 
         monthly_trend_data = self.db_manager.get_monthly_balance_trend(self.user_id, num_months=6)  # Son 6 ay
         if monthly_trend_data:
-            # Pandas ile işleme
-            import pandas as pd
-            df = pd.DataFrame(monthly_trend_data, columns=['date', 'type', 'amount'])
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
-
-            # Aylık net bakiyeyi hesapla
-            monthly_net = df.groupby(pd.Grouper(freq='M')).apply(
-                lambda x: (x[x['type'] == 'Gelir']['amount'].sum() - x[x['type'] == 'Gider']['amount'].sum()))
-
-            # Kümülatif bakiyeyi hesapla (önceki ayları da hesaba katarak)
-            # Bu, her ayın sonunda toplam bakiyenin nasıl değiştiğini gösterir.
-            all_transactions = self.db_manager.get_transactions(self.user_id)
-            if all_transactions:
-                df_all = pd.DataFrame(all_transactions,
-                                      columns=['id', 'date', 'type', 'amount', 'category', 'description'])
-                df_all['date'] = pd.to_datetime(df_all['date'])
-                df_all['signed_amount'] = df_all.apply(
-                    lambda row: row['amount'] if row['type'] == 'Gelir' else -row['amount'], axis=1)
-                df_all = df_all.sort_values('date')
-                df_all['cumulative_balance'] = df_all['signed_amount'].cumsum()
-
-                # Aylık kümülatif bakiye trendini daha doğru çekelim
-                monthly_cumulative_balance = df_all.set_index('date')['cumulative_balance'].resample(
-                    'M').last().ffill().fillna(0)
-
-                if len(monthly_cumulative_balance) > 1:
-                    first_month_balance = monthly_cumulative_balance.iloc[0]
-                    last_month_balance = monthly_cumulative_balance.iloc[-1]
-                    balance_change = last_month_balance - first_month_balance
-
-                    if balance_change > 0:
-                        report.append(
-                            f"Son {len(monthly_cumulative_balance)} ayda bakiye trendi genel olarak YÜKSELİYOR. ({balance_change:.2f} TL artış)\n")
-                    elif balance_change < 0:
-                        report.append(
-                            f"Son {len(monthly_cumulative_balance)} ayda bakiye trendi genel olarak DÜŞÜYOR. ({abs(balance_change):.2f} TL düşüş)\n")
-                    else:
-                        report.append(
-                            f"Son {len(monthly_cumulative_balance)} ayda bakiye trendi stabil. (Değişim yok)\n")
-                else:
-                    report.append("Yeterli bakiye trendi verisi bulunamadı (en az 2 aylık işlem gerekli).\n")
+            # Trend, aylık özet tablosundan gelen ay sonu bakiyeleri üzerinden hesaplanır:
+            # pencere boyunca bakiyedeki değişim, aylık net değişimlerin toplamıdır.
+            balance_change = sum(net for _, net, _ in monthly_trend_data)
+
+            if balance_change > 0:
+                report.append(
+                    f"Son {len(monthly_trend_data)} ayda bakiye trendi genel olarak YÜKSELİYOR. ({balance_change:.2f} TL artış)\n")
+            elif balance_change < 0:
+                report.append(
+                    f"Son {len(monthly_trend_data)} ayda bakiye trendi genel olarak DÜŞÜYOR. ({abs(balance_change):.2f} TL düşüş)\n")
             else:
-                report.append("Bakiye trendi analizi için işlem verisi bulunamadı.\n")
+                report.append(
+                    f"Son {len(monthly_trend_data)} ayda bakiye trendi stabil. (Değişim yok)\n")
         else:
             report.append("Bakiye trendi verisi bulunamadı.\n")
 
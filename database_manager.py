@@ -1,172 +1,1876 @@
 import sqlite3
 import bcrypt  # bcrypt kütüphanesini import ediyoruz
-from datetime import datetime, timedelta
+import json
+import math
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from pathlib import Path
 import pandas as pd
 
+# Her bağlantı açılışında uygulanan depolama profili. WAL modunda okumalar yazmaları bloklamaz;
+# synchronous=NORMAL, WAL ile birlikte her commit'teki fsync'i checkpoint'lere erteler.
+STORAGE_PROFILE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,  # 256 MB
+    "cache_size": -64000,  # Negatif değer KiB cinsindendir (~64 MB)
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # ms; havuzdaki okuyucular ve yazıcı aynı anda çalışırken kilit beklemesi
+}
+READER_POOL_SIZE = 4
+# Grup commit kuyruğu: ilk yazmadan sonra en fazla bu kadar saniye veya bu kadar yazma biriktirilip tek commit yapılır.
+WRITE_QUEUE_MAX_DELAY = 0.01
+WRITE_QUEUE_MAX_BATCH = 500
+# Rapor sonuç önbelleği: en fazla bu kadar sonuç ve yaklaşık bu kadar bayt tutulur; aşılırsa en eski kullanılan atılır.
+REPORT_CACHE_MAX_ENTRIES = 128
+REPORT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Sorgu izleme isteğe bağlıdır: bu ortam değişkeni "1" ise DatabaseManager izleme açık başlar (bkz. enable_tracing).
+TRACE_ENV_VAR = "FINGO_DB_TRACE"
+TRACE_SAMPLE_LIMIT = 2048  # Metod başına yüzdelik hesabı için saklanan en son süre örneği
+TRACE_PROGRESS_INTERVAL = 1000  # İlerleme geri çağrısı her bu kadar SQLite VM adımında bir çalışır
+
+# Şema katmanının yönettiği ikincil indeksler: (indeks adı, tablo, sütunlar).
+# Sıcak sorguların hepsi user_id ile birlikte tarih, tür veya kategoriye göre filtreleme yaptığından
+# indeksler user_id önekiyle başlar; rapor indeksi bakiye/trend sorgularını tabloya hiç gitmeden karşılar.
+# 'idx_' öneki şema katmanına ayrılmıştır: bu listede olmayan 'idx_' indeksleri migration sırasında kaldırılır.
+MANAGED_INDEXES = (
+    ("idx_transactions_user_date", "transactions", "user_id, date"),
+    ("idx_transactions_user_category", "transactions", "user_id, category_id"),
+    ("idx_transactions_user_report", "transactions", "user_id, date, type, category_id, amount"),
+    ("idx_categories_merged_into", "categories", "merged_into_id"),
+    ("idx_recurring_transactions_user", "recurring_transactions", "user_id"),
+    ("idx_invoices_offers_user_date", "invoices_offers", "user_id, document_date"),
+    ("idx_invoices_offers_user_type_date", "invoices_offers", "user_id, type, document_date"),
+    ("idx_invoices_offers_customer", "invoices_offers", "customer_id, type, status, total_amount_with_kdv"),
+    ("idx_invoice_items_invoice", "invoice_items", "invoice_offer_id, line_no"),
+    ("idx_invoice_items_product", "invoice_items", "product_id"),
+    ("idx_stock_movements_product_date", "stock_movements", "product_id, movement_date, quantity"),
+    ("idx_stock_movements_user_product", "stock_movements", "user_id, product_id, movement_date"),
+    ("idx_category_rules_user_priority", "category_rules", "user_id, priority"),
+    ("idx_category_rules_category", "category_rules", "category_id"),
+)
+
+# unicode61 tokenizer'ı (remove_diacritics 2) büyük/küçük harfi ve ş/ğ/ç/ö/ü gibi işaretleri zaten sadeleştirir,
+# ancak Türkçedeki noktasız 'ı' ile noktalı 'İ'yi 'i'ye indirmez. Bu iki harf hem indekslenen metinde
+# hem de arama teriminde 'i'ye çevrilir; böylece "ışık", "IŞIK" ve "isik" aynı sonucu verir.
+TURKISH_FOLD_MAP = str.maketrans({"ı": "i", "İ": "i"})
+
+
+def _turkish_fold_sql(expr):
+    """TURKISH_FOLD_MAP ile aynı katlamayı yapan SQL ifadesini döner."""
+    return f"replace(replace({expr}, 'ı', 'i'), 'İ', 'i')"
+
+
+def _search_words(text):
+    """
+    Metni FTS5 tokenizer'ının (unicode61 remove_diacritics 2) yaptığına yakın biçimde sadeleştirip kelimelerine ayırır:
+    Türkçe ı/İ katlaması, küçük harf ve aksan/çengel işaretlerinin atılması.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.translate(TURKISH_FOLD_MAP).lower())
+    return re.findall(r"\w+", "".join(char for char in decomposed if not unicodedata.combining(char)))
+
+
+# İşlemler kategoriye categories.id ile bağlıdır. Birleştirilen bir kategori silinmez, merged_into_id ile
+# hedef kategoriyi gösterir; ad değiştirme ve birleştirme yalnızca categories tablosuna dokunur.
+# merged_into_id her zaman birleştirilmemiş bir kategoriyi gösterir (zincir oluşmaz).
+# Kategori adından, kullanıcının (birleştirilmişse hedef) kategori ID'sini veren alt sorgu; parametreler: user_id, ad.
+CATEGORY_ID_BY_NAME_SQL = "(SELECT IFNULL(merged_into_id, id) FROM categories WHERE user_id = ? AND name = ?)"
+
+
+def _category_name_sql(row):
+    """Satırın (category_id sütunu olan tablo/takma ad) geçerli kategori adını veren SQL alt sorgusu."""
+    return (f"(SELECT IFNULL(m.name, c.name) FROM categories c LEFT JOIN categories m ON m.id = c.merged_into_id "
+            f"WHERE c.id = {row}.category_id)")
+
+
+# Kategori kuralları tek bir düzenli ifadede, her biri ayrı bir alternatif olarak birleştirilir
+# (bkz. ai_predictor.CategoryRuleEngine). Anahtar kelimelerde Türkçe i harfinin dört biçimi birbirine eşlenir.
+CATEGORY_RULE_FLAGS = re.IGNORECASE | re.DOTALL
+_TURKISH_I_CLASS = "[iIıİ]"
+
+
+def category_rule_alternative(rule_id, pattern, is_regex):
+    """Kuralın birleşik düzenli ifadedeki alternatifini döner: metnin herhangi bir yerinde arayan bir ileri bakış."""
+    if is_regex:
+        body = pattern
+    else:
+        body = "".join(_TURKISH_I_CLASS if char in "iIıİ" else re.escape(char) for char in pattern)
+    return f"(?=.*?(?P<rule_{rule_id}>{body}))"
+
+
+def validate_category_rule(pattern, is_regex):
+    """
+    Kuralın birleşik düzenli ifadede kullanılabilirliğini denetler. Adlandırılmış gruplar (iki kuralda aynı ad
+    çakışır), numaralı geri başvurular (kural sarmalanınca grup numaraları kayar) ve satır içi bayraklar
+    (yalnızca ifadenin başında geçerlidir) kabul edilmez; kural, kullanılacağı biçimde sarmalanarak derlenir.
+    Returns:
+        str or None: Hata açıklaması veya kural kullanılabilirse None.
+    """
+    if is_regex:
+        in_class = False
+        index = 0
+        while index < len(pattern):
+            char = pattern[index]
+            if char == "\\":
+                if not in_class and pattern[index + 1:index + 2] in tuple("123456789"):
+                    return "numaralı geri başvurular (\\1 vb.) kullanılamaz"
+                index += 2
+                continue
+            if in_class:
+                in_class = char != "]"
+            elif char == "[":
+                in_class = True
+                index += 1
+                # Sınıfın başındaki ']' (veya '^]') düz karakterdir
+                if pattern.startswith("^", index):
+                    index += 1
+                if pattern.startswith("]", index):
+                    index += 1
+                continue
+            elif pattern.startswith("(?P", index):
+                return "adlandırılmış gruplar ((?P<ad>...)) kullanılamaz"
+            elif pattern.startswith("(?", index) and pattern[index + 2:index + 3] in tuple("aiLmsux-"):
+                return "satır içi bayraklar ((?i) vb.) kullanılamaz"
+            index += 1
+    try:
+        re.compile(category_rule_alternative(0, pattern, is_regex), CATEGORY_RULE_FLAGS)
+    except re.error as e:
+        return f"geçersiz düzenli ifade: {e}"
+    return None
+
+
+def _signed_amount_sql(row):
+    """Tetikleyicideki satırın (new/old) bakiyeye etkisini veren SQL ifadesi: gelir artı, gider eksi."""
+    return f"CASE WHEN {row}.type = 'Gelir' THEN {row}.amount ELSE -{row}.amount END"
+
+
+def _rollup_add_sql(row):
+    """Tetikleyicideki satırı (new) aylık özet tablosundaki grubuna ekleyen SQL."""
+    return f"""
+            INSERT INTO transaction_rollups (user_id, year_month, type, category_id, total, transaction_count,
+                                             min_amount, max_amount)
+            VALUES ({row}.user_id, substr({row}.date, 1, 7), {row}.type, IFNULL({row}.category_id, 0),
+                    {row}.amount, 1, {row}.amount, {row}.amount)
+            ON CONFLICT (user_id, year_month, type, category_id) DO UPDATE SET
+                total = total + excluded.total,
+                transaction_count = transaction_count + 1,
+                min_amount = MIN(min_amount, excluded.min_amount),
+                max_amount = MAX(max_amount, excluded.max_amount);"""
+
+
+def _rollup_remove_sql(row):
+    """
+    Tetikleyicideki satırı (old) aylık özet tablosundaki grubundan çıkaran SQL. Çıkan tutar grubun en küçüğü
+    veya en büyüğüyse MIN/MAX yalnızca o ayın o grubu için (indeks üzerinden) yeniden hesaplanır; boşalan grup silinir.
+    """
+    group = (f"user_id = {row}.user_id AND year_month = substr({row}.date, 1, 7) AND type = {row}.type "
+             f"AND category_id = IFNULL({row}.category_id, 0)")
+    source = (f"FROM transactions WHERE user_id = {row}.user_id "
+              f"AND date BETWEEN substr({row}.date, 1, 7) || '-01' AND substr({row}.date, 1, 7) || '-31' "
+              f"AND type = {row}.type AND IFNULL(category_id, 0) = IFNULL({row}.category_id, 0)")
+    return f"""
+            UPDATE transaction_rollups SET total = total - {row}.amount, transaction_count = transaction_count - 1
+            WHERE {group};
+            UPDATE transaction_rollups SET min_amount = (SELECT MIN(amount) {source}),
+                                           max_amount = (SELECT MAX(amount) {source})
+            WHERE {group} AND ({row}.amount <= min_amount OR {row}.amount >= max_amount);
+            DELETE FROM transaction_rollups WHERE {group} AND transaction_count <= 0;"""
+
+
+# Şema katmanının yönettiği tetikleyiciler: (tetikleyici adı, gerektirdiği tablo, CREATE TRIGGER gövdesi).
+# Gerektirdiği tablo yoksa (ör. SQLite FTS5 olmadan derlenmişse) tetikleyici oluşturulmaz.
+# 'trg_' öneki şema katmanına ayrılmıştır: migration başında hepsi kaldırılır, sonunda bu listeden yeniden oluşturulur.
+MANAGED_TRIGGERS = (
+    ("trg_transactions_fts_insert", "transactions_fts", f"""
+        AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts (rowid, description) VALUES (new.id, {_turkish_fold_sql("new.description")});
+        END"""),
+    ("trg_transactions_fts_update", "transactions_fts", f"""
+        AFTER UPDATE OF description ON transactions BEGIN
+            DELETE FROM transactions_fts WHERE rowid = old.id;
+            INSERT INTO transactions_fts (rowid, description) VALUES (new.id, {_turkish_fold_sql("new.description")});
+        END"""),
+    ("trg_transactions_fts_delete", "transactions_fts", """
+        AFTER DELETE ON transactions BEGIN
+            DELETE FROM transactions_fts WHERE rowid = old.id;
+        END"""),
+    ("trg_transactions_balance_insert", "user_balances", f"""
+        AFTER INSERT ON transactions BEGIN
+            INSERT INTO user_balances (user_id, balance, transaction_count)
+            VALUES (new.user_id, {_signed_amount_sql("new")}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET balance = balance + excluded.balance,
+                                                transaction_count = transaction_count + 1;
+        END"""),
+    ("trg_transactions_balance_update", "user_balances", f"""
+        AFTER UPDATE OF type, amount, user_id ON transactions BEGIN
+            UPDATE user_balances SET balance = balance - ({_signed_amount_sql("old")}),
+                                     transaction_count = transaction_count - 1
+            WHERE user_id = old.user_id;
+            INSERT INTO user_balances (user_id, balance, transaction_count)
+            VALUES (new.user_id, {_signed_amount_sql("new")}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET balance = balance + excluded.balance,
+                                                transaction_count = transaction_count + 1;
+        END"""),
+    ("trg_transactions_balance_delete", "user_balances", f"""
+        AFTER DELETE ON transactions BEGIN
+            UPDATE user_balances SET balance = balance - ({_signed_amount_sql("old")}),
+                                     transaction_count = transaction_count - 1
+            WHERE user_id = old.user_id;
+        END"""),
+    ("trg_transactions_rollup_insert", "transaction_rollups", f"""
+        AFTER INSERT ON transactions BEGIN{_rollup_add_sql("new")}
+        END"""),
+    ("trg_transactions_rollup_update", "transaction_rollups", f"""
+        AFTER UPDATE OF type, amount, category_id, date, user_id ON transactions BEGIN{_rollup_remove_sql("old")}{_rollup_add_sql("new")}
+        END"""),
+    ("trg_transactions_rollup_delete", "transaction_rollups", f"""
+        AFTER DELETE ON transactions BEGIN{_rollup_remove_sql("old")}
+        END"""),
+    # products.stock, stock_movements defterinin önbelleğidir ve yalnızca yeni hareketlerle değişir.
+    # Defter yalnızca eklemeye açıktır; hareketler ancak ürün silindiğinde ürünle birlikte silinir.
+    ("trg_stock_movements_apply", "stock_movements", """
+        AFTER INSERT ON stock_movements BEGIN
+            UPDATE products SET stock = stock + new.quantity WHERE id = new.product_id;
+        END"""),
+    ("trg_stock_movements_no_update", "stock_movements", """
+        BEFORE UPDATE ON stock_movements BEGIN
+            SELECT RAISE(ABORT, 'stock_movements yalnızca eklemeye açıktır');
+        END"""),
+    ("trg_stock_movements_no_delete", "stock_movements", """
+        BEFORE DELETE ON stock_movements WHEN EXISTS (SELECT 1 FROM products WHERE id = old.product_id) BEGIN
+            SELECT RAISE(ABORT, 'stock_movements yalnızca eklemeye açıktır');
+        END"""),
+    ("trg_products_stock_movements_delete", "stock_movements", """
+        AFTER DELETE ON products BEGIN
+            DELETE FROM stock_movements WHERE product_id = old.id;
+        END"""),
+)
+
+# Kullanıcıya ait verinin tutulduğu tablolar. Bu tablolardaki her satır değişikliği kullanıcının veri sürümünü
+# (user_data_versions) artırır; rapor önbelleği sonuçları bu sürümle eşleştirir. invoice_items ve stock_movements
+# değişiklikleri her zaman invoices_offers veya products satırlarını da değiştirdiğinden ayrıca izlenmez.
+DATA_VERSION_TABLES = ("transactions", "recurring_transactions", "categories", "customers", "products",
+                       "invoices_offers", "savings_goals")
+MANAGED_TRIGGERS += tuple(
+    (f"trg_{table}_data_version_{event.lower()}", "user_data_versions", f"""
+        AFTER {event} ON {table} BEGIN
+            INSERT INTO user_data_versions (user_id, version) VALUES ({row}.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END""")
+    for table in DATA_VERSION_TABLES
+    for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old"))
+)
+
+# insert_transactions_many bu kadar satıra ulaşınca transactions üzerindeki INSERT tetikleyicilerini askıya alır;
+# yeni satırların arama indeksi, bakiye, aylık özet ve veri sürümü etkisi sonda tek seferde küme olarak uygulanır.
+# Ölçüm (50 bin satır, 5 bin satırlık dosya veritabanı, tüm tetikleyiciler kurulu): satır başına tetikleyicilerle
+# ~11-13 bin satır/sn, askıya alınarak ~30-40 bin, tarih doğrulaması önbelleğe alınınca ~33-50 bin satır/sn.
+BULK_INSERT_TRIGGER_THRESHOLD = 1000
+BULK_SUSPENDED_TRIGGERS = tuple(trigger for trigger in MANAGED_TRIGGERS
+                                if "AFTER INSERT ON transactions " in trigger[2])
+
+# Şema sürümü PRAGMA user_version içinde tutulur. Her adım (sürüm, açıklama, metod adı) olarak eklenir ve
+# yalnızca veritabanı o sürümün gerisindeyse bir kez çalışır. Yeni şema değişiklikleri listenin sonuna eklenmeli,
+# uygulanmış adımlar sonradan değiştirilmemelidir.
+SCHEMA_MIGRATIONS = (
+    (1, "Temel tablolar ve eski sürümlerden kalan eksik sütunlar", "_migrate_v1_base_schema"),
+    (2, "İşlem açıklaması ve kategorisi için FTS5 tam metin arama indeksi", "_migrate_v2_transactions_fts"),
+    (3, "Tetikleyicilerle güncel tutulan kullanıcı bakiye özeti", "_migrate_v3_user_balances"),
+    (4, "Ay, tür ve kategori bazında artımlı işlem özeti", "_migrate_v4_transaction_rollups"),
+    (5, "Para tutarlarının REAL yerine INTEGER kuruş olarak saklanması", "_migrate_v5_integer_kurus"),
+    (6, "Fatura/teklif kalemlerinin items_json yerine invoice_items tablosunda tutulması", "_migrate_v6_invoice_items"),
+    (7, "Kullanıcı, belge türü ve yıl bazında atomik belge numarası sayaçları", "_migrate_v7_document_sequences"),
+    (8, "Yalnızca eklemeye açık stok hareketleri defteri", "_migrate_v8_stock_movements"),
+    (9, "Fatura/teklif müşterisinin customer_name yerine customer_id ile tutulması", "_migrate_v9_invoice_customer_id"),
+    (10, "İşlem kategorilerinin ad yerine categories.id ile tutulması; kategori birleştirme", "_migrate_v10_category_ids"),
+    (11, "Rapor önbelleği için kullanıcı bazında veri sürümü", "_migrate_v11_user_data_versions"),
+    (12, "Otomatik kategori belirleme için kullanıcı tanımlı anahtar kelime/düzenli ifade kuralları",
+     "_migrate_v12_category_rules"),
+)
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+@lru_cache(maxsize=4096)
+def _parse_iso_date(text):
+    """
+    'YYYY-MM-DD' metnini datetime'a çevirir (geçersizse ValueError). Toplu eklemelerde aynı tarihler binlerce kez
+    tekrarlandığından sonuç önbelleğe alınır; strptime aksi halde satır başına maliyetin en büyük kalemidir.
+    """
+    return datetime.strptime(text, '%Y-%m-%d')
+
+
+def tl_to_kurus(amount):
+    """
+    TL tutarını (float, str veya Decimal) en yakın kuruşa yuvarlanmış tamsayıya çevirir.
+    Yuvarlama ondalık gösterim üzerinden yapılır: 0.285 TL, ikili kayan nokta hatasına düşmeden 29 kuruş olur.
+    """
+    if amount is None:
+        return None
+    try:
+        return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Geçersiz tutar: {amount!r}")
+
+
+def kurus_to_tl(amount):
+    """Kuruş cinsinden tamsayı tutarı TL'ye çevirir."""
+    if amount is None:
+        return None
+    return amount / 100
+
+
+def calculate_invoice_totals(items):
+    """
+    Fatura/teklif kalemlerinden (KDV hariç toplam, toplam KDV) değerlerini TL olarak hesaplar.
+    Toplama kuruş cinsinden yapılır; sonuç, kalemlerin ekranda görünen tutarlarının birebir toplamıdır.
+    """
+    total_with_kdv = sum(tl_to_kurus(item["ara_toplam"]) for item in items)
+    total_kdv = sum(tl_to_kurus(item["kdv_miktari"]) for item in items)
+    return kurus_to_tl(total_with_kdv - total_kdv), kurus_to_tl(total_kdv)
+
+
+# Belge türü -> numara öneki. Numaralar ÖNEK-YIL-SIRA biçimindedir (örn: FTR-2025-00042).
+DOCUMENT_NUMBER_PREFIXES = {"Fatura": "FTR", "Teklif": "TKLF"}
+DOCUMENT_NUMBER_PATTERN = re.compile(r"^(?P<prefix>[A-Z]+)-(?P<year>\d{4})-(?P<number>\d+)$")
+
+
+def format_document_number(doc_type, year, number):
+    """Belge türü, yıl ve sıra numarasından belge numarasını oluşturur."""
+    return f"{DOCUMENT_NUMBER_PREFIXES[doc_type]}-{year}-{number:05d}"
+
+
+STOCK_VALUATION_METHODS = ("fifo", "average")
+
+
+def value_stock_movements(movements, method="fifo"):
+    """
+    Bir ürünün tarih sırasındaki stok hareketlerinden eldeki miktarı ve maliyet değerini hesaplar.
+    'fifo' yöntemi çıkışları en eski girişlerden düşer; 'average' hareketli ağırlıklı ortalama maliyet kullanır.
+    Stok eksiye düşerse eksik miktar değere katılmaz ve sonraki girişlerle önce bu eksik kapatılır.
+    Args:
+        movements (iterable): (miktar, birim maliyet kuruş) çiftleri; girişler pozitif, çıkışlar negatif miktarlıdır.
+        method (str): 'fifo' veya 'average'.
+    Returns:
+        tuple: (eldeki miktar, maliyet değeri kuruş).
+    """
+    if method not in STOCK_VALUATION_METHODS:
+        raise ValueError(f"Geçersiz değerleme yöntemi: {method!r}")
+
+    layers = deque()  # FIFO: [miktar, birim maliyet] giriş katmanları
+    quantity, average_cost, shortage = 0.0, 0.0, 0.0
+    for movement_quantity, unit_cost in movements:
+        if movement_quantity > 0:
+            covered = min(movement_quantity, shortage)
+            shortage -= covered
+            movement_quantity -= covered
+            if movement_quantity <= 0:
+                continue
+            unit_cost = unit_cost or 0
+            if method == "fifo":
+                layers.append([movement_quantity, unit_cost])
+            else:
+                average_cost = (quantity * average_cost + movement_quantity * unit_cost) / (quantity + movement_quantity)
+            quantity += movement_quantity
+        else:
+            remaining = -movement_quantity
+            if method == "fifo":
+                while remaining > 0 and layers:
+                    taken = min(layers[0][0], remaining)
+                    layers[0][0] -= taken
+                    remaining -= taken
+                    if layers[0][0] <= 0:
+                        layers.popleft()
+            else:
+                remaining -= min(remaining, quantity)
+            quantity = max(quantity + movement_quantity, 0.0)
+            shortage += remaining
+
+    if method == "fifo":
+        value = sum(layer_quantity * layer_cost for layer_quantity, layer_cost in layers)
+    else:
+        value = quantity * average_cost
+    return quantity - shortage, round(value)
+
+
+def _apply_pragmas(conn, pragmas):
+    """Verilen PRAGMA ayarlarını bağlantıya uygular."""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def _is_memory_database(db_name):
+    """Bellek içi veritabanları dosya tabanlı okuyucu havuzunu paylaşamaz."""
+    return db_name == ":memory:" or db_name.startswith("file::memory:")
+
+
+class ReaderPool:
+    """
+    Raporlar ve grafikler için salt okunur SQLite bağlantı havuzu.
+    Her bağlantının kendi imleci olduğundan, okumalar UI iş parçacığındaki yazmalarla eşzamanlı çalışabilir.
+    """
+
+    def __init__(self, db_name, size=READER_POOL_SIZE):
+        self._uri = Path(db_name).resolve().as_uri() + "?mode=ro"
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.tracer = None  # Atanırsa yeni açılan bağlantılar da izlenir (bkz. QueryTracer)
+
+    def _open(self):
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        reader_pragmas = {name: value for name, value in STORAGE_PROFILE.items()
+                          if name not in ("journal_mode", "synchronous")}
+        _apply_pragmas(conn, reader_pragmas)
+        conn.execute("PRAGMA query_only = ON")
+        if self.tracer is not None:
+            self.tracer.attach(conn)
+        return conn
+
+    def connections(self):
+        """Havuzda açılmış bağlantıların listesini döner."""
+        with self._lock:
+            return list(self._connections)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self._size:
+                conn = self._open()
+                self._connections.append(conn)
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Havuzdan bir okuma bağlantısı ödünç verir, iş bitince havuza geri koyar."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Havuzdaki tüm bağlantıları kapatır."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._idle = queue.LifoQueue()
+
+
+class WriteQueue:
+    """
+    Yüksek frekanslı küçük yazmalar için grup commit (write-behind) kuyruğu.
+    Kısa bir pencere içinde gelen yazmalar kendi bağlantısı olan bir arka plan iş parçacığında tek bir işlemde
+    uygulanır ve tek commit ile kalıcı hale getirilir. Her yazma için dönen Future, yazma commit edildikten sonra
+    tamamlanır; hatalı bir yazma yalnızca kendi Future'ını başarısız yapar, aynı gruptaki diğerlerini etkilemez.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_name, max_delay=WRITE_QUEUE_MAX_DELAY, max_batch=WRITE_QUEUE_MAX_BATCH):
+        self._conn = sqlite3.connect(db_name, check_same_thread=False)
+        _apply_pragmas(self._conn, STORAGE_PROFILE)
+        self._max_delay = max_delay
+        self._max_batch = max_batch
+        self._pending = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="fingo-write-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, params=(), before=()):
+        """
+        Yazmayı kuyruğa ekler. Dönen Future commit sonrası eklenen satırın ID'si (lastrowid) ile tamamlanır.
+        before: Aynı kayıt noktasında sorgudan önce çalıştırılacak (sql, params) çiftleri (örn: eksik kategoriyi açmak).
+        """
+        if self._closed:
+            raise RuntimeError("Yazma kuyruğu kapatılmış.")
+        future = Future()
+        self._pending.put((query, (params, before), future))
+        return future
+
+    def flush(self, timeout=None):
+        """Şu ana kadar kuyruğa eklenen tüm yazmalar commit edilene kadar bekler."""
+        barrier = Future()
+        self._pending.put((None, ((), ()), barrier))
+        barrier.result(timeout)
+
+    def close(self):
+        """Bekleyen yazmaları commit eder, iş parçacığını durdurur ve bağlantıyı kapatır."""
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(self._STOP)
+        self._thread.join()
+        self._conn.close()
+
+    def _run(self):
+        while True:
+            first = self._pending.get()
+            if first is self._STOP:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self._max_delay
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._apply(batch)
+            if stop:
+                return
+
+    def _apply(self, batch):
+        """Bir grup yazmayı tek işlemde uygular; her yazma kendi SAVEPOINT'i içinde çalışır."""
+        results = []
+        try:
+            self._conn.execute("BEGIN")
+            for query, (params, before), future in batch:
+                if query is None:  # flush() bariyeri
+                    results.append((future, None, None))
+                    continue
+                self._conn.execute("SAVEPOINT write_queue_item")
+                try:
+                    for before_query, before_params in before:
+                        self._conn.execute(before_query, before_params)
+                    results.append((future, self._conn.execute(query, params).lastrowid, None))
+                except sqlite3.Error as e:
+                    self._conn.execute("ROLLBACK TO write_queue_item")
+                    results.append((future, None, e))
+                self._conn.execute("RELEASE write_queue_item")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            print(f"Yazma kuyruğu commit hatası: {e}")
+            results = [(future, None, None if query is None else e) for query, _, future in batch]
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+class DimensionCache:
+    """
+    Kategori, müşteri ve ürün gibi küçük ve sık okunan tablolar için süreç içi önbellek.
+    Kayıtlar (tablo, user_id) grubunda tutulur; tabloya yazan DatabaseManager metodları ilgili grubu
+    geçersiz kılar. Yükleme sürerken bir geçersiz kılma olursa (örn: yazma kuyruğu iş parçacığından)
+    yüklenen sonuç önbelleğe yazılmaz, böylece eski veri önbellekte kalmaz.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._groups = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, table, user_id, key, loader):
+        """Kayıt önbellekteyse onu, değilse loader() sonucunu önbelleğe yazarak döner. Listeler kopyalanarak verilir."""
+        with self._lock:
+            entries = self._groups.get((table, user_id))
+            if entries is not None and key in entries:
+                self.hits += 1
+                return _copy_cached(entries[key])
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if self._generation == generation:
+                self._groups.setdefault((table, user_id), {})[key] = value
+        return _copy_cached(value)
+
+    def invalidate(self, table, user_id):
+        """Tablonun kullanıcıya ait tüm kayıtlarını önbellekten çıkarır."""
+        with self._lock:
+            self._generation += 1
+            self._groups.pop((table, user_id), None)
+
+    def clear(self):
+        """Tüm önbelleği boşaltır (örn: geri alınan bir işlemden sonra)."""
+        with self._lock:
+            self._generation += 1
+            self._groups.clear()
+
+    def stats(self):
+        """İsabet, ıska ve önbellekteki kayıt sayısını döner."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": sum(len(entries) for entries in self._groups.values())}
+
+
+def _copy_cached(value):
+    """Önbellekten dönen listeler kopyalanır; çağıranın listeyi değiştirmesi önbelleği bozmaz."""
+    return list(value) if isinstance(value, list) else value
+
+
+def _estimate_size(value):
+    """Önbellekteki bir sonucun yaklaşık bellek boyutunu (bayt) hesaplar."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_estimate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(_estimate_size(key) + _estimate_size(item) for key, item in value.items())
+    return size
+
+
+class ReportCache:
+    """
+    Rapor ve grafik sonuçları için LRU önbellek. Sonuçlar (kullanıcı, rapor, parametreler) anahtarıyla ve
+    hesaplandıkları veri sürümüyle tutulur; kullanıcının veri sürümü değiştiyse sonuç yeniden hesaplanır.
+    Kayıt sayısı veya toplam boyut sınırı aşılınca en uzun süredir kullanılmayan sonuçlar atılır.
+    """
+
+    def __init__(self, max_entries=REPORT_CACHE_MAX_ENTRIES, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, version, compute):
+        """Anahtar için bu veri sürümünde hesaplanmış sonuç varsa onu, yoksa compute() sonucunu döner ve saklar."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy_cached(entry[1])
+            self.misses += 1
+        value = compute()
+        self._store(key, version, value)
+        return _copy_cached(value)
+
+    def _store(self, key, version, value):
+        size = _estimate_size(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > version:
+                return  # Aynı anda daha yeni bir sürüm için hesaplanmış sonuç ezilmez
+            if entry is not None:
+                self._bytes -= self._entries.pop(key)[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        """Tüm sonuçları atar."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """İsabet, ıska, kayıt sayısı ve yaklaşık boyutu döner."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+
+_SQL_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+
+
+def _sql_shape(sql):
+    """
+    İzlenen SQL'deki değişmez değerleri (sqlite3 izleme geri çağrısına parametreler yerleştirilmiş olarak gelir)
+    '?' ile değiştirir. Kullanıcı verisi rapora girmez ve aynı sorgunun farklı parametreli çağrıları birleşir.
+    Returns:
+        tuple: (sadeleştirilmiş SQL, değiştirilen değer sayısı)
+    """
+    shape, literal_count = _SQL_LITERAL_PATTERN.subn("?", sql)
+    return " ".join(shape.split()), literal_count
+
+
+def _percentile(sorted_samples, percent):
+    """Sıralı örneklerde en yakın sıra yöntemiyle yüzdelik değeri döner."""
+    index = max(0, math.ceil(percent / 100 * len(sorted_samples)) - 1)
+    return sorted_samples[index]
+
+
+class _MethodTrace:
+    """Bir metodun izleme sırasında biriken çağrı istatistikleri."""
+
+    def __init__(self):
+        self.calls = 0
+        self.durations = deque(maxlen=TRACE_SAMPLE_LIMIT)
+        self.rows = 0
+        self.row_calls = 0
+        self.statements = 0
+        self.vm_steps = 0
+        self.sql_shapes = {}  # sadeleştirilmiş SQL -> (çalışma sayısı, değer sayısı)
+
+
+class QueryTracer:
+    """
+    DatabaseManager metodları için isteğe bağlı sorgu izleyici. Metod çağrıları sarmalanarak süre ve dönen satır
+    sayısı ölçülür; bağlantılara kurulan sqlite3 izleme (trace) geri çağrısı çalışan her SQL'i, ilerleme (progress)
+    geri çağrısı ise SQLite'ın yaptığı işi o an çalışan metoda yazar. İç içe çağrılarda SQL ve iş, arayüzün çağırdığı
+    en dıştaki metoda yazılır; süre her metod için ayrı ölçülür. Çalışan metod iş parçacığı başına tutulur; okuyucu
+    havuzu bağlantıları çağıranın iş parçacığında kullanılır.
+    """
+
+    OUTSIDE_METHOD = "(metod dışı)"
+
+    def __init__(self):
+        self._local = threading.local()
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        """Bağlantıya izleme ve ilerleme geri çağrılarını kurar."""
+        conn.set_trace_callback(self.on_statement)
+        conn.set_progress_handler(self._on_progress, TRACE_PROGRESS_INTERVAL)
+
+    @staticmethod
+    def detach(conn):
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, 0)
+
+    def _trace(self, method_name):
+        trace = self._traces.get(method_name)
+        if trace is None:
+            trace = self._traces.setdefault(method_name, _MethodTrace())
+        return trace
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def wrap(self, method_name, method):
+        """Metodu süre, satır sayısı ve SQL kaydı tutan bir sarmalayıcıyla döner."""
+        def traced(*args, **kwargs):
+            stack = self._stack()
+            stack.append(method_name)
+            self._local.last_sql = None
+            start = time.perf_counter()
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                with self._lock:
+                    trace = self._trace(method_name)
+                    trace.calls += 1
+                    trace.durations.append(elapsed)
+                    if isinstance(result, (list, tuple)) or result is None:
+                        trace.rows += len(result) if isinstance(result, list) else int(result is not None)
+                        trace.row_calls += 1
+        traced.__wrapped__ = method
+        return traced
+
+    def on_statement(self, sql):
+        """sqlite3 izleme geri çağrısı: çalışan SQL'in biçimini o an çalışan metoda yazar."""
+        # Tetikleyici programları başlarken ("--" yorumlu ya da üst sorgunun metniyle) yeniden bildirilir;
+        # maliyetleri üst sorgunun süresine ve VM adımlarına dahil olduğundan ayrı sayılmaz.
+        if sql.startswith("--") or sql == getattr(self._local, "last_sql", None):
+            return
+        self._local.last_sql = sql
+        stack = self._stack()
+        method_name = stack[0] if stack else self.OUTSIDE_METHOD
+        shape, literal_count = _sql_shape(sql)
+        with self._lock:
+            trace = self._trace(method_name)
+            trace.statements += 1
+            count, _ = trace.sql_shapes.get(shape, (0, literal_count))
+            trace.sql_shapes[shape] = (count + 1, literal_count)
+
+    def _on_progress(self):
+        stack = self._stack()
+        method_name = stack[0] if stack else self.OUTSIDE_METHOD
+        with self._lock:
+            self._trace(method_name).vm_steps += TRACE_PROGRESS_INTERVAL
+        return 0  # Sıfır dışı bir değer sorguyu keser
+
+    def report(self):
+        """
+        Metod bazında gecikme özetini döner; en yavaş p95 başta.
+        Returns:
+            list: (metod, çağrı, p50 ms, p95 ms, p99 ms, en yüksek ms, ortalama satır, çağrı başına SQL,
+                   çağrı başına yaklaşık VM adımı, en sık SQL biçimi, biçimdeki değer sayısı) satırları.
+        """
+        rows = []
+        with self._lock:
+            for method_name, trace in self._traces.items():
+                samples = sorted(duration * 1000 for duration in trace.durations)
+                calls = trace.calls or 1
+                # Eşit sayıda çalışanlardan daha uzun olan (BEGIN/COMMIT yerine asıl sorgu) seçilir
+                top_shape, (_, literal_count) = max(trace.sql_shapes.items(),
+                                                    key=lambda item: (item[1][0], len(item[0])),
+                                                    default=(None, (0, 0)))
+                rows.append((
+                    method_name, trace.calls,
+                    _percentile(samples, 50) if samples else None,
+                    _percentile(samples, 95) if samples else None,
+                    _percentile(samples, 99) if samples else None,
+                    samples[-1] if samples else None,
+                    trace.rows / trace.row_calls if trace.row_calls else None,
+                    trace.statements / calls, trace.vm_steps / calls, top_shape, literal_count,
+                ))
+        return sorted(rows, key=lambda row: row[3] if row[3] is not None else -1, reverse=True)
+
+    def format_report(self, limit=None):
+        """report() çıktısını okunabilir metin olarak döner."""
+        def ms(value):
+            return f"{value:9.2f}" if value is not None else f"{'-':>9}"
+
+        lines = [f"{'Metod':<44} {'Çağrı':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'En yük.':>9} "
+                 f"{'Ort.satır':>9} {'SQL/çağrı':>9}"]
+        for (method_name, calls, p50, p95, p99, worst, avg_rows, statements, vm_steps, top_shape,
+             literal_count) in self.report()[:limit]:
+            lines.append(f"{method_name:<44} {calls:>6} {ms(p50)} {ms(p95)} {ms(p99)} {ms(worst)} "
+                         f"{ms(avg_rows)} {statements:>9.1f}")
+            if top_shape:
+                lines.append(f"    ~{vm_steps:.0f} VM adımı/çağrı; en sık SQL ({literal_count} değer): {top_shape[:160]}")
+        return "\n".join(lines)
+
+    def reset(self):
+        """Biriken istatistikleri sıfırlar."""
+        with self._lock:
+            self._traces = {}
+
+
+class UnitOfWork:
+    """
+    DatabaseManager.unit_of_work() bloğunun durumu. Blok içindeki bir metod veritabanı hatası alırsa veya
+    çağıran mark_failed() ile işareti verirse blok sonunda tüm değişiklikler geri alınır.
+    """
+
+    def __init__(self):
+        self.failed = False
+        self.committed = False
+
+    def mark_failed(self):
+        """Blok sonunda commit yerine rollback yapılmasını sağlar."""
+        self.failed = True
+
 
 class DatabaseManager:
     def __init__(self, db_name="veriler.db"):
         self.db_name = db_name
         self.conn = None
         self.cursor = None
+        self.reader_pool = None
+        self.write_queue = None
+        self.dimension_cache = DimensionCache()
+        self.report_cache = ReportCache()
+        self.tracer = None
+        self._unit_of_work = None
         self.connect()
-        self.create_tables()
+        self.migrate_schema()
+        self.fts_enabled = self._table_exists("transactions_fts")
+        if os.environ.get(TRACE_ENV_VAR) == "1":
+            self.enable_tracing()
 
     def connect(self):
-        """Veritabanına bağlanır."""
+        """Veritabanına bağlanır, depolama profilini uygular ve okuyucu havuzunu hazırlar."""
         try:
             self.conn = sqlite3.connect(self.db_name)
+            _apply_pragmas(self.conn, STORAGE_PROFILE)
+            self.conn.create_function("tl_to_kurus", 1, tl_to_kurus, deterministic=True)
             self.cursor = self.conn.cursor()
+            if not _is_memory_database(self.db_name):
+                self.reader_pool = ReaderPool(self.db_name)
             print(f"Veritabanı bağlantısı '{self.db_name}' başarıyla kuruldu.")
         except sqlite3.Error as e:
             print(f"Veritabanı bağlantı hatası: {e}")
 
     def close(self):
-        """Veritabanı bağlantısını kapatır."""
+        """
+        Yazma kuyruğundaki bekleyen yazmaları commit eder, okuyucu havuzunu ve veritabanı bağlantısını kapatır.
+        İzleme açıksa kapanmadan önce gecikme raporunu yazdırır.
+        """
+        if self.tracer is not None:
+            self.print_trace_report()
+            self.disable_tracing()
+        if self.write_queue:
+            self.write_queue.close()
+            self.write_queue = None
+        if self.reader_pool:
+            self.reader_pool.close()
         if self.conn:
+            try:
+                self.conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                print(f"PRAGMA optimize hatası: {e}")
             self.conn.close()
             print("Veritabanı bağlantısı kapatıldı.")
 
-    def create_tables(self):
-        """Gerekli tabloları oluşturur veya kontrol eder."""
+    # Sarmalanmayan metodlar: bağlam yöneticileri, önbellek altyapısı ve izlemenin kendisi
+    _UNTRACED_METHODS = frozenset({"close", "connect", "read_connection", "unit_of_work", "cached_report",
+                                   "get_cache_stats", "enable_tracing", "disable_tracing", "get_trace_report",
+                                   "print_trace_report"})
+
+    def _traceable_connections(self):
+        return [self.conn] + (self.reader_pool.connections() if self.reader_pool else [])
+
+    def enable_tracing(self):
+        """
+        Sorgu izlemeyi açar: public DatabaseManager metodlarının her çağrısının süresi, dönen satır sayısı ve
+        çalıştırdığı SQL'ler kaydedilir. Yalnızca açıkken ek maliyet getirir; FINGO_DB_TRACE=1 ile başlangıçta açılır.
+        """
+        if self.tracer is not None:
+            return
+        self.tracer = QueryTracer()
+        for name in dir(type(self)):
+            if name.startswith("_") or name in self._UNTRACED_METHODS:
+                continue
+            method = getattr(self, name)
+            if callable(method):
+                setattr(self, name, self.tracer.wrap(name, method))
+        for conn in self._traceable_connections():
+            self.tracer.attach(conn)
+        if self.reader_pool:
+            self.reader_pool.tracer = self.tracer
+        print("Sorgu izleme açıldı.")
+
+    def disable_tracing(self):
+        """Sorgu izlemeyi kapatır ve metodları özgün hallerine döndürür; toplanan rapor silinir."""
+        if self.tracer is None:
+            return
+        for name in list(vars(self)):
+            if getattr(getattr(self, name), "__wrapped__", None) is not None and not name.startswith("_"):
+                delattr(self, name)
+        for conn in self._traceable_connections():
+            QueryTracer.detach(conn)
+        if self.reader_pool:
+            self.reader_pool.tracer = None
+        self.tracer = None
+
+    def get_trace_report(self):
+        """İzleme açıksa metod bazında gecikme özetini (bkz. QueryTracer.report), değilse boş liste döner."""
+        return self.tracer.report() if self.tracer is not None else []
+
+    def print_trace_report(self, limit=None):
+        """Metod bazında p50/p95/p99 gecikme raporunu yazdırır."""
+        if self.tracer is None:
+            print("Sorgu izleme kapalı; açmak için enable_tracing() veya FINGO_DB_TRACE=1 kullanın.")
+            return
+        print("Sorgu izleme raporu (p95'e göre en yavaş metodlar başta):")
+        print(self.tracer.format_report(limit))
+
+    @contextmanager
+    def read_connection(self):
+        """
+        Rapor ve grafik sorguları için ayrı bir okuma bağlantısı verir.
+        Bellek içi veritabanlarında havuz olmadığından ana bağlantı kullanılır.
+        """
+        if self.reader_pool is None:
+            yield self.conn
+        else:
+            with self.reader_pool.connection() as conn:
+                yield conn
+
+    def _fetch_all_read(self, query, params=()):
+        """Sorguyu okuyucu havuzundan alınan bağlantıda çalıştırıp tüm satırları döner."""
+        with self.read_connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def _fetch_one_read(self, query, params=()):
+        """Sorguyu okuyucu havuzundan alınan bağlantıda çalıştırıp ilk satırı döner."""
+        with self.read_connection() as conn:
+            return conn.execute(query, params).fetchone()
+
+    def enable_write_queue(self, max_delay=WRITE_QUEUE_MAX_DELAY, max_batch=WRITE_QUEUE_MAX_BATCH):
+        """
+        *_async yazma metodları için grup commit kuyruğunu açar. Kuyruk kapalıyken bu metodlar yazmayı hemen
+        yapar ve tamamlanmış bir Future döner. Bellek içi veritabanlarında ayrı bağlantı açılamadığından kullanılamaz.
+        Returns:
+            bool: Kuyruk açıldıysa True.
+        """
+        if self.write_queue is not None:
+            return True
+        if _is_memory_database(self.db_name):
+            print("UYARI: Bellek içi veritabanında yazma kuyruğu kullanılamaz; yazmalar hemen yapılacak.")
+            return False
+        self.write_queue = WriteQueue(self.db_name, max_delay, max_batch)
+        return True
+
+    def flush_writes(self, timeout=None):
+        """Yazma kuyruğundaki tüm yazmalar commit edilene kadar bekler."""
+        if self.write_queue is not None:
+            self.write_queue.flush(timeout)
+
+    def _submit_write(self, query, params, callback=None, before=(), invalidates=()):
+        """
+        Yazmayı kuyruk açıksa kuyruğa, değilse doğrudan ana bağlantıya gönderir.
+        callback verilirse Future tamamlandığında çağrılır (kuyrukta yazma iş parçacığından çağrılır;
+        Tkinter arayüzüne dokunacaksa root.after ile ana iş parçacığına aktarılmalıdır).
+        invalidates içindeki (tablo, user_id) önbellek grupları, yazma tamamlanınca callback'ten önce geçersiz kılınır.
+        """
+        if self.write_queue is not None:
+            future = self.write_queue.submit(query, params, before)
+        else:
+            future = Future()
+            try:
+                for before_query, before_params in before:
+                    self.cursor.execute(before_query, before_params)
+                self.cursor.execute(query, params)
+                self._commit()
+                future.set_result(self.cursor.lastrowid)
+            except sqlite3.Error as e:
+                self._rollback()
+                future.set_exception(e)
+        for table, user_id in invalidates:
+            future.add_done_callback(lambda _, table=table, user_id=user_id: self._invalidate_cache(table, user_id))
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Blok içindeki tüm DatabaseManager yazma çağrılarını tek bir işlemde (transaction) toplar ve blok sonunda
+        tek bir commit yapar. Çağrılardan biri veritabanı hatası alırsa, blokta istisna oluşursa veya
+        mark_failed() çağrılırsa hiçbir değişiklik kalıcı olmaz. İç içe kullanılırsa en dıştaki blok belirleyicidir.
+
+            with db.unit_of_work() as uow:
+                db.update_transactions_category_to_null(category_id, user_id)
+                db.delete_category(category_id, user_id)
+            if uow.committed: ...
+        """
+        if self._unit_of_work is not None:
+            yield self._unit_of_work
+            return
+
+        uow = UnitOfWork()
+        self._unit_of_work = uow
         try:
-            # Kullanıcılar tablosu
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    last_invoice_num INTEGER DEFAULT 0,
-                    last_offer_num INTEGER DEFAULT 0
-                )
-            """)
-            # İşlemler tablosu (gelir/gider)
+            yield uow
+        except Exception:
+            uow.failed = True
+            raise
+        finally:
+            self._unit_of_work = None
+            if uow.failed:
+                self.conn.rollback()
+                self._clear_caches()
+                print("İşlem birimi geri alındı, değişiklikler kaydedilmedi.")
+            else:
+                try:
+                    self.conn.commit()
+                    uow.committed = True
+                except sqlite3.Error as e:
+                    self.conn.rollback()
+                    self._clear_caches()
+                    print(f"İşlem birimi commit hatası: {e}")
+
+    def _commit(self):
+        """Yazma metodlarının commit noktası; bir unit_of_work bloğu içindeyse commit blok sonuna bırakılır."""
+        if self._unit_of_work is None:
+            self.conn.commit()
+
+    def _rollback(self):
+        """Yazma metodlarının hata noktası; unit_of_work içindeyse tüm blok geri alınmak üzere işaretlenir."""
+        if self._unit_of_work is None:
+            self.conn.rollback()
+            self._clear_caches()
+        else:
+            self._unit_of_work.failed = True
+
+    def _clear_caches(self):
+        """
+        Geri alınan bir işlemden sonra önbellekleri boşaltır. Bellek içi veritabanında raporlar ana bağlantıdan
+        okunduğundan, geri alınan (commit edilmemiş) verilerle hesaplanmış sonuçlar da böylece atılır.
+        """
+        self.dimension_cache.clear()
+        self.report_cache.clear()
+
+    def _invalidate_cache(self, table, user_id):
+        """Tabloya yazan metodların önbellek geçersiz kılma noktası (bkz. DimensionCache)."""
+        self.dimension_cache.invalidate(table, user_id)
+
+    def get_cache_stats(self):
+        """Kategori/müşteri/ürün önbelleğinin ve rapor önbelleğinin isabet/ıska sayılarını döner."""
+        return {"dimensions": self.dimension_cache.stats(), "reports": self.report_cache.stats()}
+
+    def get_data_version(self, user_id):
+        """
+        Kullanıcının veri sürümünü döner. Sürüm, kullanıcıya ait tablolardaki her değişiklikte tetikleyicilerle
+        artırılır (bkz. DATA_VERSION_TABLES) ve hiç azalmaz. Okuyucu bağlantısından okunur; böylece yalnızca
+        commit edilmiş değişiklikler görülür ve raporlar aynı bağlantı türünden okunan veriyle eşleşir.
+        """
+        row = self._fetch_one_read("SELECT version FROM user_data_versions WHERE user_id = ?", (user_id,))
+        return row[0] if row else 0
+
+    def cached_report(self, user_id, report_name, params, compute):
+        """
+        compute() sonucunu (kullanıcı, rapor adı, parametreler, veri sürümü) için önbellekten verir; kullanıcının
+        verisi son hesaplamadan beri değişmediyse rapor yeniden hesaplanmaz. params hash'lenebilir olmalı ve
+        sonucu etkileyen her şeyi (tarih aralığı, içinde bulunulan ay vb.) içermelidir.
+        """
+        version = self.get_data_version(user_id)
+        return self.report_cache.get_or_compute((user_id, report_name, params), version, compute)
+
+    def migrate_schema(self):
+        """
+        Şemayı PRAGMA user_version'a göre günceller. Şema güncelse yalnızca tek bir tamsayı okunur;
+        gerideyse eksik migration adımları sırayla ve tek bir işlem (transaction) içinde uygulanır.
+        """
+        current_version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        if current_version == SCHEMA_VERSION:
+            return
+        if current_version > SCHEMA_VERSION:
+            print(f"UYARI: Veritabanı şeması (v{current_version}) uygulamanın desteklediği sürümden "
+                  f"(v{SCHEMA_VERSION}) daha yeni.")
+            return
+
+        try:
+            self.cursor.execute("BEGIN")
+            self._drop_managed_triggers()
+            for version, description, method_name in SCHEMA_MIGRATIONS:
+                if version > current_version:
+                    getattr(self, method_name)()
+                    print(f"Şema migration v{version} uygulandı: {description}")
+            self._sync_schema_objects()
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.commit()
+            print(f"Veritabanı şeması v{current_version} sürümünden v{SCHEMA_VERSION} sürümüne güncellendi.")
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Şema migration hatası: {e}")
+
+    def _sync_schema_objects(self):
+        """
+        Migration sonunda şema katmanının yönettiği nesneleri güncel tanımlarla eşitler:
+        artık listede olmayan indeksleri kaldırır, eksik olanları oluşturur; tetikleyicileri yeniden kurar
+        ve tetikleyicilerle beslenen türetilmiş verileri (arama indeksi, bakiye ve aylık özetler) baştan oluşturur.
+        """
+        managed_names = {index_name for index_name, _, _ in MANAGED_INDEXES}
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+        for (index_name,) in self.cursor.fetchall():
+            if index_name not in managed_names:
+                self.cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+        self._create_managed_indexes()
+        self._create_managed_triggers()
+        self._rebuild_search_index()
+        self._rebuild_user_balances()
+        self._rebuild_transaction_rollups()
+        self._rebuild_product_stock()
+
+    def _table_exists(self, table_name):
+        """Tablonun (sanal tablolar dahil) veritabanında bulunup bulunmadığını döner."""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+        return self.cursor.fetchone() is not None
+
+    def _drop_managed_triggers(self):
+        """'trg_' önekli tüm tetikleyicileri kaldırır; migration adımları tablolar üzerinde tetikleyicisiz çalışır."""
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg\\_%' ESCAPE '\\'")
+        for (trigger_name,) in self.cursor.fetchall():
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+
+    def _create_managed_triggers(self):
+        """MANAGED_TRIGGERS listesindeki tetikleyicileri, gerektirdikleri tablo mevcutsa oluşturur."""
+        for trigger_name, required_table, body in MANAGED_TRIGGERS:
+            if self._table_exists(required_table):
+                self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}")
+
+    def _rebuild_search_index(self):
+        """transactions_fts içeriğini transactions tablosundan baştan oluşturur."""
+        if not self._table_exists("transactions_fts"):
+            return
+        self.cursor.execute("DELETE FROM transactions_fts")
+        self.cursor.execute(f"""
+            INSERT INTO transactions_fts (rowid, description)
+            SELECT id, {_turkish_fold_sql("description")} FROM transactions
+        """)
+        self.cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+
+    # --- Şema Migration Adımları ---
+    def _migrate_v1_base_schema(self):
+        """Temel tabloları oluşturur; user_version öncesi veritabanlarındaki eksik sütunları tamamlar."""
+        # Kullanıcılar tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                last_invoice_num INTEGER DEFAULT 0,
+                last_offer_num INTEGER DEFAULT 0
+            )
+        """)
+        # İşlemler tablosu (gelir/gider)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Gelir' veya 'Gider'
+                amount REAL NOT NULL,
+                category TEXT,
+                description TEXT,
+                date TEXT NOT NULL, -- YYYY-MM-DD formatında sakla
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        # Tekrarlayan İşlemler Tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recurring_transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                amount REAL NOT NULL,
+                type TEXT NOT NULL,
+                category TEXT,
+                start_date TEXT NOT NULL, -- YYYY-MM-DD
+                frequency TEXT NOT NULL, -- 'Günlük', 'Haftalık', 'Aylık', 'Yıllık'
+                last_generated_date TEXT, -- Son otomatik oluşturulma tarihi
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        # Tasarruf Hedefleri Tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS savings_goals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                goal_name TEXT NOT NULL,
+                target_amount REAL NOT NULL,
+                current_amount REAL DEFAULT 0.0,
+                target_date TEXT, -- YYYY-MM-DD
+                description TEXT,
+                status TEXT DEFAULT 'Devam Ediyor', -- 'Devam Ediyor', 'Tamamlandı', 'İptal Edildi'
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, goal_name) -- Her kullanıcının aynı isimde iki hedefi olamaz
+            )
+        """)
+        # Müşteriler Tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS customers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                address TEXT,
+                phone TEXT,
+                email TEXT,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, name)
+            )
+        """)
+        # Ürünler/Hizmetler Tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                stock REAL DEFAULT 0.0,
+                purchase_price REAL DEFAULT 0.0,
+                selling_price REAL DEFAULT 0.0,
+                kdv_rate REAL DEFAULT 0.0, -- KDV oranı yüzde olarak (örn: 18.0)
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, name)
+            )
+        """)
+        # Fatura/Teklifler Tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invoices_offers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Fatura' veya 'Teklif'
+                document_number TEXT UNIQUE NOT NULL,
+                customer_name TEXT NOT NULL,
+                document_date TEXT NOT NULL, -- YYYY-MM-DD
+                due_validity_date TEXT, -- Vade veya geçerlilik tarihi YYYY-MM-DD
+                items_json TEXT NOT NULL, -- JSON formatında ürün/hizmet kalemleri listesi
+                total_amount_excluding_kdv REAL NOT NULL,
+                total_kdv_amount REAL NOT NULL,
+                total_amount_with_kdv REAL NOT NULL,
+                notes TEXT,
+                status TEXT DEFAULT 'Taslak', -- 'Taslak', 'Gönderildi', 'Ödendi', 'İptal Edildi'
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        # Kategoriler Tablosu
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL, -- 'Gelir', 'Gider' veya 'Genel'
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, name)
+            )
+        """)
+
+        # users tablosuna 'last_invoice_num' ve 'last_offer_num' sütunlarını ekle (eğer yoksa)
+        self._add_column_if_not_exists('users', 'last_invoice_num', 'INTEGER DEFAULT 0')
+        self._add_column_if_not_exists('users', 'last_offer_num', 'INTEGER DEFAULT 0')
+
+        # invoices_offers tablosuna 'total_amount_with_kdv' sütununu ekle (eğer yoksa)
+        self._add_column_if_not_exists('invoices_offers', 'total_amount_with_kdv', 'REAL')
+
+        # recurring_transactions tablosuna 'category' sütununu ekle (eğer yoksa)
+        self._add_column_if_not_exists('recurring_transactions', 'category', 'TEXT')
+
+    def _rebuild_user_balances(self):
+        """user_balances özetini transactions tablosundan baştan hesaplar."""
+        if not self._table_exists("user_balances"):
+            return
+        self.cursor.execute("DELETE FROM user_balances")
+        self.cursor.execute("""
+            INSERT INTO user_balances (user_id, balance, transaction_count)
+            SELECT user_id, SUM(CASE WHEN type = 'Gelir' THEN amount ELSE -amount END), COUNT(*)
+            FROM transactions GROUP BY user_id
+        """)
+
+    def _rebuild_transaction_rollups(self):
+        """transaction_rollups özetini transactions tablosundan baştan hesaplar."""
+        if not self._table_exists("transaction_rollups"):
+            return
+        self.cursor.execute("DELETE FROM transaction_rollups")
+        self.cursor.execute("""
+            INSERT INTO transaction_rollups (user_id, year_month, type, category_id, total, transaction_count,
+                                             min_amount, max_amount)
+            SELECT user_id, substr(date, 1, 7), type, IFNULL(category_id, 0), SUM(amount), COUNT(*),
+                   MIN(amount), MAX(amount)
+            FROM transactions GROUP BY user_id, substr(date, 1, 7), type, IFNULL(category_id, 0)
+        """)
+
+    def _suspend_bulk_insert_triggers(self):
+        """
+        BULK_SUSPENDED_TRIGGERS tetikleyicilerini açık işlem (transaction) içinde kaldırır ve o ana kadarki en büyük
+        işlem ID'sini döner. DDL işlemle birlikte geri alınabildiğinden hata durumunda tetikleyiciler geri gelir;
+        yazma kilidi işlem sonuna kadar tutulduğundan diğer bağlantılar tetikleyicisiz şemayı hiç görmez.
+        """
+        if not self.conn.in_transaction:
+            self.cursor.execute("BEGIN")
+        for trigger_name, _, _ in BULK_SUSPENDED_TRIGGERS:
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+        return self.cursor.execute("SELECT IFNULL(MAX(id), 0) FROM transactions").fetchone()[0]
+
+    def _resume_bulk_insert_triggers(self, after_id):
+        """
+        ID'si after_id'den büyük işlemlerin arama indeksi, bakiye, aylık özet ve veri sürümü etkisini küme olarak
+        uygular (askıya alınan tetikleyicilerin satır satır yapacağı işin aynısı), ardından tetikleyicileri geri kurar.
+        """
+        if self._table_exists("transactions_fts"):
+            self.cursor.execute(f"""
+                INSERT INTO transactions_fts (rowid, description)
+                SELECT id, {_turkish_fold_sql("description")} FROM transactions WHERE id > ?
+            """, (after_id,))
+        if self._table_exists("user_balances"):
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    type TEXT NOT NULL, -- 'Gelir' veya 'Gider'
-                    amount REAL NOT NULL,
-                    category TEXT,
-                    description TEXT,
-                    date TEXT NOT NULL, -- YYYY-MM-DD formatında sakla
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            """)
-            # Tekrarlayan İşlemler Tablosu
+                INSERT INTO user_balances (user_id, balance, transaction_count)
+                SELECT user_id, SUM(CASE WHEN type = 'Gelir' THEN amount ELSE -amount END), COUNT(*)
+                FROM transactions WHERE id > ? GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET balance = balance + excluded.balance,
+                                                    transaction_count = transaction_count + excluded.transaction_count
+            """, (after_id,))
+        if self._table_exists("transaction_rollups"):
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS recurring_transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    description TEXT NOT NULL,
-                    amount REAL NOT NULL,
-                    type TEXT NOT NULL,
-                    category TEXT,
-                    start_date TEXT NOT NULL, -- YYYY-MM-DD
-                    frequency TEXT NOT NULL, -- 'Günlük', 'Haftalık', 'Aylık', 'Yıllık'
-                    last_generated_date TEXT, -- Son otomatik oluşturulma tarihi
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            """)
-            # Tasarruf Hedefleri Tablosu
+                INSERT INTO transaction_rollups (user_id, year_month, type, category_id, total, transaction_count,
+                                                 min_amount, max_amount)
+                SELECT user_id, substr(date, 1, 7), type, IFNULL(category_id, 0), SUM(amount), COUNT(*),
+                       MIN(amount), MAX(amount)
+                FROM transactions WHERE id > ? GROUP BY user_id, substr(date, 1, 7), type, IFNULL(category_id, 0)
+                ON CONFLICT (user_id, year_month, type, category_id) DO UPDATE SET
+                    total = total + excluded.total,
+                    transaction_count = transaction_count + excluded.transaction_count,
+                    min_amount = MIN(min_amount, excluded.min_amount),
+                    max_amount = MAX(max_amount, excluded.max_amount)
+            """, (after_id,))
+        if self._table_exists("user_data_versions"):
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS savings_goals (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    goal_name TEXT NOT NULL,
-                    target_amount REAL NOT NULL,
-                    current_amount REAL DEFAULT 0.0,
-                    target_date TEXT, -- YYYY-MM-DD
-                    description TEXT,
-                    status TEXT DEFAULT 'Devam Ediyor', -- 'Devam Ediyor', 'Tamamlandı', 'İptal Edildi'
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    UNIQUE(user_id, goal_name) -- Her kullanıcının aynı isimde iki hedefi olamaz
-                )
-            """)
-            # Müşteriler Tablosu
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS customers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    address TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    UNIQUE(user_id, name)
-                )
-            """)
-            # Ürünler/Hizmetler Tablosu
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    stock REAL DEFAULT 0.0,
-                    purchase_price REAL DEFAULT 0.0,
-                    selling_price REAL DEFAULT 0.0,
-                    kdv_rate REAL DEFAULT 0.0, -- KDV oranı yüzde olarak (örn: 18.0)
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    UNIQUE(user_id, name)
-                )
-            """)
-            # Fatura/Teklifler Tablosu
+                INSERT INTO user_data_versions (user_id, version)
+                SELECT DISTINCT user_id, 1 FROM transactions WHERE id > ?
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+            """, (after_id,))
+        for trigger_name, required_table, body in BULK_SUSPENDED_TRIGGERS:
+            if self._table_exists(required_table):
+                self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}")
+
+    def _rebuild_product_stock(self):
+        """products.stock önbelleğini stock_movements defterinden baştan hesaplar."""
+        if not self._table_exists("stock_movements"):
+            return
+        self.cursor.execute("""
+            UPDATE products SET stock = IFNULL((SELECT SUM(quantity) FROM stock_movements
+                                                WHERE stock_movements.product_id = products.id), 0)
+        """)
+
+    def _migrate_v2_transactions_fts(self):
+        """
+        İşlem açıklaması ve kategorisi için FTS5 arama indeksini oluşturur. Satır kimliği (rowid) işlem ID'sidir;
+        içerik tetikleyicilerle güncel tutulur. 2 ve 3 harflik önek indeksleri "mar*" gibi önek aramalarını hızlandırır.
+        FTS5 desteği olmayan SQLite derlemelerinde arama LIKE ile çalışmaya devam eder.
+        """
+        try:
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS invoices_offers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    type TEXT NOT NULL, -- 'Fatura' veya 'Teklif'
-                    document_number TEXT UNIQUE NOT NULL,
-                    customer_name TEXT NOT NULL,
-                    document_date TEXT NOT NULL, -- YYYY-MM-DD
-                    due_validity_date TEXT, -- Vade veya geçerlilik tarihi YYYY-MM-DD
-                    items_json TEXT NOT NULL, -- JSON formatında ürün/hizmet kalemleri listesi
-                    total_amount_excluding_kdv REAL NOT NULL,
-                    total_kdv_amount REAL NOT NULL,
-                    total_amount_with_kdv REAL NOT NULL,
-                    notes TEXT,
-                    status TEXT DEFAULT 'Taslak', -- 'Taslak', 'Gönderildi', 'Ödendi', 'İptal Edildi'
-                    FOREIGN KEY (user_id) REFERENCES users(id)
+                CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+                    description,
+                    category,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
                 )
             """)
-            # Kategoriler Tablosu
+        except sqlite3.OperationalError as e:
+            print(f"UYARI: FTS5 arama indeksi oluşturulamadı, arama LIKE ile yapılacak: {e}")
+
+    def _migrate_v3_user_balances(self):
+        """
+        Her kullanıcının güncel bakiyesini ve işlem sayısını tutan özet tabloyu oluşturur.
+        Tablo transactions üzerindeki tetikleyicilerle güncellenir; içeriği migration sonunda baştan hesaplanır.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_balances (
+                user_id INTEGER PRIMARY KEY,
+                balance REAL NOT NULL DEFAULT 0.0,
+                transaction_count INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+
+    def _migrate_v4_transaction_rollups(self):
+        """
+        Kullanıcı, ay (YYYY-MM), tür ve kategori bazında toplam, adet, en küçük ve en büyük tutarı tutan özet tabloyu
+        oluşturur. Kategorisiz işlemler '' kategorisinde toplanır (birincil anahtarda NULL kullanılamaz).
+        Tablo transactions üzerindeki tetikleyicilerle artımlı olarak güncellenir.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS transaction_rollups (
+                user_id INTEGER NOT NULL,
+                year_month TEXT NOT NULL, -- YYYY-MM
+                type TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                total REAL NOT NULL DEFAULT 0.0,
+                transaction_count INTEGER NOT NULL DEFAULT 0,
+                min_amount REAL,
+                max_amount REAL,
+                PRIMARY KEY (user_id, year_month, type, category)
+            ) WITHOUT ROWID
+        """)
+
+    def _migrate_v5_integer_kurus(self):
+        """
+        Para sütunlarını REAL (TL) yerine INTEGER (kuruş) olarak saklar. SQLite sütun tipini yerinde değiştiremediğinden
+        tablolar yeni tanımla yeniden oluşturulup veriler kuruşa çevrilerek kopyalanır; ID'ler ve AUTOINCREMENT
+        sayaçları korunur. Bakiye ve aylık özet tabloları türetilmiş veri olduğundan boş olarak yeniden oluşturulur.
+        """
+        self._rebuild_table("transactions", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Gelir' veya 'Gider'
+                amount INTEGER NOT NULL, -- kuruş
+                category TEXT,
+                description TEXT,
+                date TEXT NOT NULL, -- YYYY-MM-DD formatında sakla
+                FOREIGN KEY (user_id) REFERENCES users(id)
+        """, {"id": "id", "user_id": "user_id", "type": "type", "amount": "tl_to_kurus(amount)",
+              "category": "category", "description": "description", "date": "date"})
+        self._rebuild_table("recurring_transactions", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                amount INTEGER NOT NULL, -- kuruş
+                type TEXT NOT NULL,
+                category TEXT,
+                start_date TEXT NOT NULL, -- YYYY-MM-DD
+                frequency TEXT NOT NULL, -- 'Günlük', 'Haftalık', 'Aylık', 'Yıllık'
+                last_generated_date TEXT, -- Son otomatik oluşturulma tarihi
+                FOREIGN KEY (user_id) REFERENCES users(id)
+        """, {"id": "id", "user_id": "user_id", "description": "description", "amount": "tl_to_kurus(amount)",
+              "type": "type", "category": "category", "start_date": "start_date", "frequency": "frequency",
+              "last_generated_date": "last_generated_date"})
+        self._rebuild_table("savings_goals", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                goal_name TEXT NOT NULL,
+                target_amount INTEGER NOT NULL, -- kuruş
+                current_amount INTEGER DEFAULT 0, -- kuruş
+                target_date TEXT, -- YYYY-MM-DD
+                description TEXT,
+                status TEXT DEFAULT 'Devam Ediyor', -- 'Devam Ediyor', 'Tamamlandı', 'İptal Edildi'
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, goal_name) -- Her kullanıcının aynı isimde iki hedefi olamaz
+        """, {"id": "id", "user_id": "user_id", "goal_name": "goal_name",
+              "target_amount": "tl_to_kurus(target_amount)", "current_amount": "tl_to_kurus(current_amount)",
+              "target_date": "target_date", "description": "description", "status": "status"})
+        self._rebuild_table("products", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                stock REAL DEFAULT 0.0,
+                purchase_price INTEGER DEFAULT 0, -- kuruş
+                selling_price INTEGER DEFAULT 0, -- kuruş
+                kdv_rate REAL DEFAULT 0.0, -- KDV oranı yüzde olarak (örn: 18.0)
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, name)
+        """, {"id": "id", "user_id": "user_id", "name": "name", "stock": "stock",
+              "purchase_price": "tl_to_kurus(purchase_price)", "selling_price": "tl_to_kurus(selling_price)",
+              "kdv_rate": "kdv_rate"})
+        self._rebuild_table("invoices_offers", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Fatura' veya 'Teklif'
+                document_number TEXT UNIQUE NOT NULL,
+                customer_name TEXT NOT NULL,
+                document_date TEXT NOT NULL, -- YYYY-MM-DD
+                due_validity_date TEXT, -- Vade veya geçerlilik tarihi YYYY-MM-DD
+                items_json TEXT NOT NULL, -- JSON formatında ürün/hizmet kalemleri listesi
+                total_amount_excluding_kdv INTEGER NOT NULL, -- kuruş
+                total_kdv_amount INTEGER NOT NULL, -- kuruş
+                total_amount_with_kdv INTEGER NOT NULL, -- kuruş
+                notes TEXT,
+                status TEXT DEFAULT 'Taslak', -- 'Taslak', 'Gönderildi', 'Ödendi', 'İptal Edildi'
+                FOREIGN KEY (user_id) REFERENCES users(id)
+        """, {"id": "id", "user_id": "user_id", "type": "type", "document_number": "document_number",
+              "customer_name": "customer_name", "document_date": "document_date",
+              "due_validity_date": "due_validity_date", "items_json": "items_json",
+              "total_amount_excluding_kdv": "tl_to_kurus(total_amount_excluding_kdv)",
+              "total_kdv_amount": "tl_to_kurus(total_kdv_amount)",
+              # Eski sürümlerde sonradan eklenen sütun boş kalmış olabilir
+              "total_amount_with_kdv": "IFNULL(tl_to_kurus(total_amount_with_kdv), "
+                                       "tl_to_kurus(total_amount_excluding_kdv) + tl_to_kurus(total_kdv_amount))",
+              "notes": "notes", "status": "status"})
+
+        self.cursor.execute("DROP TABLE IF EXISTS user_balances")
+        self.cursor.execute("""
+            CREATE TABLE user_balances (
+                user_id INTEGER PRIMARY KEY,
+                balance INTEGER NOT NULL DEFAULT 0, -- kuruş
+                transaction_count INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        self.cursor.execute("DROP TABLE IF EXISTS transaction_rollups")
+        self.cursor.execute("""
+            CREATE TABLE transaction_rollups (
+                user_id INTEGER NOT NULL,
+                year_month TEXT NOT NULL, -- YYYY-MM
+                type TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                total INTEGER NOT NULL DEFAULT 0, -- kuruş
+                transaction_count INTEGER NOT NULL DEFAULT 0,
+                min_amount INTEGER, -- kuruş
+                max_amount INTEGER, -- kuruş
+                PRIMARY KEY (user_id, year_month, type, category)
+            ) WITHOUT ROWID
+        """)
+
+    def _migrate_v6_invoice_items(self):
+        """
+        Fatura/teklif kalemlerini ayrı bir invoice_items tablosuna taşır ve invoices_offers'tan items_json sütununu
+        kaldırır. Kalemler belge sırasını line_no ile korur; ürün adı belge anındaki haliyle saklanır,
+        product_id eşleşen ürün varsa doldurulur. Okunamayan JSON'lar uyarı verilerek atlanır.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invoice_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                invoice_offer_id INTEGER NOT NULL,
+                line_no INTEGER NOT NULL, -- Belgedeki sıra
+                product_id INTEGER,
+                product_name TEXT NOT NULL,
+                quantity REAL NOT NULL,
+                unit_price INTEGER NOT NULL, -- kuruş
+                kdv_rate REAL NOT NULL, -- yüzde (örn: 18.0)
+                kdv_amount INTEGER NOT NULL, -- kuruş
+                line_total INTEGER NOT NULL, -- KDV dahil satır toplamı, kuruş
+                FOREIGN KEY (invoice_offer_id) REFERENCES invoices_offers(id),
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            )
+        """)
+
+        self.cursor.execute("SELECT id, user_id, items_json FROM invoices_offers")
+        for invoice_offer_id, user_id, items_json in self.cursor.fetchall():
+            try:
+                self._insert_invoice_items(invoice_offer_id, json.loads(items_json or "[]"), user_id)
+            except (TypeError, ValueError, KeyError, AttributeError) as e:
+                print(f"UYARI: {invoice_offer_id} ID'li belgenin kalemleri okunamadı, atlandı: {e}")
+
+        self._rebuild_table("invoices_offers", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Fatura' veya 'Teklif'
+                document_number TEXT UNIQUE NOT NULL,
+                customer_name TEXT NOT NULL,
+                document_date TEXT NOT NULL, -- YYYY-MM-DD
+                due_validity_date TEXT, -- Vade veya geçerlilik tarihi YYYY-MM-DD
+                total_amount_excluding_kdv INTEGER NOT NULL, -- kuruş
+                total_kdv_amount INTEGER NOT NULL, -- kuruş
+                total_amount_with_kdv INTEGER NOT NULL, -- kuruş
+                notes TEXT,
+                status TEXT DEFAULT 'Taslak', -- 'Taslak', 'Gönderildi', 'Ödendi', 'İptal Edildi'
+                FOREIGN KEY (user_id) REFERENCES users(id)
+        """, {column: column for column in (
+            "id", "user_id", "type", "document_number", "customer_name", "document_date", "due_validity_date",
+            "total_amount_excluding_kdv", "total_kdv_amount", "total_amount_with_kdv", "notes", "status")})
+
+    def _migrate_v7_document_sequences(self):
+        """
+        Belge numarası sayaçlarını users tablosundaki tek sayaçtan (last_invoice_num / last_offer_num)
+        (kullanıcı, belge türü, yıl) bazındaki document_sequences tablosuna taşır. Her yılın sayacı, o yıla ait
+        mevcut belge numaralarının en büyüğünden başlar; içinde bulunulan yıl için eski sayaç da hesaba katılır,
+        böylece daha önce verilmiş hiçbir numara yeniden verilmez.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_sequences (
+                user_id INTEGER NOT NULL,
+                doc_type TEXT NOT NULL, -- 'Fatura' veya 'Teklif'
+                year INTEGER NOT NULL,
+                last_value INTEGER NOT NULL DEFAULT 0, -- Son verilen sıra numarası
+                PRIMARY KEY (user_id, doc_type, year),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            ) WITHOUT ROWID
+        """)
+
+        seeds = {}
+        prefix_to_type = {prefix: doc_type for doc_type, prefix in DOCUMENT_NUMBER_PREFIXES.items()}
+        self.cursor.execute("SELECT user_id, type, document_number FROM invoices_offers")
+        for user_id, doc_type, document_number in self.cursor.fetchall():
+            match = DOCUMENT_NUMBER_PATTERN.match(document_number or "")
+            if not match or prefix_to_type.get(match["prefix"]) != doc_type:
+                continue
+            key = (user_id, doc_type, int(match["year"]))
+            seeds[key] = max(seeds.get(key, 0), int(match["number"]))
+
+        current_year = datetime.now().year
+        self.cursor.execute("SELECT id, last_invoice_num, last_offer_num FROM users")
+        for user_id, last_invoice_num, last_offer_num in self.cursor.fetchall():
+            for doc_type, last_num in (("Fatura", last_invoice_num), ("Teklif", last_offer_num)):
+                if last_num:
+                    key = (user_id, doc_type, current_year)
+                    seeds[key] = max(seeds.get(key, 0), last_num)
+
+        self.cursor.executemany("""
+            INSERT INTO document_sequences (user_id, doc_type, year, last_value) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, doc_type, year) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)
+        """, [(*key, last_value) for key, last_value in seeds.items()])
+
+    def _migrate_v8_stock_movements(self):
+        """
+        Stok hareketleri defterini oluşturur. Mevcut stoklar, migration günü tarihli ve ürünün alış fiyatı
+        maliyetli birer 'Açılış' hareketi olarak deftere aktarılır; bu tarihten önceki stok geçmişi bilinmez.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                movement_date TEXT NOT NULL DEFAULT (date('now', 'localtime')), -- YYYY-MM-DD
+                quantity REAL NOT NULL, -- Giriş pozitif, çıkış negatif
+                unit_cost INTEGER, -- Girişlerde birim maliyet, kuruş; çıkışlarda NULL
+                movement_type TEXT NOT NULL, -- 'Açılış', 'Satış', 'Satış İptali', 'Düzeltme' vb.
+                document_number TEXT, -- İlgili fatura numarası (varsa)
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            )
+        """)
+        self.cursor.execute("""
+            INSERT INTO stock_movements (user_id, product_id, quantity, unit_cost, movement_type)
+            SELECT user_id, id, stock, purchase_price, 'Açılış' FROM products WHERE stock != 0
+        """)
+
+    def _migrate_v9_invoice_customer_id(self):
+        """
+        invoices_offers tablosunda müşteriyi serbest metin customer_name yerine customers tablosuna bağlı
+        customer_id ile tutar. Müşteri listesinde bulunmayan adlar için önce müşteri kaydı açılır; böylece
+        her belge bir müşteriye bağlanır. Müşteri adı artık yalnızca customers tablosunda durur.
+        """
+        self.cursor.execute("""
+            INSERT OR IGNORE INTO customers (user_id, name)
+            SELECT DISTINCT user_id, customer_name FROM invoices_offers
+        """)
+        if self.cursor.rowcount > 0:
+            print(f"Faturalarda geçen {self.cursor.rowcount} müşteri, müşteri listesine eklendi.")
+
+        self._rebuild_table("invoices_offers", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Fatura' veya 'Teklif'
+                document_number TEXT UNIQUE NOT NULL,
+                customer_id INTEGER NOT NULL,
+                document_date TEXT NOT NULL, -- YYYY-MM-DD
+                due_validity_date TEXT, -- Vade veya geçerlilik tarihi YYYY-MM-DD
+                total_amount_excluding_kdv INTEGER NOT NULL, -- kuruş
+                total_kdv_amount INTEGER NOT NULL, -- kuruş
+                total_amount_with_kdv INTEGER NOT NULL, -- kuruş
+                notes TEXT,
+                status TEXT DEFAULT 'Taslak', -- 'Taslak', 'Gönderildi', 'Ödendi', 'İptal Edildi'
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (customer_id) REFERENCES customers(id)
+        """, {
+            **{column: column for column in (
+                "id", "user_id", "type", "document_number", "document_date", "due_validity_date",
+                "total_amount_excluding_kdv", "total_kdv_amount", "total_amount_with_kdv", "notes", "status")},
+            "customer_id": """(SELECT customers.id FROM customers WHERE customers.user_id = invoices_offers.user_id
+                                                                  AND customers.name = invoices_offers.customer_name)""",
+        })
+
+    def _migrate_v10_category_ids(self):
+        """
+        İşlemlerde ve tekrarlayan işlemlerde kategoriyi ad yerine categories.id ile tutar. Kategori listesinde
+        olmayan adlar için önce kategori açılır (türü, o adla girilmiş işlemlerin türüdür; karışıksa 'Genel').
+        Kategori adı artık yalnızca categories tablosunda durduğundan arama indeksi yalnızca açıklamayı,
+        aylık özet tablosu ise kategori ID'sini tutar; ikisi de migration sonunda baştan oluşturulur.
+        """
+        self._add_column_if_not_exists('categories', 'merged_into_id', 'INTEGER REFERENCES categories(id)')
+        self.cursor.execute("""
+            INSERT OR IGNORE INTO categories (user_id, name, type)
+            SELECT user_id, category, CASE WHEN MIN(type) = MAX(type) THEN MIN(type) ELSE 'Genel' END
+            FROM (SELECT user_id, category, type FROM transactions
+                  UNION ALL
+                  SELECT user_id, category, type FROM recurring_transactions)
+            WHERE category IS NOT NULL AND category != ''
+            GROUP BY user_id, category
+        """)
+        if self.cursor.rowcount > 0:
+            print(f"İşlemlerde geçen {self.cursor.rowcount} kategori, kategori listesine eklendi.")
+
+        def category_id_expr(table_name):
+            return f"""(SELECT categories.id FROM categories WHERE categories.user_id = {table_name}.user_id
+                                                              AND categories.name = {table_name}.category)"""
+
+        self._rebuild_table("transactions", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL, -- 'Gelir' veya 'Gider'
+                amount INTEGER NOT NULL, -- kuruş
+                category_id INTEGER, -- Kategorisiz işlemlerde NULL
+                description TEXT,
+                date TEXT NOT NULL, -- YYYY-MM-DD formatında sakla
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (category_id) REFERENCES categories(id)
+        """, {"id": "id", "user_id": "user_id", "type": "type", "amount": "amount",
+              "category_id": category_id_expr("transactions"), "description": "description", "date": "date"})
+        self._rebuild_table("recurring_transactions", """
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                amount INTEGER NOT NULL, -- kuruş
+                type TEXT NOT NULL,
+                category_id INTEGER,
+                start_date TEXT NOT NULL, -- YYYY-MM-DD
+                frequency TEXT NOT NULL, -- 'Günlük', 'Haftalık', 'Aylık', 'Yıllık'
+                last_generated_date TEXT, -- Son otomatik oluşturulma tarihi
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (category_id) REFERENCES categories(id)
+        """, {"id": "id", "user_id": "user_id", "description": "description", "amount": "amount", "type": "type",
+              "category_id": category_id_expr("recurring_transactions"), "start_date": "start_date",
+              "frequency": "frequency", "last_generated_date": "last_generated_date"})
+
+        self.cursor.execute("DROP TABLE IF EXISTS transactions_fts")
+        try:
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    type TEXT NOT NULL, -- 'Gelir', 'Gider' veya 'Genel'
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    UNIQUE(user_id, name)
+                CREATE VIRTUAL TABLE transactions_fts USING fts5(
+                    description,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
                 )
             """)
+        except sqlite3.OperationalError as e:
+            print(f"UYARI: FTS5 arama indeksi oluşturulamadı, arama LIKE ile yapılacak: {e}")
 
-            # users tablosuna 'last_invoice_num' ve 'last_offer_num' sütunlarını ekle (eğer yoksa)
-            self._add_column_if_not_exists('users', 'last_invoice_num', 'INTEGER DEFAULT 0')
-            self._add_column_if_not_exists('users', 'last_offer_num', 'INTEGER DEFAULT 0')
-
-            # invoices_offers tablosuna 'total_amount_with_kdv' sütununu ekle (eğer yoksa)
-            self._add_column_if_not_exists('invoices_offers', 'total_amount_with_kdv', 'REAL')
-
-            # recurring_transactions tablosuna 'category' sütununu ekle (eğer yoksa)
-            self._add_column_if_not_exists('recurring_transactions', 'category', 'TEXT')
+        self.cursor.execute("DROP TABLE IF EXISTS transaction_rollups")
+        self.cursor.execute("""
+            CREATE TABLE transaction_rollups (
+                user_id INTEGER NOT NULL,
+                year_month TEXT NOT NULL, -- YYYY-MM
+                type TEXT NOT NULL,
+                category_id INTEGER NOT NULL DEFAULT 0, -- Kategorisiz işlemler için 0
+                total INTEGER NOT NULL DEFAULT 0, -- kuruş
+                transaction_count INTEGER NOT NULL DEFAULT 0,
+                min_amount INTEGER, -- kuruş
+                max_amount INTEGER, -- kuruş
+                PRIMARY KEY (user_id, year_month, type, category_id)
+            ) WITHOUT ROWID
+        """)
+
+    def _migrate_v11_user_data_versions(self):
+        """
+        Kullanıcı bazında veri sürümü tablosunu oluşturur. Sürümü artıran tetikleyiciler MANAGED_TRIGGERS
+        listesindedir; satırı olmayan kullanıcının sürümü 0 kabul edilir.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_data_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
 
-            self.conn.commit()
-            print("Tablolar başarıyla kontrol edildi/oluşturuldu.")
-        except sqlite3.Error as e:
-            print(f"Tablo oluşturma hatası: {e}")
+    def _migrate_v12_category_rules(self):
+        """
+        Kullanıcı tanımlı kategori kurallarının tablosunu oluşturur. Kurallar yapay zeka tahmininden önce denenir
+        (bkz. ai_predictor.CategoryRuleEngine); hit_count kuralların ayarlanması için eşleşme sayısını tutar.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS category_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                pattern TEXT NOT NULL,
+                is_regex INTEGER NOT NULL DEFAULT 0, -- 0: anahtar kelime (açıklamada geçmesi yeterli), 1: düzenli ifade
+                category_id INTEGER NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0, -- Birden çok kural eşleşirse önceliği yüksek olan kazanır
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                last_hit_at TEXT,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (category_id) REFERENCES categories(id)
+            )
+        """)
+
+    def _rebuild_table(self, table_name, columns_sql, column_exprs):
+        """
+        Tabloyu yeni sütun tanımlarıyla yeniden oluşturur ve verileri verilen ifadelerle dönüştürerek kopyalar.
+        SQLite'ın önerdiği sırayla çalışır (yeni tablo, kopyala, eskiyi sil, yeniden adlandır); böylece
+        bu tabloya başvuran diğer tabloların FOREIGN KEY tanımları bozulmaz.
+        Args:
+            table_name (str): Yeniden oluşturulacak tablo.
+            columns_sql (str): CREATE TABLE parantezi içindeki sütun ve kısıt tanımları.
+            column_exprs (dict): Yeni sütun adı -> eski tablodan okunacak SQL ifadesi.
+        """
+        self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,))
+        sequence = self.cursor.fetchone()
+        self.cursor.execute(f"CREATE TABLE {table_name}_new ({columns_sql})")
+        self.cursor.execute(f"""
+            INSERT INTO {table_name}_new ({", ".join(column_exprs)})
+            SELECT {", ".join(column_exprs.values())} FROM {table_name}
+        """)
+        self.cursor.execute(f"DROP TABLE {table_name}")
+        self.cursor.execute(f"ALTER TABLE {table_name}_new RENAME TO {table_name}")
+        if sequence:
+            self.cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table_name))
+
+    def _create_managed_indexes(self):
+        """MANAGED_INDEXES listesindeki indeksleri oluşturur (varsa dokunmaz)."""
+        for index_name, table_name, columns in MANAGED_INDEXES:
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})")
 
     def _add_column_if_not_exists(self, table_name, column_name, column_definition):
         """Belirtilen tabloya sütun ekler, eğer sütun yoksa."""
         self.cursor.execute(f"PRAGMA table_info({table_name})")
         columns = [column[1] for column in self.cursor.fetchall()]
         if column_name not in columns:
-            try:
-                self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
-                self.conn.commit()
-                print(f"'{table_name}' tablosuna '{column_name}' sütunu eklendi.")
-            except sqlite3.Error as e:
-                print(f"'{table_name}' tablosuna '{column_name}' sütunu eklenirken hata: {e}")
+            self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
+            print(f"'{table_name}' tablosuna '{column_name}' sütunu eklendi.")
 
     # --- Kullanıcı Yönetimi ---
     def add_user(self, username, password):
@@ -175,13 +1879,15 @@ class DatabaseManager:
         hashed_password = hash_password_bcrypt(password)
         try:
             self.cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-            self.conn.commit()
+            self._commit()
             print(f"Kullanıcı '{username}' başarıyla eklendi.")
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             print(f"Hata: '{username}' kullanıcı adı zaten mevcut.")
             return False
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Kullanıcı ekleme hatası: {e}")
             return False
 
@@ -196,72 +1902,335 @@ class DatabaseManager:
                 return user_id
         return None
 
-    def get_user_invoice_offer_nums(self, user_id):
-        """Belirli bir kullanıcı için son fatura ve teklif numaralarını alır."""
-        self.cursor.execute("SELECT last_invoice_num, last_offer_num FROM users WHERE id = ?", (user_id,))
-        result = self.cursor.fetchone()
-        if result:
-            return result
-        return 0, 0  # Varsayılan değerler
+    # --- Belge Numarası Sayaçları ---
+    def allocate_document_numbers(self, user_id, doc_type, count=1, year=None):
+        """
+        Kullanıcının belirtilen belge türü ve yılı için ardışık `count` adet belge numarasını tek bir atomik
+        UPSERT ... RETURNING ile ayırır. Toplu belge oluşturmada blok halinde ayırmak için count > 1 verilebilir.
+        unit_of_work içinde çağrılırsa ayırma belge kaydıyla aynı işlemde commit edilir; işlem geri alınırsa
+        numaralar da geri verilir ve numara dizisinde boşluk oluşmaz.
+        Args:
+            user_id (int): Kullanıcı ID'si.
+            doc_type (str): 'Fatura' veya 'Teklif'.
+            count (int): Ayrılacak numara adedi.
+            year (int, optional): Numara yılı. Varsayılan: içinde bulunulan yıl.
+        Returns:
+            list: Ayrılan belge numaraları (örn: ['FTR-2025-00042']); hata durumunda boş liste.
+        """
+        if doc_type not in DOCUMENT_NUMBER_PREFIXES or count < 1:
+            print(f"Geçersiz belge numarası isteği: {doc_type!r}, adet {count}")
+            return []
+        year = year or datetime.now().year
+        try:
+            self.cursor.execute("""
+                INSERT INTO document_sequences (user_id, doc_type, year, last_value) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, doc_type, year) DO UPDATE SET last_value = last_value + excluded.last_value
+                RETURNING last_value
+            """, (user_id, doc_type, year, count))
+            last_value = self.cursor.fetchone()[0]
+            self._commit()
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Belge numarası ayırma hatası: {e}")
+            return []
+        return [format_document_number(doc_type, year, number) for number in range(last_value - count + 1, last_value + 1)]
 
-    def update_user_invoice_offer_num(self, user_id, invoice_num=None, offer_num=None):
-        """Belirli bir kullanıcı için fatura veya teklif numarasını günceller."""
-        if invoice_num is not None:
-            self.cursor.execute("UPDATE users SET last_invoice_num = ? WHERE id = ?", (invoice_num, user_id))
-        if offer_num is not None:
-            self.cursor.execute("UPDATE users SET last_offer_num = ? WHERE id = ?", (offer_num, user_id))
-        self.conn.commit()
+    def allocate_document_number(self, user_id, doc_type, year=None):
+        """Tek bir belge numarası ayırır (bkz. allocate_document_numbers). Hata durumunda None döner."""
+        numbers = self.allocate_document_numbers(user_id, doc_type, 1, year)
+        return numbers[0] if numbers else None
+
+    def peek_next_document_number(self, user_id, doc_type, year=None):
+        """
+        Sıradaki belge numarasını ayırmadan döndürür; yalnızca formda önizleme içindir.
+        Kayıt sırasında numara allocate_document_number ile alınmalıdır, aradaki sürede başka bir kayıt
+        aynı numarayı almış olabilir.
+        """
+        if doc_type not in DOCUMENT_NUMBER_PREFIXES:
+            return None
+        year = year or datetime.now().year
+        self.cursor.execute("SELECT last_value FROM document_sequences WHERE user_id = ? AND doc_type = ? AND year = ?",
+                            (user_id, doc_type, year))
+        result = self.cursor.fetchone()
+        return format_document_number(doc_type, year, (result[0] if result else 0) + 1)
 
     # --- İşlem Yönetimi (Gelir/Gider) ---
+    _INSERT_TRANSACTION_SQL = (f"INSERT INTO transactions (user_id, type, amount, category_id, description, date) "
+                               f"VALUES (?, ?, ?, {CATEGORY_ID_BY_NAME_SQL}, ?, ?)")
+    # Kategori listesinde olmayan bir adla işlem girilirse kategori işlem türüyle açılır; parametreler: user_id, ad, tür.
+    _ENSURE_CATEGORY_SQL = "INSERT INTO categories (user_id, name, type) VALUES (?, ?, ?) ON CONFLICT (user_id, name) DO NOTHING"
+
+    def _ensure_category(self, name, type, user_id):
+        """Kategori adı listede yoksa işlem türüyle ekler (commit etmez)."""
+        if name:
+            self.cursor.execute(self._ENSURE_CATEGORY_SQL, (user_id, name, type))
+            if self.cursor.rowcount > 0:
+                self._invalidate_cache("categories", user_id)
+
     def insert_transaction(self, type, amount, category, description, date, user_id):
-        """Yeni bir gelir veya gider işlemi ekler."""
+        """Yeni bir gelir veya gider işlemi ekler. Kategori adla verilir ve kategori ID'sine çevrilerek saklanır."""
         try:
-            self.cursor.execute(
-                "INSERT INTO transactions (user_id, type, amount, category, description, date) VALUES (?, ?, ?, ?, ?, ?)",
-                (user_id, type, amount, category, description, date))
-            self.conn.commit()
+            self._ensure_category(category, type, user_id)
+            self.cursor.execute(self._INSERT_TRANSACTION_SQL,
+                                (user_id, type, tl_to_kurus(amount), user_id, category, description, date))
+            self._commit()
             return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"İşlem ekleme hatası: {e}")
             return False
 
-    def get_transactions(self, user_id, type_filter=None, category_filter=None, start_date=None, end_date=None,
-                         search_term=None):
-        """Belirli kriterlere göre işlemleri getirir."""
-        query = "SELECT id, date, type, amount, category, description FROM transactions WHERE user_id = ?"
+    def insert_transaction_async(self, type, amount, category, description, date, user_id, callback=None):
+        """
+        Gelir/gider işlemini grup commit kuyruğu üzerinden ekler (bkz. enable_write_queue).
+        Returns:
+            Future: İşlem kalıcı olarak commit edildiğinde yeni işlemin ID'si ile tamamlanır; hata olursa istisna taşır.
+        """
+        try:
+            amount = tl_to_kurus(amount)
+        except ValueError as e:
+            future = Future()
+            future.set_exception(e)
+            if callback is not None:
+                future.add_done_callback(callback)
+            return future
+        new_category = bool(category) and category not in self.get_all_categories(user_id)
+        return self._submit_write(
+            self._INSERT_TRANSACTION_SQL, (user_id, type, amount, user_id, category, description, date), callback,
+            before=[(self._ENSURE_CATEGORY_SQL, (user_id, category, type))] if category else (),
+            invalidates=[("categories", user_id)] if new_category else ())
+
+    @staticmethod
+    def _normalize_transaction_row(row):
+        """
+        Toplu ekleme için gelen (type, amount, category, description, date) satırını doğrular.
+        Returns:
+            tuple or None: Geçerliyse tutarı kuruşa çevrilmiş satır, değilse None.
+        """
+        try:
+            type, amount, category, description, date = row
+            amount = tl_to_kurus(amount)
+            _parse_iso_date(date)
+        except (TypeError, ValueError):
+            return None
+        if type not in ("Gelir", "Gider") or amount is None or not amount > 0:
+            return None
+        return type, amount, category or None, description or None, date
+
+    @staticmethod
+    def is_valid_transaction_row(row):
+        """(type, amount, category, description, date) satırının insert_transactions_many'de kabul edilip edilmeyeceğini döner."""
+        return DatabaseManager._normalize_transaction_row(row) is not None
+
+    def insert_transactions_many(self, rows, user_id, batch_size=1000):
+        """
+        Çok sayıda gelir/gider işlemini tek bir işlem (transaction) ve tek bir commit ile ekler.
+        Satırlar batch_size'lık gruplar halinde executemany ile gönderildiğinden generator'lar da
+        bellekte tamamen açılmadan işlenir.
+        BULK_INSERT_TRIGGER_THRESHOLD satırdan sonrası INSERT tetikleyicileri askıya alınarak eklenir; türetilmiş
+        tablolar sonda küme olarak güncellenir ve tetikleyiciler aynı işlem içinde geri kurulur.
+        Args:
+            rows (iterable): (type, amount, category, description, date) demetleri.
+            user_id (int): İşlemlerin ekleneceği kullanıcının ID'si.
+            batch_size (int): Her executemany çağrısındaki satır sayısı.
+        Returns:
+            tuple: (eklenen satır sayısı, reddedilen satır sayısı)
+        """
+        inserted = 0
+        rejected = 0
+        batch = []
+        seen_categories = set()
+        suspended_after_id = None
+        try:
+            for row in rows:
+                normalized = self._normalize_transaction_row(row)
+                if normalized is None:
+                    rejected += 1
+                    continue
+                type, amount, category, description, date = normalized
+                if category and category not in seen_categories:
+                    self._ensure_category(category, type, user_id)
+                    seen_categories.add(category)
+                batch.append((user_id, type, amount, user_id, category, description, date))
+                if len(batch) >= batch_size:
+                    if suspended_after_id is None and inserted + len(batch) >= BULK_INSERT_TRIGGER_THRESHOLD:
+                        suspended_after_id = self._suspend_bulk_insert_triggers()
+                    self.cursor.executemany(self._INSERT_TRANSACTION_SQL, batch)
+                    inserted += len(batch)
+                    batch = []
+            if batch:
+                self.cursor.executemany(self._INSERT_TRANSACTION_SQL, batch)
+                inserted += len(batch)
+            if suspended_after_id is not None:
+                self._resume_bulk_insert_triggers(suspended_after_id)
+            self._commit()
+            print(f"Toplu işlem ekleme: {inserted} satır eklendi, {rejected} satır reddedildi.")
+            return inserted, rejected
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Toplu işlem ekleme hatası: {e}")
+            return 0, inserted + rejected + len(batch)
+
+    def _transaction_filter_clause(self, user_id, type_filter=None, category_filter=None, start_date=None,
+                                   end_date=None, search_term=None):
+        """İşlem listeleme filtrelerinden WHERE koşulunu ve parametrelerini üretir."""
+        clause = "user_id = ?"
         params = [user_id]
 
         if type_filter:
-            query += " AND type = ?"
+            clause += " AND type = ?"
             params.append(type_filter)
         if category_filter:
-            query += " AND category = ?"
-            params.append(category_filter)
+            # Kategoriye ve ona birleştirilmiş kategorilere bağlı işlemler (user_id, category_id) indeksiyle bulunur
+            clause += (f" AND category_id IN (SELECT id FROM categories WHERE user_id = ? "
+                       f"AND IFNULL(merged_into_id, id) = {CATEGORY_ID_BY_NAME_SQL})")
+            params.extend([user_id, user_id, category_filter])
         if start_date:
-            query += " AND date >= ?"
+            clause += " AND date >= ?"
             params.append(start_date)
         if end_date:
-            query += " AND date <= ?"
+            clause += " AND date <= ?"
             params.append(end_date)
         if search_term:
-            query += " AND (description LIKE ? OR category LIKE ?)"
-            params.append(f"%{search_term}%")
-            params.append(f"%{search_term}%")
+            match_query = self._fts_match_query(search_term) if self.fts_enabled else None
+            if match_query:
+                conditions = ["id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)"]
+                params.append(match_query)
+            else:
+                conditions = ["description LIKE ?"]
+                params.append(f"%{search_term}%")
+            category_ids = self._matching_category_ids(user_id, search_term)
+            if category_ids:
+                conditions.append(f"category_id IN ({', '.join('?' * len(category_ids))})")
+                params.extend(category_ids)
+            clause += f" AND ({' OR '.join(conditions)})"
+        return clause, params
+
+    def _matching_category_ids(self, user_id, search_term):
+        """
+        Arama teriminin tüm kelimeleri geçerli kategori adının kelimelerinden birinin başıyla eşleşen kategori
+        ID'lerini (birleştirilmiş olanlar dahil) döner. Kategori adları arama indeksinde tutulmadığından
+        (ad değişikliği yalnızca categories tablosuna dokunsun diye) kullanıcının kısa kategori listesinde aranır.
+        """
+        tokens = _search_words(search_term)
+        if not tokens:
+            return []
+        self.cursor.execute("""
+            SELECT c.id, IFNULL(m.name, c.name) FROM categories c LEFT JOIN categories m ON m.id = c.merged_into_id
+            WHERE c.user_id = ?
+        """, (user_id,))
+        matches = []
+        for category_id, name in self.cursor.fetchall():
+            words = _search_words(name or "")
+            if all(any(word.startswith(token) for word in words) for token in tokens):
+                matches.append(category_id)
+        return matches
+
+    @staticmethod
+    def _fts_match_query(search_term):
+        """
+        Kullanıcının yazdığı arama terimini güvenli bir FTS5 sorgusuna çevirir: her kelime tırnaklanmış
+        bir önek araması olur ("mar" -> "mar"*) ve kelimelerin hepsi aranır. Terimde kelime yoksa None döner.
+        """
+        tokens = re.findall(r"\w+", search_term.translate(TURKISH_FOLD_MAP))
+        return " ".join(f'"{token}"*' for token in tokens) or None
 
-        query += " ORDER BY date DESC"
+    def get_transactions(self, user_id, type_filter=None, category_filter=None, start_date=None, end_date=None,
+                         search_term=None):
+        """Belirli kriterlere göre işlemleri getirir."""
+        clause, params = self._transaction_filter_clause(user_id, type_filter, category_filter, start_date, end_date,
+                                                         search_term)
+        query = (f"SELECT id, date, type, amount / 100.0, {_category_name_sql('transactions')}, description "
+                 f"FROM transactions WHERE {clause} ORDER BY date DESC")
+
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def get_transactions_page(self, user_id, type_filter=None, category_filter=None, start_date=None, end_date=None,
+                              search_term=None, page_size=200, after=None):
+        """
+        İşlemleri (date, id) üzerinden keyset sayfalama ile, en yeniden eskiye doğru bir sayfa olarak getirir.
+        OFFSET kullanılmadığından her sayfa, geçmişin uzunluğundan bağımsız olarak indeks üzerinden doğrudan bulunur.
+        Args:
+            page_size (int): Sayfadaki en fazla satır sayısı.
+            after (tuple): Önceki sayfanın döndürdüğü devam anahtarı; ilk sayfa için None.
+        Returns:
+            tuple: (satırlar, devam anahtarı) — son sayfada devam anahtarı None olur.
+        """
+        clause, params = self._transaction_filter_clause(user_id, type_filter, category_filter, start_date, end_date,
+                                                         search_term)
+        if after:
+            clause += " AND (date, id) < (?, ?)"
+            params.extend(after)
+        query = (f"SELECT id, date, type, amount / 100.0, {_category_name_sql('transactions')}, description "
+                 f"FROM transactions WHERE {clause} ORDER BY date DESC, id DESC LIMIT ?")
+        params.append(page_size)
 
         self.cursor.execute(query, params)
+        rows = self.cursor.fetchall()
+        next_key = (rows[-1][1], rows[-1][0]) if len(rows) == page_size else None
+        return rows, next_key
+
+    def iter_transactions(self, user_id, type_filter=None, category_filter=None, start_date=None, end_date=None,
+                          search_term=None, page_size=500):
+        """
+        Filtreye uyan tüm işlemleri sayfa sayfa, tembel (lazy) olarak üretir.
+        Bellekte aynı anda en fazla bir sayfa tutulur; dışa aktarma gibi tüm geçmişi gezen işlemler içindir.
+        """
+        next_key = None
+        while True:
+            rows, next_key = self.get_transactions_page(user_id, type_filter, category_filter, start_date, end_date,
+                                                        search_term, page_size=page_size, after=next_key)
+            yield from rows
+            if next_key is None:
+                return
+
+    def search_transactions(self, user_id, search_term, limit=50):
+        """
+        İşlem açıklaması ve kategorisinde tam metin arama yapar. Açıklamada eşleşenler ilgililiğe (bm25) göre
+        önce, yalnızca kategori adı eşleşenler tarihe göre sonra gelir.
+        Returns:
+            list: (id, date, type, amount, category, description) satırları, en ilgili olan başta.
+        """
+        match_query = self._fts_match_query(search_term) if self.fts_enabled else None
+        if not match_query:
+            return self.get_transactions(user_id, search_term=search_term)[:limit]
+
+        query = f"""
+            SELECT t.id AS id, t.date AS date, t.type AS type, t.amount / 100.0 AS amount,
+                   {_category_name_sql('t')} AS category, t.description AS description, bm25(transactions_fts) AS rank
+            FROM transactions_fts
+            JOIN transactions t ON t.id = transactions_fts.rowid
+            WHERE transactions_fts MATCH ? AND t.user_id = ?"""
+        params = [match_query, user_id]
+        category_ids = self._matching_category_ids(user_id, search_term)
+        if category_ids:
+            query += f"""
+            UNION ALL
+            SELECT t.id, t.date, t.type, t.amount / 100.0, {_category_name_sql('t')}, t.description, NULL
+            FROM transactions t
+            WHERE t.user_id = ? AND t.category_id IN ({', '.join('?' * len(category_ids))})
+              AND t.id NOT IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)"""
+            params += [user_id, *category_ids, match_query]
+        self.cursor.execute(f"""
+            SELECT id, date, type, amount, category, description FROM ({query})
+            ORDER BY rank IS NULL, rank, date DESC
+            LIMIT ?
+        """, (*params, limit))
         return self.cursor.fetchall()
 
     def update_transaction(self, transaction_id, type, amount, category, description, date, user_id):
         """Mevcut bir işlemi günceller."""
         try:
+            self._ensure_category(category, type, user_id)
             self.cursor.execute(
-                "UPDATE transactions SET type = ?, amount = ?, category = ?, description = ?, date = ? WHERE id = ? AND user_id = ?",
-                (type, amount, category, description, date, transaction_id, user_id))
-            self.conn.commit()
+                f"UPDATE transactions SET type = ?, amount = ?, category_id = {CATEGORY_ID_BY_NAME_SQL}, description = ?, "
+                f"date = ? WHERE id = ? AND user_id = ?",
+                (type, tl_to_kurus(amount), user_id, category, description, date, transaction_id, user_id))
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"İşlem güncelleme hatası: {e}")
             return False
 
@@ -269,101 +2238,308 @@ class DatabaseManager:
         """Bir işlemi siler."""
         try:
             self.cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
-            self.conn.commit()
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"İşlem silme hatası: {e}")
             return False
 
     def get_balance(self, user_id):
-        """Kullanıcının mevcut bakiyesini hesaplar."""
-        self.cursor.execute(
-            "SELECT SUM(CASE WHEN type = 'Gelir' THEN amount ELSE -amount END) FROM transactions WHERE user_id = ?",
-            (user_id,))
-        balance = self.cursor.fetchone()[0]
-        return balance if balance is not None else 0.0
+        """Kullanıcının mevcut bakiyesini tetikleyicilerle güncel tutulan user_balances özetinden okur."""
+        self.cursor.execute("SELECT balance FROM user_balances WHERE user_id = ?", (user_id,))
+        result = self.cursor.fetchone()
+        return kurus_to_tl(result[0]) if result else 0.0
+
+    def verify_balances(self, repair=False):
+        """
+        user_balances özetini transactions tablosundan baştan hesaplanan değerlerle karşılaştırır.
+        Args:
+            repair (bool): True ise fark bulunduğunda özet tablo baştan hesaplanır.
+        Returns:
+            list: (user_id, kayıtlı bakiye, gerçek bakiye, kayıtlı işlem sayısı, gerçek işlem sayısı) satırları;
+                  bakiyeler kuruş cinsindendir, yalnızca farklı olan kullanıcılar döner.
+        """
+        self.cursor.execute("""
+            SELECT user_id, SUM(CASE WHEN type = 'Gelir' THEN amount ELSE -amount END), COUNT(*)
+            FROM transactions GROUP BY user_id
+        """)
+        actual = {user_id: (balance, count) for user_id, balance, count in self.cursor.fetchall()}
+        self.cursor.execute("SELECT user_id, balance, transaction_count FROM user_balances")
+        stored = {user_id: (balance, count) for user_id, balance, count in self.cursor.fetchall()}
+
+        drift = []
+        for user_id in sorted(actual.keys() | stored.keys()):
+            stored_balance, stored_count = stored.get(user_id, (0, 0))
+            actual_balance, actual_count = actual.get(user_id, (0, 0))
+            if stored_balance != actual_balance or stored_count != actual_count:
+                drift.append((user_id, stored_balance, actual_balance, stored_count, actual_count))
+
+        if drift and repair:
+            try:
+                self._rebuild_user_balances()
+                self._commit()
+            except sqlite3.Error as e:
+                self._rollback()
+                print(f"Bakiye özeti onarma hatası: {e}")
+        return drift
+
+    def print_balance_verification_report(self, repair=False):
+        """Bakiye doğrulama sonuçlarını okunabilir biçimde yazdırır."""
+        drift = self.verify_balances(repair)
+        if not drift:
+            print("Bakiye doğrulama: Tüm kullanıcıların bakiye özeti işlemlerle tutarlı.")
+            return drift
+
+        print(f"Bakiye doğrulama: {len(drift)} kullanıcının bakiye özeti işlemlerle tutarsız:")
+        for user_id, stored_balance, actual_balance, stored_count, actual_count in drift:
+            print(f"  - Kullanıcı {user_id}: kayıtlı {kurus_to_tl(stored_balance):.2f} TL ({stored_count} işlem), "
+                  f"gerçek {kurus_to_tl(actual_balance):.2f} TL ({actual_count} işlem)")
+        if repair:
+            print("Bakiye özeti baştan hesaplandı.")
+        return drift
 
     # --- Kategori Yönetimi ---
     def insert_category(self, name, type, user_id):
         """Yeni bir kategori ekler."""
         try:
             self.cursor.execute("INSERT INTO categories (user_id, name, type) VALUES (?, ?, ?)", (user_id, name, type))
-            self.conn.commit()
+            self._invalidate_cache("categories", user_id)
+            self._commit()
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             print(f"Hata: '{name}' kategorisi zaten mevcut.")
             return False
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Kategori ekleme hatası: {e}")
             return False
 
     def get_categories_for_user(self, user_id):
-        """Belirli bir kullanıcıya ait tüm kategorileri getirir."""
-        self.cursor.execute("SELECT id, name, type FROM categories WHERE user_id = ? ORDER BY name", (user_id,))
-        return self.cursor.fetchall()
+        """Belirli bir kullanıcıya ait tüm kategorileri (birleştirilmiş olanlar hariç) getirir. Önbellekten okunur."""
+        return self.dimension_cache.get("categories", user_id, "all", lambda: self.cursor.execute(
+            "SELECT id, name, type FROM categories WHERE user_id = ? AND merged_into_id IS NULL ORDER BY name",
+            (user_id,)).fetchall())
 
     def get_all_categories(self, user_id):
-        """Combobox için tüm kategori isimlerini döndürür."""
-        self.cursor.execute("SELECT name FROM categories WHERE user_id = ? ORDER BY name", (user_id,))
-        return [row[0] for row in self.cursor.fetchall()]
+        """Combobox için tüm kategori isimlerini (birleştirilmiş olanlar hariç) döndürür. Önbellekten okunur."""
+        return [name for _, name, _ in self.get_categories_for_user(user_id)]
+
+    def update_category(self, category_id, name, type, user_id):
+        """
+        Kategorinin adını ve türünü değiştirir. İşlemler kategoriye ID ile bağlı olduğundan yalnızca
+        categories tablosundaki tek satır güncellenir. Ad başka bir kategoride varsa güncelleme yapılmaz;
+        iki kategoriyi tek kategoride toplamak için merge_categories kullanılmalıdır.
+        """
+        try:
+            self.cursor.execute("UPDATE categories SET name = ?, type = ? WHERE id = ? AND user_id = ? AND merged_into_id IS NULL",
+                                (name, type, category_id, user_id))
+            self._invalidate_cache("categories", user_id)
+            self._invalidate_cache("category_rules", user_id)  # Kurallar kategori adını categories'ten okur
+            self._commit()
+            return self.cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            self._rollback()
+            print(f"Hata: '{name}' kategorisi zaten mevcut. Kategorileri birleştirmek için merge_categories kullanın.")
+            return False
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Kategori güncelleme hatası: {e}")
+            return False
+
+    def merge_categories(self, source_category_id, target_category_id, user_id):
+        """
+        Kaynak kategoriyi hedef kategoriye birleştirir: kaynak (ve ona daha önce birleştirilmiş kategoriler)
+        hedefi gösterir, işlemler ve raporlar bundan sonra hedef kategori altında görünür. İşlem satırlarına
+        dokunulmaz; yalnızca categories tablosu güncellenir. Birleştirilen kategoriler listelerde görünmez.
+        """
+        try:
+            self.cursor.execute("SELECT IFNULL(merged_into_id, id) FROM categories WHERE id = ? AND user_id = ?",
+                                (target_category_id, user_id))
+            target = self.cursor.fetchone()
+            if target is None or target[0] == int(source_category_id):
+                print("Hata: Geçersiz hedef kategori.")
+                return False
+            self.cursor.execute("""
+                UPDATE categories SET merged_into_id = ?
+                WHERE user_id = ? AND (id = ? OR merged_into_id = ?)
+            """, (target[0], user_id, source_category_id, source_category_id))
+            self._invalidate_cache("categories", user_id)
+            self._invalidate_cache("category_rules", user_id)
+            self._commit()
+            return self.cursor.rowcount > 0
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Kategori birleştirme hatası: {e}")
+            return False
 
     def delete_category(self, category_id, user_id):
-        """Bir kategoriyi siler."""
+        """
+        Bir kategoriyi (ve ona birleştirilmiş kategorileri) siler. Bağlı işlemler ve tekrarlayan işlemler
+        kategorisiz kalır (bkz. update_transactions_category_to_null); kategoriye ait kurallar silinir.
+        """
         try:
-            self.cursor.execute("DELETE FROM categories WHERE id = ? AND user_id = ?", (category_id, user_id))
-            self.conn.commit()
+            self._clear_category_references(category_id, user_id)
+            self.cursor.execute("""
+                DELETE FROM category_rules
+                WHERE user_id = ? AND category_id IN (SELECT id FROM categories WHERE id = ? OR merged_into_id = ?)
+            """, (user_id, category_id, category_id))
+            self.cursor.execute("DELETE FROM categories WHERE user_id = ? AND (id = ? OR merged_into_id = ?)",
+                                (user_id, category_id, category_id))
+            self._invalidate_cache("categories", user_id)
+            self._invalidate_cache("category_rules", user_id)
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Kategori silme hatası: {e}")
             return False
 
-    def count_transactions_by_category(self, category_name, user_id):
-        """Belirli bir kategoriye ait işlem sayısını döner."""
-        self.cursor.execute("SELECT COUNT(*) FROM transactions WHERE category = ? AND user_id = ?",
-                            (category_name, user_id))
+    def count_transactions_by_category(self, category_id, user_id):
+        """Belirli bir kategoriye (ve ona birleştirilmiş kategorilere) ait işlem sayısını döner."""
+        self.cursor.execute("""
+            SELECT COUNT(*) FROM transactions
+            WHERE user_id = ? AND category_id IN (SELECT id FROM categories WHERE id = ? OR merged_into_id = ?)
+        """, (user_id, category_id, category_id))
         return self.cursor.fetchone()[0]
 
-    def update_transactions_category_to_null(self, category_name, user_id):
-        """Belirli bir kategoriye sahip tüm işlemlerin kategorisini NULL olarak günceller."""
+    def _clear_category_references(self, category_id, user_id):
+        """Kategoriye ve ona birleştirilmiş kategorilere bağlı işlemleri kategorisiz bırakır (commit etmez)."""
+        for table_name in ("transactions", "recurring_transactions"):
+            self.cursor.execute(f"""
+                UPDATE {table_name} SET category_id = NULL
+                WHERE user_id = ? AND category_id IN (SELECT id FROM categories WHERE id = ? OR merged_into_id = ?)
+            """, (user_id, category_id, category_id))
+
+    def update_transactions_category_to_null(self, category_id, user_id):
+        """Belirli bir kategoriye sahip tüm işlemlerin ve tekrarlayan işlemlerin kategorisini NULL olarak günceller."""
         try:
-            self.cursor.execute("UPDATE transactions SET category = NULL WHERE category = ? AND user_id = ?",
-                                (category_name, user_id))
-            self.conn.commit()
+            self._clear_category_references(category_id, user_id)
+            self._commit()
             return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"İşlemlerin kategorisi NULL olarak güncellenirken hata: {e}")
             return False
 
+    # --- Kategori Kuralları ---
+    def insert_category_rule(self, pattern, category, user_id, is_regex=False, priority=0):
+        """
+        Açıklaması kurala uyan işlemlere kategoriyi doğrudan atayan bir kural ekler.
+        Args:
+            pattern (str): Anahtar kelime (açıklamada geçmesi yeterli) veya düzenli ifade. Büyük/küçük harf ayrılmaz.
+            category (str): Kategori adı; kullanıcının mevcut bir kategorisi olmalıdır.
+            is_regex (bool): True ise pattern düzenli ifade olarak yorumlanır.
+            priority (int): Birden çok kural eşleşirse önceliği yüksek olan kazanır.
+        """
+        error = validate_category_rule(pattern, is_regex)
+        if error:
+            print(f"Hata: '{pattern}' kuralı eklenemedi, {error}.")
+            return False
+        try:
+            self.cursor.execute(
+                f"INSERT INTO category_rules (user_id, pattern, is_regex, category_id, priority) "
+                f"VALUES (?, ?, ?, {CATEGORY_ID_BY_NAME_SQL}, ?)",
+                (user_id, pattern, int(bool(is_regex)), user_id, category, priority))
+            self._invalidate_cache("category_rules", user_id)
+            self._commit()
+            return True
+        except sqlite3.IntegrityError:
+            self._rollback()
+            print(f"Hata: '{category}' kategorisi bulunamadı.")
+            return False
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Kategori kuralı ekleme hatası: {e}")
+            return False
+
+    def get_category_rules(self, user_id):
+        """
+        Kullanıcının kategori kurallarını öncelik sırasıyla getirir. Önbellekten okunur; eşleşme sayıları
+        değiştikçe önbellek boşalmasın diye sayaçlar burada değil get_category_rule_stats'ta döner.
+        Returns:
+            list: (id, pattern, is_regex, kategori adı, priority) satırları.
+        """
+        return self.dimension_cache.get("category_rules", user_id, "all", lambda: self.cursor.execute(
+            f"SELECT id, pattern, is_regex, {_category_name_sql('category_rules')}, priority FROM category_rules "
+            f"WHERE user_id = ? ORDER BY priority DESC, id", (user_id,)).fetchall())
+
+    def get_category_rule_stats(self, user_id):
+        """
+        Kuralları eşleşme sayılarıyla birlikte getirir (kuralları ayarlamak için).
+        Returns:
+            list: (id, pattern, is_regex, kategori adı, priority, hit_count, last_hit_at) satırları.
+        """
+        return self._fetch_all_read(f"""
+            SELECT id, pattern, is_regex, {_category_name_sql('category_rules')}, priority, hit_count, last_hit_at
+            FROM category_rules WHERE user_id = ? ORDER BY priority DESC, id
+        """, (user_id,))
+
+    def delete_category_rule(self, rule_id, user_id):
+        """Bir kategori kuralını siler."""
+        try:
+            self.cursor.execute("DELETE FROM category_rules WHERE id = ? AND user_id = ?", (rule_id, user_id))
+            self._invalidate_cache("category_rules", user_id)
+            self._commit()
+            return self.cursor.rowcount > 0
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Kategori kuralı silme hatası: {e}")
+            return False
+
+    def record_category_rule_hits(self, hits, user_id, callback=None):
+        """
+        Kuralların birikmiş eşleşme sayaçlarını tek bir UPDATE ile artırır. Yazma kuyruğu açıksa kuyruğa gider
+        (bkz. _submit_write). Tahmin sırasında çağrılmaz; AIPredictor sayaçları biriktirip toplu yazar.
+        Args:
+            hits (dict): Kural ID'si -> eşleşme sayısı.
+        Returns:
+            Future: Yazma tamamlandığında sonuçlanır.
+        """
+        return self._submit_write("""
+            UPDATE category_rules SET hit_count = hit_count + hit.value, last_hit_at = CURRENT_TIMESTAMP
+            FROM json_each(?) AS hit
+            WHERE category_rules.id = CAST(hit.key AS INTEGER) AND category_rules.user_id = ?
+        """, (json.dumps({str(rule_id): count for rule_id, count in hits.items()}), user_id), callback)
+
     # --- Tekrarlayan İşlemler Yönetimi ---
     def insert_recurring_transaction(self, type, amount, category, description, start_date, last_generated_date,
                                      user_id):
         """Yeni bir tekrarlayan işlem ekler."""
         try:
+            self._ensure_category(category, type, user_id)
             self.cursor.execute(
-                "INSERT INTO recurring_transactions (user_id, description, amount, type, category, start_date, last_generated_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (user_id, description, amount, type, category, start_date, last_generated_date))
-            self.conn.commit()
+                f"INSERT INTO recurring_transactions (user_id, description, amount, type, category_id, start_date, last_generated_date) "
+                f"VALUES (?, ?, ?, ?, {CATEGORY_ID_BY_NAME_SQL}, ?, ?)",
+                (user_id, description, tl_to_kurus(amount), type, user_id, category, start_date, last_generated_date))
+            self._commit()
             return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tekrarlayan işlem ekleme hatası: {e}")
             return False
 
     def get_recurring_transactions(self, user_id):
         """Belirli bir kullanıcıya ait tüm tekrarlayan işlemleri getirir."""
         self.cursor.execute(
-            "SELECT id, type, amount, category, description, start_date, frequency, last_generated_date FROM recurring_transactions WHERE user_id = ?",
+            f"SELECT id, type, amount / 100.0, {_category_name_sql('recurring_transactions')}, description, start_date, "
+            f"frequency, last_generated_date FROM recurring_transactions WHERE user_id = ?",
             (user_id,))
         return self.cursor.fetchall()
 
     def update_recurring_transaction(self, rec_id, type, amount, category, description, start_date, frequency, user_id):
         """Mevcut bir tekrarlayan işlemi günceller."""
         try:
+            self._ensure_category(category, type, user_id)
             self.cursor.execute(
-                "UPDATE recurring_transactions SET type = ?, amount = ?, category = ?, description = ?, start_date = ?, frequency = ? WHERE id = ? AND user_id = ?",
-                (type, amount, category, description, start_date, frequency, rec_id, user_id))
-            self.conn.commit()
+                f"UPDATE recurring_transactions SET type = ?, amount = ?, category_id = {CATEGORY_ID_BY_NAME_SQL}, "
+                f"description = ?, start_date = ?, frequency = ? WHERE id = ? AND user_id = ?",
+                (type, tl_to_kurus(amount), user_id, category, description, start_date, frequency, rec_id, user_id))
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tekrarlayan işlem güncelleme hatası: {e}")
             return False
 
@@ -372,9 +2548,10 @@ class DatabaseManager:
         try:
             self.cursor.execute("UPDATE recurring_transactions SET last_generated_date = ? WHERE id = ?",
                                 (new_last_generated_date, rec_id))
-            self.conn.commit()
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tekrarlayan işlem son üretilme tarihi güncelleme hatası: {e}")
             return False
 
@@ -382,9 +2559,10 @@ class DatabaseManager:
         """Bir tekrarlayan işlemi siler."""
         try:
             self.cursor.execute("DELETE FROM recurring_transactions WHERE id = ? AND user_id = ?", (rec_id, user_id))
-            self.conn.commit()
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tekrarlayan işlem silme hatası: {e}")
             return False
 
@@ -394,20 +2572,22 @@ class DatabaseManager:
         try:
             self.cursor.execute(
                 "INSERT INTO savings_goals (user_id, goal_name, target_amount, current_amount, target_date, description) VALUES (?, ?, ?, ?, ?, ?)",
-                (user_id, goal_name, target_amount, current_amount, target_date, description))
-            self.conn.commit()
+                (user_id, goal_name, tl_to_kurus(target_amount), tl_to_kurus(current_amount), target_date, description))
+            self._commit()
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             print(f"Hata: '{goal_name}' adında bir hedef zaten mevcut.")
             return False
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tasarruf hedefi ekleme hatası: {e}")
             return False
 
     def get_savings_goals(self, user_id):
         """Belirli bir kullanıcıya ait tüm tasarruf hedeflerini getirir."""
         self.cursor.execute(
-            "SELECT id, goal_name, target_amount, current_amount, target_date, description, status FROM savings_goals WHERE user_id = ?",
+            "SELECT id, goal_name, target_amount / 100.0, current_amount / 100.0, target_date, description, status FROM savings_goals WHERE user_id = ?",
             (user_id,))
         return self.cursor.fetchall()
 
@@ -416,10 +2596,12 @@ class DatabaseManager:
         try:
             self.cursor.execute(
                 "UPDATE savings_goals SET goal_name = ?, target_amount = ?, current_amount = ?, target_date = ?, description = ? WHERE id = ? AND user_id = ?",
-                (goal_name, target_amount, current_amount, target_date, description, goal_id, user_id))
-            self.conn.commit()
+                (goal_name, tl_to_kurus(target_amount), tl_to_kurus(current_amount), target_date, description, goal_id,
+                 user_id))
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tasarruf hedefi güncelleme hatası: {e}")
             return False
 
@@ -428,9 +2610,10 @@ class DatabaseManager:
         try:
             self.cursor.execute("UPDATE savings_goals SET status = ? WHERE id = ? AND user_id = ?",
                                 (new_status, goal_id, user_id))
-            self.conn.commit()
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tasarruf hedefi durumu güncelleme hatası: {e}")
             return False
 
@@ -438,9 +2621,10 @@ class DatabaseManager:
         """Bir tasarruf hedefini siler."""
         try:
             self.cursor.execute("DELETE FROM savings_goals WHERE id = ? AND user_id = ?", (goal_id, user_id))
-            self.conn.commit()
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Tasarruf hedefi silme hatası: {e}")
             return False
 
@@ -450,262 +2634,675 @@ class DatabaseManager:
         try:
             self.cursor.execute("INSERT INTO customers (user_id, name, address, phone, email) VALUES (?, ?, ?, ?, ?)",
                                 (user_id, name, address, phone, email))
-            self.conn.commit()
+            self._invalidate_cache("customers", user_id)
+            self._commit()
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             print(f"Hata: '{name}' adında bir müşteri zaten mevcut.")
             return False
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Müşteri ekleme hatası: {e}")
             return False
 
     def get_customers(self, user_id):
-        """Belirli bir kullanıcıya ait tüm müşterileri getirir."""
-        self.cursor.execute("SELECT id, name, address, phone, email FROM customers WHERE user_id = ? ORDER BY name",
-                            (user_id,))
-        return self.cursor.fetchall()
+        """Belirli bir kullanıcıya ait tüm müşterileri getirir. Önbellekten okunur."""
+        return self.dimension_cache.get("customers", user_id, "all", lambda: self.cursor.execute(
+            "SELECT id, name, address, phone, email FROM customers WHERE user_id = ? ORDER BY name",
+            (user_id,)).fetchall())
 
     def get_customer_by_name(self, name, user_id):
-        """İsimle müşteri bilgilerini getirir."""
-        self.cursor.execute("SELECT id, name, address, phone, email FROM customers WHERE name = ? AND user_id = ?",
-                            (name, user_id))
-        return self.cursor.fetchone()
+        """İsimle müşteri bilgilerini getirir. Önbellekten okunur."""
+        return self.dimension_cache.get("customers", user_id, ("name", name), lambda: self.cursor.execute(
+            "SELECT id, name, address, phone, email FROM customers WHERE name = ? AND user_id = ?",
+            (name, user_id)).fetchone())
+
+    def get_customer_by_id(self, customer_id, user_id):
+        """ID ile müşteri bilgilerini getirir. Önbellekten okunur."""
+        return self.dimension_cache.get("customers", user_id, ("id", customer_id), lambda: self.cursor.execute(
+            "SELECT id, name, address, phone, email FROM customers WHERE id = ? AND user_id = ?",
+            (customer_id, user_id)).fetchone())
+
+    def get_customer_summaries(self, user_id):
+        """
+        Müşteri bazında belge sayısı, ciro ve açık bakiyeyi getirir. Ciro iptal edilmemiş faturaların,
+        açık bakiye ise ödenmemiş ve iptal edilmemiş faturaların KDV dahil toplamıdır.
+        Returns:
+            list: (müşteri ID, müşteri adı, belge sayısı, ciro TL, açık bakiye TL) satırları, ada göre sıralı.
+        """
+        return self._fetch_all_read("""
+            SELECT c.id, c.name, COUNT(io.id),
+                   IFNULL(SUM(CASE WHEN io.type = 'Fatura' AND io.status != 'İptal Edildi'
+                                   THEN io.total_amount_with_kdv END), 0) / 100.0,
+                   IFNULL(SUM(CASE WHEN io.type = 'Fatura' AND io.status NOT IN ('Ödendi', 'İptal Edildi')
+                                   THEN io.total_amount_with_kdv END), 0) / 100.0
+            FROM customers c
+            LEFT JOIN invoices_offers io ON io.customer_id = c.id
+            WHERE c.user_id = ?
+            GROUP BY c.id
+            ORDER BY c.name
+        """, (user_id,))
 
     def update_customer(self, customer_id, name, address, phone, email, user_id):
-        """Mevcut bir müşteriyi günceller."""
+        """Mevcut bir müşteriyi günceller. Faturalar müşteriye ID ile bağlı olduğundan yeni ad hepsinde görünür."""
         try:
             self.cursor.execute(
                 "UPDATE customers SET name = ?, address = ?, phone = ?, email = ? WHERE id = ? AND user_id = ?",
                 (name, address, phone, email, customer_id, user_id))
-            self.conn.commit()
+            self._invalidate_cache("customers", user_id)
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Müşteri güncelleme hatası: {e}")
             return False
 
     def delete_customer(self, customer_id, user_id):
-        """Bir müşteriyi siler."""
+        """Bir müşteriyi siler. Fatura/teklifi bulunan müşteriler silinmez."""
         try:
-            self.cursor.execute("DELETE FROM customers WHERE id = ? AND user_id = ?", (customer_id, user_id))
-            self.conn.commit()
+            self.cursor.execute("""
+                DELETE FROM customers
+                WHERE id = ? AND user_id = ? AND NOT EXISTS (SELECT 1 FROM invoices_offers WHERE customer_id = customers.id)
+            """, (customer_id, user_id))
+            self._invalidate_cache("customers", user_id)
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Müşteri silme hatası: {e}")
             return False
 
-    def count_invoices_by_customer(self, customer_name, user_id):
+    def count_invoices_by_customer(self, customer_id, user_id):
         """Belirli bir müşteriye ait fatura/teklif sayısını döner."""
-        self.cursor.execute("SELECT COUNT(*) FROM invoices_offers WHERE customer_name = ? AND user_id = ?",
-                            (customer_name, user_id))
+        self.cursor.execute("SELECT COUNT(*) FROM invoices_offers WHERE customer_id = ? AND user_id = ?",
+                            (customer_id, user_id))
         return self.cursor.fetchone()[0]
 
-    def update_invoice_customer_name(self, old_customer_name, new_customer_name, user_id):
-        """Müşteri adı değiştiğinde ilgili fatura/teklifleri günceller."""
-        try:
-            self.cursor.execute("UPDATE invoices_offers SET customer_name = ? WHERE customer_name = ? AND user_id = ?",
-                                (new_customer_name, old_customer_name, user_id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
-        except sqlite3.Error as e:
-            print(f"Fatura müşteri adı güncelleme hatası: {e}")
-            return False
-
     # --- Ürün/Hizmet Yönetimi ---
     def insert_product(self, name, stock, purchase_price, selling_price, kdv_rate, user_id):
-        """Yeni bir ürün/hizmet ekler."""
+        """Yeni bir ürün/hizmet ekler. Başlangıç stoğu deftere 'Açılış' hareketi olarak yazılır."""
         try:
+            purchase_price = tl_to_kurus(purchase_price)
             self.cursor.execute(
-                "INSERT INTO products (user_id, name, stock, purchase_price, selling_price, kdv_rate) VALUES (?, ?, ?, ?, ?, ?)",
-                (user_id, name, stock, purchase_price, selling_price, kdv_rate))
-            self.conn.commit()
+                "INSERT INTO products (user_id, name, stock, purchase_price, selling_price, kdv_rate) VALUES (?, ?, 0, ?, ?, ?)",
+                (user_id, name, purchase_price, tl_to_kurus(selling_price), kdv_rate))
+            if stock:
+                self.cursor.execute("""
+                    INSERT INTO stock_movements (user_id, product_id, quantity, unit_cost, movement_type)
+                    VALUES (?, ?, ?, ?, 'Açılış')
+                """, (user_id, self.cursor.lastrowid, stock, purchase_price))
+            self._invalidate_cache("products", user_id)
+            self._commit()
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             print(f"Hata: '{name}' adında bir ürün/hizmet zaten mevcut.")
             return False
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Ürün/hizmet ekleme hatası: {e}")
             return False
 
     def get_products(self, user_id):
-        """Belirli bir kullanıcıya ait tüm ürünleri/hizmetleri getirir."""
-        self.cursor.execute(
-            "SELECT id, name, stock, purchase_price, selling_price, kdv_rate FROM products WHERE user_id = ? ORDER BY name",
-            (user_id,))
-        return self.cursor.fetchall()
+        """Belirli bir kullanıcıya ait tüm ürünleri/hizmetleri getirir. Önbellekten okunur."""
+        return self.dimension_cache.get("products", user_id, "all", lambda: self.cursor.execute(
+            "SELECT id, name, stock, purchase_price / 100.0, selling_price / 100.0, kdv_rate FROM products WHERE user_id = ? ORDER BY name",
+            (user_id,)).fetchall())
 
     def get_product_by_name(self, name, user_id):
-        """İsimle ürün/hizmet bilgilerini getirir."""
-        self.cursor.execute(
-            "SELECT id, name, stock, purchase_price, selling_price, kdv_rate FROM products WHERE name = ? AND user_id = ?",
-            (name, user_id))
-        return self.cursor.fetchone()
+        """İsimle ürün/hizmet bilgilerini getirir. Önbellekten okunur."""
+        return self.dimension_cache.get("products", user_id, ("name", name), lambda: self.cursor.execute(
+            "SELECT id, name, stock, purchase_price / 100.0, selling_price / 100.0, kdv_rate FROM products WHERE name = ? AND user_id = ?",
+            (name, user_id)).fetchone())
 
-    def update_product(self, product_id, name, stock, purchase_price, selling_price, kdv_rate, user_id):
-        """Mevcut bir ürün/hizmeti günceller."""
+    def update_product(self, product_id, name, stock, purchase_price, selling_price, kdv_rate, user_id,
+                       previous_stock=None):
+        """
+        Mevcut bir ürün/hizmeti günceller. Stok farkı deftere 'Düzeltme' hareketi olarak yazılır.
+        previous_stock verilirse (formun yüklendiği andaki stok) yalnızca kullanıcının yaptığı değişiklik uygulanır;
+        böylece form açıkken kaydedilen faturaların stok düşümleri ezilmez. Verilmezse stok doğrudan `stock` yapılır.
+        """
         try:
             self.cursor.execute(
-                "UPDATE products SET name = ?, stock = ?, purchase_price = ?, selling_price = ?, kdv_rate = ? WHERE id = ? AND user_id = ?",
-                (name, stock, purchase_price, selling_price, kdv_rate, product_id, user_id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+                "UPDATE products SET name = ?, purchase_price = ?, selling_price = ?, kdv_rate = ? WHERE id = ? AND user_id = ?",
+                (name, tl_to_kurus(purchase_price), tl_to_kurus(selling_price), kdv_rate, product_id, user_id))
+            if self.cursor.rowcount == 0:
+                return False
+            self._invalidate_cache("products", user_id)
+            if previous_stock is None:
+                self._insert_stock_adjustment(product_id, "? - stock", (stock,))
+            elif stock != previous_stock:
+                self._insert_stock_adjustment(product_id, "?", (stock - previous_stock,))
+            self._commit()
+            return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Ürün/hizmet güncelleme hatası: {e}")
             return False
 
     def update_product_stock(self, product_id, new_stock):
-        """Bir ürünün stok miktarını günceller."""
+        """Bir ürünün stok miktarını, farkı deftere 'Düzeltme' hareketi olarak yazarak günceller."""
         try:
-            self.cursor.execute("UPDATE products SET stock = ? WHERE id = ?", (new_stock, product_id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            self.cursor.execute("SELECT user_id FROM products WHERE id = ?", (product_id,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return False
+            self._insert_stock_adjustment(product_id, "? - stock", (new_stock,))
+            self._invalidate_cache("products", row[0])
+            self._commit()
+            return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Ürün stok güncelleme hatası: {e}")
             return False
 
+    def _insert_stock_adjustment(self, product_id, quantity_sql, params):
+        """
+        Ürün için miktarı `quantity_sql` ifadesiyle veritabanında hesaplanan bir 'Düzeltme' hareketi ekler
+        (commit etmez). İfade products satırı üzerinde değerlendirilir; sıfır farklar deftere yazılmaz.
+        """
+        self.cursor.execute(f"""
+            INSERT INTO stock_movements (user_id, product_id, quantity, unit_cost, movement_type)
+            SELECT user_id, id, delta, CASE WHEN delta > 0 THEN purchase_price END, 'Düzeltme'
+            FROM (SELECT user_id, id, purchase_price, {quantity_sql} AS delta FROM products WHERE id = ?)
+            WHERE delta != 0
+        """, (*params, product_id))
+
+    def apply_stock_movements(self, movements, user_id, movement_type="Düzeltme", movement_date=None,
+                              document_number=None):
+        """
+        Birden çok ürünün stok hareketini tek bir INSERT ile deftere yazar; products.stock tetikleyiciyle
+        veritabanı içinde artırılıp azaltılır. Aynı ürün birden fazla kez geçerse miktarlar toplanır;
+        kullanıcıya ait ürünlerde bulunmayan adlar (örn: hizmet kalemleri) yok sayılır. Girişler ürünün
+        güncel alış fiyatıyla maliyetlendirilir.
+        Fatura kaydı, güncellemesi ve silinmesinde kalem başına ayrı sorgu ve commit yapılmasını önler.
+        Args:
+            movements (iterable): (ürün adı, stok değişimi) çiftleri; düşüm için negatif miktar verilir.
+            user_id (int): Kullanıcı ID'si.
+            movement_type (str): Hareket türü (örn: 'Satış', 'Satış İptali', 'Düzeltme').
+            movement_date (str, optional): YYYY-MM-DD. Varsayılan: bugün.
+            document_number (str, optional): İlgili belge numarası.
+        Returns:
+            bool: Başarılıysa True.
+        """
+        deltas = {}
+        for product_name, quantity in movements:
+            deltas[product_name] = deltas.get(product_name, 0) + quantity
+        deltas = {product_name: delta for product_name, delta in deltas.items() if delta}
+        if not deltas:
+            return True
+        try:
+            # MATERIALIZED: hareketler bir kez okunur ve her biri için ürün (user_id, name) indeksiyle bulunur
+            self.cursor.execute("""
+                WITH movement AS MATERIALIZED (SELECT key AS name, value AS delta FROM json_each(?))
+                INSERT INTO stock_movements (user_id, product_id, movement_date, quantity, unit_cost, movement_type,
+                                             document_number)
+                SELECT products.user_id, products.id, IFNULL(?, date('now', 'localtime')), movement.delta,
+                       CASE WHEN movement.delta > 0 THEN products.purchase_price END, ?, ?
+                FROM movement
+                JOIN products ON products.user_id = ? AND products.name = movement.name
+            """, (json.dumps(deltas), movement_date, movement_type, document_number, user_id))
+            self._invalidate_cache("products", user_id)
+            self._commit()
+            return True
+        except sqlite3.Error as e:
+            self._rollback()
+            print(f"Toplu stok güncelleme hatası: {e}")
+            return False
+
+    def get_stock_movements(self, product_id, user_id):
+        """
+        Bir ürünün stok hareketlerini tarih sırasıyla getirir.
+        (id, tarih, miktar, birim maliyet TL, hareket türü, belge numarası)
+        """
+        return self._fetch_all_read("""
+            SELECT id, movement_date, quantity, unit_cost / 100.0, movement_type, document_number
+            FROM stock_movements WHERE user_id = ? AND product_id = ?
+            ORDER BY movement_date, id
+        """, (user_id, product_id))
+
+    def get_stock_on_date(self, user_id, as_of_date):
+        """
+        Kullanıcının ürünlerinin verilen gün sonundaki stok miktarlarını defterden hesaplar.
+        Returns:
+            list: (ürün ID, ürün adı, stok) satırları, ada göre sıralı.
+        """
+        return self._fetch_all_read("""
+            SELECT id, name, IFNULL((SELECT SUM(quantity) FROM stock_movements
+                                     WHERE product_id = products.id AND movement_date <= ?), 0)
+            FROM products WHERE user_id = ? ORDER BY name
+        """, (as_of_date, user_id))
+
+    def get_stock_valuation(self, user_id, as_of_date=None, method="fifo"):
+        """
+        Verilen gün sonundaki stokların maliyet değerini defterden FIFO veya ağırlıklı ortalama yöntemiyle hesaplar.
+        Args:
+            user_id (int): Kullanıcı ID'si.
+            as_of_date (str, optional): YYYY-MM-DD. Varsayılan: bugün.
+            method (str): 'fifo' veya 'average'.
+        Returns:
+            list: (ürün ID, ürün adı, miktar, maliyet değeri TL, birim maliyet TL) satırları, ada göre sıralı.
+        """
+        if method not in STOCK_VALUATION_METHODS:
+            raise ValueError(f"Geçersiz değerleme yöntemi: {method!r}")
+        as_of_date = as_of_date or datetime.now().strftime('%Y-%m-%d')
+        rows = self._fetch_all_read("""
+            SELECT product_id, quantity, unit_cost FROM stock_movements
+            WHERE user_id = ? AND movement_date <= ?
+            ORDER BY product_id, movement_date, id
+        """, (user_id, as_of_date))
+        movements_by_product = {}
+        for product_id, quantity, unit_cost in rows:
+            movements_by_product.setdefault(product_id, []).append((quantity, unit_cost))
+
+        report = []
+        for product_id, name in self._fetch_all_read("SELECT id, name FROM products WHERE user_id = ? ORDER BY name",
+                                                     (user_id,)):
+            if product_id not in movements_by_product:
+                continue
+            quantity, value = value_stock_movements(movements_by_product[product_id], method)
+            unit_cost = kurus_to_tl(round(value / quantity)) if quantity > 0 else 0.0
+            report.append((product_id, name, quantity, kurus_to_tl(value), unit_cost))
+        return report
+
     def delete_product(self, product_id, user_id):
-        """Bir ürün/hizmeti siler."""
+        """Bir ürün/hizmeti ve stok hareketlerini siler."""
         try:
             self.cursor.execute("DELETE FROM products WHERE id = ? AND user_id = ?", (product_id, user_id))
-            self.conn.commit()
+            self._invalidate_cache("products", user_id)
+            self._commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Ürün/hizmet silme hatası: {e}")
             return False
 
     # --- Fatura/Teklif Yönetimi ---
-    def insert_invoice_offer(self, type, document_number, customer_name, document_date, due_validity_date,
-                             items_json, total_excl_kdv, total_kdv_amount, notes, status, user_id):
-        """Yeni bir fatura veya teklif ekler."""
+    def _insert_invoice_items(self, invoice_offer_id, items, user_id):
+        """
+        Belgenin kalemlerini invoice_items tablosuna ekler (commit etmez).
+        Args:
+            items (list): 'ad', 'miktar', 'birim_fiyat', 'kdv_orani', 'kdv_miktari', 'ara_toplam' anahtarlı sözlükler.
+        """
+        self.cursor.executemany("""
+            INSERT INTO invoice_items (invoice_offer_id, line_no, product_id, product_name, quantity, unit_price,
+                                       kdv_rate, kdv_amount, line_total)
+            VALUES (?, ?, (SELECT id FROM products WHERE user_id = ? AND name = ?), ?, ?, ?, ?, ?, ?)
+        """, [(invoice_offer_id, line_no, user_id, item["ad"], item["ad"], float(item.get("miktar", 0)),
+               tl_to_kurus(item.get("birim_fiyat", 0)), float(item.get("kdv_orani", 0)),
+               tl_to_kurus(item.get("kdv_miktari", 0)), tl_to_kurus(item.get("ara_toplam", 0)))
+              for line_no, item in enumerate(items, start=1)])
+
+    def insert_invoice_offer(self, type, document_number, customer_id, document_date, due_validity_date,
+                             items, total_excl_kdv, total_kdv_amount, notes, status, user_id):
+        """Yeni bir fatura veya teklifi kalemleriyle birlikte tek bir işlemde ekler."""
         try:
+            total_excl_kdv, total_kdv_amount = tl_to_kurus(total_excl_kdv), tl_to_kurus(total_kdv_amount)
             total_with_kdv = total_excl_kdv + total_kdv_amount
             self.cursor.execute("""
-                INSERT INTO invoices_offers (user_id, type, document_number, customer_name, document_date, 
-                                            due_validity_date, items_json, total_amount_excluding_kdv, 
-                                            total_kdv_amount, total_amount_with_kdv, notes, status) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                                (user_id, type, document_number, customer_name, document_date, due_validity_date,
-                                 items_json, total_excl_kdv, total_kdv_amount, total_with_kdv, notes, status))
-            self.conn.commit()
+                INSERT INTO invoices_offers (user_id, type, document_number, customer_id, document_date,
+                                            due_validity_date, total_amount_excluding_kdv,
+                                            total_kdv_amount, total_amount_with_kdv, notes, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                                (user_id, type, document_number, customer_id, document_date, due_validity_date,
+                                 total_excl_kdv, total_kdv_amount, total_with_kdv, notes, status))
+            self._insert_invoice_items(self.cursor.lastrowid, items, user_id)
+            self._commit()
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             print(f"Hata: '{document_number}' belge numarası zaten mevcut.")
             return False
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Fatura/Teklif ekleme hatası: {e}")
             return False
 
     def get_invoice_offers(self, user_id):
         """Belirli bir kullanıcıya ait tüm fatura/teklifleri getirir."""
         self.cursor.execute("""
-            SELECT id, type, document_number, customer_name, total_amount_excluding_kdv, 
-                   total_amount_with_kdv, document_date, status, notes
-            FROM invoices_offers 
-            WHERE user_id = ? ORDER BY document_date DESC, document_number DESC
+            SELECT io.id, io.type, io.document_number, c.name, io.total_amount_excluding_kdv / 100.0,
+                   io.total_amount_with_kdv / 100.0, io.document_date, io.status, io.notes
+            FROM invoices_offers io
+            JOIN customers c ON c.id = io.customer_id
+            WHERE io.user_id = ? ORDER BY io.document_date DESC, io.document_number DESC
         """, (user_id,))
         return self.cursor.fetchall()
 
     def get_invoice_offer_by_id(self, invoice_offer_id, user_id):
-        """Belge ID'sine göre fatura/teklif detaylarını getirir."""
+        """
+        Belge ID'sine göre fatura/teklif detaylarını getirir.
+        Returns:
+            tuple or None: (id, type, document_number, customer_name, document_date, due_validity_date, kalemler,
+                            total_excl_kdv, total_kdv, total_with_kdv, notes, status, customer_id); kalemler
+                            get_invoice_items biçiminde bir listedir.
+        """
         self.cursor.execute("""
-            SELECT id, type, document_number, customer_name, document_date, due_validity_date, 
-                   items_json, total_amount_excluding_kdv, total_kdv_amount, total_amount_with_kdv, notes, status
-            FROM invoices_offers 
-            WHERE id = ? AND user_id = ?
+            SELECT io.id, io.type, io.document_number, c.name, io.document_date, io.due_validity_date,
+                   io.total_amount_excluding_kdv / 100.0, io.total_kdv_amount / 100.0,
+                   io.total_amount_with_kdv / 100.0, io.notes, io.status, io.customer_id
+            FROM invoices_offers io
+            JOIN customers c ON c.id = io.customer_id
+            WHERE io.id = ? AND io.user_id = ?
         """, (invoice_offer_id, user_id))
-        return self.cursor.fetchone()
+        header = self.cursor.fetchone()
+        if header is None:
+            return None
+        return header[:6] + (self.get_invoice_items(header[0]),) + header[6:]
 
-    def update_invoice_offer(self, invoice_offer_id, type, document_number, customer_name, document_date,
-                             due_validity_date, items_json, total_excl_kdv, total_kdv_amount, notes, status, user_id):
-        """Mevcut bir fatura veya teklifi günceller."""
+    def get_invoice_items(self, invoice_offer_id):
+        """Belgenin kalemlerini belge sırasıyla, PDF ve arayüzün kullandığı sözlük biçiminde getirir."""
+        self.cursor.execute("""
+            SELECT product_name, quantity, unit_price / 100.0, kdv_rate, kdv_amount / 100.0, line_total / 100.0
+            FROM invoice_items WHERE invoice_offer_id = ? ORDER BY line_no
+        """, (invoice_offer_id,))
+        return [{"ad": name, "miktar": quantity, "birim_fiyat": unit_price, "kdv_orani": kdv_rate,
+                 "kdv_miktari": kdv_amount, "ara_toplam": line_total}
+                for name, quantity, unit_price, kdv_rate, kdv_amount, line_total in self.cursor.fetchall()]
+
+    def update_invoice_offer(self, invoice_offer_id, type, document_number, customer_id, document_date,
+                             due_validity_date, items, total_excl_kdv, total_kdv_amount, notes, status, user_id):
+        """Mevcut bir fatura veya teklifi günceller; kalemleri tek bir işlemde yenileriyle değiştirir."""
         try:
+            total_excl_kdv, total_kdv_amount = tl_to_kurus(total_excl_kdv), tl_to_kurus(total_kdv_amount)
             total_with_kdv = total_excl_kdv + total_kdv_amount
             self.cursor.execute("""
-                UPDATE invoices_offers SET type = ?, document_number = ?, customer_name = ?, document_date = ?, 
-                                         due_validity_date = ?, items_json = ?, total_amount_excluding_kdv = ?, 
-                                         total_kdv_amount = ?, total_amount_with_kdv = ?, notes = ?, status = ? 
+                UPDATE invoices_offers SET type = ?, document_number = ?, customer_id = ?, document_date = ?,
+                                         due_validity_date = ?, total_amount_excluding_kdv = ?,
+                                         total_kdv_amount = ?, total_amount_with_kdv = ?, notes = ?, status = ?
                 WHERE id = ? AND user_id = ?""",
-                                (type, document_number, customer_name, document_date, due_validity_date,
-                                 items_json, total_excl_kdv, total_kdv_amount, total_with_kdv, notes, status,
+                                (type, document_number, customer_id, document_date, due_validity_date,
+                                 total_excl_kdv, total_kdv_amount, total_with_kdv, notes, status,
                                  invoice_offer_id, user_id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            if self.cursor.rowcount == 0:
+                return False
+            self.cursor.execute("DELETE FROM invoice_items WHERE invoice_offer_id = ?", (invoice_offer_id,))
+            self._insert_invoice_items(invoice_offer_id, items, user_id)
+            self._commit()
+            return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Fatura/Teklif güncelleme hatası: {e}")
             return False
 
     def delete_invoice_offer(self, invoice_offer_id, user_id):
-        """Bir fatura veya teklifi siler."""
+        """Bir fatura veya teklifi kalemleriyle birlikte siler."""
         try:
             self.cursor.execute("DELETE FROM invoices_offers WHERE id = ? AND user_id = ?", (invoice_offer_id, user_id))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            if self.cursor.rowcount == 0:
+                return False
+            self.cursor.execute("DELETE FROM invoice_items WHERE invoice_offer_id = ?", (invoice_offer_id,))
+            self._commit()
+            return True
         except sqlite3.Error as e:
+            self._rollback()
             print(f"Fatura/Teklif silme hatası: {e}")
             return False
 
     def get_total_sales_kdv(self, start_date, end_date, user_id):
-        """Belirli bir tarih aralığındaki toplam satış KDV'sini hesaplar."""
+        """Belirli bir tarih aralığındaki toplam satış KDV'sini hesaplar. Sonuç veri sürümüne göre önbelleğe alınır."""
         query = """
             SELECT SUM(total_kdv_amount) FROM invoices_offers 
             WHERE user_id = ? AND type = 'Fatura' AND document_date BETWEEN ? AND ?
         """
-        self.cursor.execute(query, (user_id, start_date, end_date))
-        result = self.cursor.fetchone()[0]
-        return result if result is not None else 0.0
 
-    def get_invoice_jsons_for_tax_report(self, start_date, end_date, user_id):
-        """Vergi raporu için faturalardaki kalem JSON'larını getirir."""
-        query = """
-            SELECT items_json FROM invoices_offers
-            WHERE user_id = ? AND type = 'Fatura' AND document_date BETWEEN ? AND ?
+        def compute():
+            result = self._fetch_one_read(query, (user_id, start_date, end_date))[0]
+            return kurus_to_tl(result) if result is not None else 0.0
+        return self.cached_report(user_id, "total_sales_kdv", (start_date, end_date), compute)
+
+    def get_sales_kdv_by_rate(self, start_date, end_date, user_id):
         """
-        self.cursor.execute(query, (user_id, start_date, end_date))
-        return self.cursor.fetchall()
+        Belirli tarih aralığındaki faturalarda hesaplanan KDV'yi orana göre gruplar.
+        Sonuç veri sürümüne göre önbelleğe alınır.
+        Returns:
+            list: (kdv oranı, KDV tutarı TL) satırları, orana göre artan sırada.
+        """
+        return self.cached_report(user_id, "sales_kdv_by_rate", (start_date, end_date), lambda: self._fetch_all_read("""
+            SELECT ii.kdv_rate, SUM(ii.kdv_amount) / 100.0
+            FROM invoices_offers io
+            JOIN invoice_items ii ON ii.invoice_offer_id = io.id
+            WHERE io.user_id = ? AND io.type = 'Fatura' AND io.document_date BETWEEN ? AND ?
+            GROUP BY ii.kdv_rate
+            ORDER BY ii.kdv_rate
+        """, (user_id, start_date, end_date)))
+
+    def get_product_sales(self, start_date, end_date, user_id):
+        """
+        Belirli tarih aralığındaki faturalara göre ürün bazında satış özetini getirir.
+        Sonuç veri sürümüne göre önbelleğe alınır.
+        Returns:
+            list: (ürün adı, satılan miktar, KDV hariç satış TL, KDV TL) satırları, satış tutarına göre azalan.
+        """
+        return self.cached_report(user_id, "product_sales", (start_date, end_date), lambda: self._fetch_all_read("""
+            SELECT ii.product_name, SUM(ii.quantity), SUM(ii.line_total - ii.kdv_amount) / 100.0 AS net_sales,
+                   SUM(ii.kdv_amount) / 100.0
+            FROM invoices_offers io
+            JOIN invoice_items ii ON ii.invoice_offer_id = io.id
+            WHERE io.user_id = ? AND io.type = 'Fatura' AND io.document_date BETWEEN ? AND ?
+            GROUP BY ii.product_name
+            ORDER BY net_sales DESC
+        """, (user_id, start_date, end_date)))
 
     # --- Raporlama ve AI için Yeni Metotlar ---
     def get_all_transactions_for_ai_training(self, user_id):
         """AI modeli eğitimi için tüm gelir ve gider işlemlerini kategori ve açıklama ile birlikte getirir."""
         # Kategori NULL olmayan ve geçerli açıklama olanları al
-        self.cursor.execute("""
-            SELECT description, category, type FROM transactions 
-            WHERE user_id = ? AND category IS NOT NULL AND description IS NOT NULL AND description != ''
+        return self._fetch_all_read(f"""
+            SELECT description, {_category_name_sql('transactions')}, type FROM transactions
+            WHERE user_id = ? AND category_id IS NOT NULL AND description IS NOT NULL AND description != ''
         """, (user_id,))
-        return self.cursor.fetchall()
 
-    def get_monthly_balance_trend(self, user_id, num_months=12):
-        """Son N aydaki aylık kümülatif bakiye trendini getirir."""
+    def get_ai_training_rows_since(self, user_id, after_id=0):
+        """
+        AI modelinin (artımlı) eğitimi için ID'si after_id'den büyük etiketli işlemleri ID sırasıyla getirir.
+        Modelin eğitildiği son işlem ID'si filigran olarak saklanır; sonraki eğitimde yalnızca yeni satırlar okunur.
+        Returns:
+            list: (id, description, category) satırları.
+        """
+        return self._fetch_all_read(f"""
+            SELECT id, description, {_category_name_sql('transactions')} FROM transactions
+            WHERE user_id = ? AND id > ? AND category_id IS NOT NULL AND description IS NOT NULL AND description != ''
+            ORDER BY id
+        """, (user_id, after_id))
+
+    @staticmethod
+    def _month_window_start(num_months):
+        """İçinde bulunulan ay dahil son N takvim ayının ilk ayını 'YYYY-MM' olarak döner."""
         today = datetime.now().date()
-        start_date_limit = (today - timedelta(days=num_months * 30)).strftime('%Y-%m-%d')  # Yaklaşık N ay öncesi
+        month_index = today.year * 12 + today.month - 1 - (num_months - 1)
+        return f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
 
-        self.cursor.execute(
-            "SELECT date, type, amount FROM transactions WHERE user_id = ? AND date >= ? ORDER BY date ASC",
-            (user_id, start_date_limit))
-        transactions = self.cursor.fetchall()
-        return transactions  # Dataframe'e çevrilmesi ve hesaplama fingo_app.py'de yapılmalı
+    def get_monthly_balance_trend(self, user_id, num_months=12):
+        """
+        İçinde bulunulan ay dahil son N ayın aylık bakiye trendini aylık özet tablosundan hesaplar.
+        Pencere öncesindeki işlemler açılış bakiyesine eklenir; işlem olmayan aylar da listede yer alır.
+        Sonuç veri sürümüne göre önbelleğe alınır.
+        Returns:
+            list: (year_month, aylık net değişim, ay sonu bakiyesi) satırları, eskiden yeniye. İşlem yoksa boş liste.
+        """
+        start_month = self._month_window_start(num_months)
+        return self.cached_report(user_id, "monthly_balance_trend", (start_month, num_months),
+                                  lambda: self._compute_monthly_balance_trend(user_id, start_month, num_months))
+
+    def _compute_monthly_balance_trend(self, user_id, start_month, num_months):
+        with self.read_connection() as conn:
+            opening_balance, has_history = conn.execute("""
+                SELECT IFNULL(SUM(CASE WHEN type = 'Gelir' THEN total ELSE -total END), 0), COUNT(*)
+                FROM transaction_rollups WHERE user_id = ? AND year_month < ?
+            """, (user_id, start_month)).fetchone()
+            monthly_net = dict(conn.execute("""
+                SELECT year_month, SUM(CASE WHEN type = 'Gelir' THEN total ELSE -total END)
+                FROM transaction_rollups WHERE user_id = ? AND year_month >= ?
+                GROUP BY year_month
+            """, (user_id, start_month)).fetchall())
+
+        if not has_history and not monthly_net:
+            return []
+        trend = []
+        balance = opening_balance
+        year, month = int(start_month[:4]), int(start_month[5:])
+        for _ in range(num_months):
+            year_month = f"{year:04d}-{month:02d}"
+            net = monthly_net.get(year_month, 0)
+            balance += net
+            trend.append((year_month, kurus_to_tl(net), kurus_to_tl(balance)))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return trend
 
     def get_income_expenses_by_month_and_category(self, user_id, num_months=12):
         """
-        Son N aydaki gelir ve giderleri kategori bazında getirir.
-        AI analizinde ve grafiklerde kullanılabilir.
+        İçinde bulunulan ay dahil son N aydaki gelir ve giderleri kategori bazında aylık özet tablosundan getirir.
+        AI analizinde ve grafiklerde kullanılabilir. Sonuç veri sürümüne göre önbelleğe alınır.
+        Returns:
+            list: (type, category, total_amount) satırları; kategorisiz işlemler için category None'dır.
         """
-        today = datetime.now().date()
-        start_date_limit = (today - timedelta(days=num_months * 30)).strftime('%Y-%m-%d')
-
-        self.cursor.execute("""
-            SELECT type, category, SUM(amount) as total_amount
-            FROM transactions
-            WHERE user_id = ? AND date >= ?
-            GROUP BY type, category
-            ORDER BY type, total_amount DESC
-        """, (user_id, start_date_limit))
-        return self.cursor.fetchall()
+        start_month = self._month_window_start(num_months)
+        # Birleştirilmiş kategorilerin özetleri hedef kategoride toplanır
+        return self.cached_report(user_id, "income_expenses_by_category", (start_month,), lambda: self._fetch_all_read("""
+            SELECT r.type, (SELECT name FROM categories WHERE id = IFNULL(c.merged_into_id, c.id)),
+                   SUM(r.total) / 100.0 as total_amount
+            FROM transaction_rollups r
+            LEFT JOIN categories c ON c.id = r.category_id
+            WHERE r.user_id = ? AND r.year_month >= ?
+            GROUP BY r.type, IFNULL(c.merged_into_id, c.id)
+            ORDER BY r.type, total_amount DESC
+        """, (user_id, start_month)))
 
     def get_all_transaction_data_for_analysis(self, user_id):
         """
         AI tahmincisi için tüm işlem verilerini çeker.
         (id, type, amount, category, description, date)
         """
-        self.cursor.execute("SELECT id, type, amount, category, description, date FROM transactions WHERE user_id = ?",
-                            (user_id,))
-        return self.cursor.fetchall()
+        return self._fetch_all_read(
+            f"SELECT id, type, amount / 100.0, {_category_name_sql('transactions')}, description, date "
+            f"FROM transactions WHERE user_id = ?",
+            (user_id,))
+
+    # --- İndeks Danışmanı ---
+    def _advisor_probes(self, user_id):
+        """İndeks danışmanının çalıştırdığı okuma metodları ve örnek argümanları."""
+        today = datetime.now().strftime('%Y-%m-%d')
+        return [
+            ("check_user", lambda: self.check_user("", "")),
+            ("peek_next_document_number", lambda: self.peek_next_document_number(user_id, "Fatura")),
+            ("get_transactions", lambda: self.get_transactions(user_id)),
+            ("get_transactions (kategori)", lambda: self.get_transactions(user_id, category_filter="Genel")),
+            ("get_transactions (filtreli)",
+             lambda: self.get_transactions(user_id, "Gider", "Genel", "2000-01-01", today, "market")),
+            ("get_transactions_page",
+             lambda: self.get_transactions_page(user_id, "Gider", page_size=50, after=(today, 1 << 62))),
+            ("search_transactions", lambda: self.search_transactions(user_id, "market")),
+            ("get_balance", lambda: self.get_balance(user_id)),
+            ("get_categories_for_user", lambda: self.get_categories_for_user(user_id)),
+            ("get_all_categories", lambda: self.get_all_categories(user_id)),
+            ("count_transactions_by_category", lambda: self.count_transactions_by_category(0, user_id)),
+            ("get_category_rules", lambda: self.get_category_rules(user_id)),
+            ("get_category_rule_stats", lambda: self.get_category_rule_stats(user_id)),
+            ("get_recurring_transactions", lambda: self.get_recurring_transactions(user_id)),
+            ("get_savings_goals", lambda: self.get_savings_goals(user_id)),
+            ("get_customers", lambda: self.get_customers(user_id)),
+            ("get_customer_by_name", lambda: self.get_customer_by_name("", user_id)),
+            ("get_customer_by_id", lambda: self.get_customer_by_id(0, user_id)),
+            ("get_customer_summaries", lambda: self.get_customer_summaries(user_id)),
+            ("count_invoices_by_customer", lambda: self.count_invoices_by_customer(0, user_id)),
+            ("get_products", lambda: self.get_products(user_id)),
+            ("get_product_by_name", lambda: self.get_product_by_name("", user_id)),
+            ("get_stock_movements", lambda: self.get_stock_movements(0, user_id)),
+            ("get_stock_on_date", lambda: self.get_stock_on_date(user_id, today)),
+            ("get_stock_valuation", lambda: self.get_stock_valuation(user_id, today)),
+            ("get_invoice_offers", lambda: self.get_invoice_offers(user_id)),
+            ("get_invoice_offer_by_id", lambda: self.get_invoice_offer_by_id(0, user_id)),
+            ("get_invoice_items", lambda: self.get_invoice_items(0)),
+            ("get_total_sales_kdv", lambda: self.get_total_sales_kdv("2000-01-01", today, user_id)),
+            ("get_sales_kdv_by_rate", lambda: self.get_sales_kdv_by_rate("2000-01-01", today, user_id)),
+            ("get_product_sales", lambda: self.get_product_sales("2000-01-01", today, user_id)),
+            ("get_all_transactions_for_ai_training", lambda: self.get_all_transactions_for_ai_training(user_id)),
+            ("get_data_version", lambda: self.get_data_version(user_id)),
+            ("get_monthly_balance_trend", lambda: self.get_monthly_balance_trend(user_id)),
+            ("get_income_expenses_by_month_and_category",
+             lambda: self.get_income_expenses_by_month_and_category(user_id)),
+            ("get_all_transaction_data_for_analysis", lambda: self.get_all_transaction_data_for_analysis(user_id)),
+            ("get_ai_training_rows_since", lambda: self.get_ai_training_rows_since(user_id, 1000)),
+        ]
+
+    @contextmanager
+    def _traced_connections(self, callback):
+        """Ana bağlantıda ve okuyucu havuzundaki bağlantılarda çalışan SQL'leri callback'e iletir."""
+        with self.read_connection():
+            pass  # Havuzda en az bir okuyucu bağlantısı bulunsun; sıralı çağrılar hep aynısını kullanır
+        connections = self._traceable_connections()
+        for conn in connections:
+            conn.set_trace_callback(callback)
+        try:
+            yield
+        finally:
+            for conn in connections:
+                # Sorgu izleme açıksa izleyicinin geri çağrısı geri kurulur
+                conn.set_trace_callback(self.tracer.on_statement if self.tracer is not None else None)
 
+    def run_index_advisor(self, user_id=1):
+        """
+        DatabaseManager'ın okuma sorgularını çalıştırıp her birinin EXPLAIN QUERY PLAN çıktısını inceler.
+        Returns:
+            list: (metod adı, sql, plan satırı) üçlüleri; her biri hâlâ tablo taraması yapan bir sorguyu gösterir.
+        """
+        findings = []
+        for method_name, probe in self._advisor_probes(user_id):
+            statements = []
+            self._clear_caches()  # Önbellekten dönen okumalar da sorgularını çalıştırsın
+            with self._traced_connections(statements.append):
+                probe()
+
+            for sql in statements:
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = self.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                for row in plan:
+                    detail = row[-1]
+                    # "SCAN (subquery-N)" bir tablo değil, sorgunun ara sonucu (örn: UNION) üzerinde dolaşmadır
+                    if (detail.startswith("SCAN ") and not detail.startswith("SCAN (subquery")
+                            and "VIRTUAL TABLE" not in detail and "CONSTANT ROW" not in detail):
+                        findings.append((method_name, " ".join(sql.split()), detail))
+        return findings
+
+    def print_index_advisor_report(self, user_id=1):
+        """İndeks danışmanı sonuçlarını okunabilir biçimde yazdırır."""
+        findings = self.run_index_advisor(user_id)
+        if not findings:
+            print("İndeks danışmanı: Tüm sorgular indeks üzerinden çalışıyor, tablo taraması bulunamadı.")
+            return findings
+
+        print(f"İndeks danışmanı: {len(findings)} sorgu hâlâ tablo taraması yapıyor:")
+        for method_name, sql, detail in findings:
+            print(f"  - {method_name}: {detail}\n      {sql}")
+        return findings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fingo veritabanı bakım komutları")
+    parser.add_argument("--db", default="veriler.db", help="Veritabanı dosyası (varsayılan: veriler.db)")
+    parser.add_argument("--trace", action="store_true", help="Sorgu izlemeyi açar, çıkışta gecikme raporunu yazdırır")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    advisor_parser = subparsers.add_parser("index-advisor", help="Sorgu planlarını inceler, tablo taramalarını raporlar")
+    advisor_parser.add_argument("--user-id", type=int, default=1, help="Sorgularda kullanılacak örnek kullanıcı ID'si")
+
+    balances_parser = subparsers.add_parser("verify-balances",
+                                            help="Bakiye özetini işlemlerden baştan hesaplayıp farkları raporlar")
+    balances_parser.add_argument("--repair", action="store_true", help="Fark bulunursa bakiye özetini yeniden oluşturur")
+
+    args = parser.parse_args()
+    db = DatabaseManager(args.db)
+    if args.trace:
+        db.enable_tracing()
+    try:
+        if args.command == "index-advisor":
+            db.print_index_advisor_report(args.user_id)
+        elif args.command == "verify-balances":
+            db.print_balance_verification_report(args.repair)
+    finally:
+        db.close()
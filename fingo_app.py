@@ -6,13 +6,12 @@ from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from tkcalendar import DateEntry
-import json
 import os
 import sys
 import pandas as pd
 
 # Gerekli modüllerin import edilmesi
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, calculate_invoice_totals
 # pdf_generator'dan hem sınıfı hem de font adını ve register fonksiyonunu import et
 from pdf_generator import PDFGenerator, GLOBAL_REPORTLAB_FONT_NAME, _register_pdf_font
 from ai_predictor import AIPredictor
@@ -27,6 +26,9 @@ plt.rcParams['axes.unicode_minus'] = False
 # Font dosyasının uygulama ile aynı dizinde olduğundan emin olun (örn: ArialCustom.ttf).
 _register_pdf_font(f"{GLOBAL_REPORTLAB_FONT_NAME}.ttf")
 
+# İşlem listesine her seferinde yüklenen satır sayısı (keyset sayfalama)
+TRANSACTIONS_PAGE_SIZE = 200
+
 
 class GelirGiderUygulamasi:
     def __init__(self, root, db_manager, kullanici_id, username):
@@ -35,8 +37,6 @@ class GelirGiderUygulamasi:
         """
         self.root = root
         self.db_manager = db_manager
-        self.conn = self.db_manager.conn
-        self.cursor = self.db_manager.cursor
         self.kullanici_id = kullanici_id
         self.username = username
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -49,6 +49,10 @@ class GelirGiderUygulamasi:
         self.selected_invoice_offer_id = None
         self.selected_category_id = None
 
+        # İşlem listesinin aktif filtreleri ve sonraki sayfanın devam anahtarı
+        self._transaction_filters = {}
+        self._transactions_next_key = None
+
         # Grafik değişkenlerini başlangıçta None olarak ayarla
         self.fig_category = None
         self.canvas_category = None
@@ -57,15 +61,15 @@ class GelirGiderUygulamasi:
 
         # PDFGenerator'ı db_manager ve user_id ile başlat
         self.pdf_generator = PDFGenerator(db_manager=self.db_manager, user_id=self.kullanici_id)
-        self.ai_predictor = AIPredictor(db_manager=self.db_manager, user_id=self.kullanici_id)
+        self.ai_predictor = AIPredictor(db_manager=self.db_manager, user_id=self.kullanici_id, online=True)
 
         # validate_numeric_input fonksiyonunu bir kere kaydet
         self.validate_numeric_cmd = self.root.register(self._validate_numeric_input_wrapper)
 
         self._create_main_ui()  # Yeni ana UI oluşturma metodunu çağırıyoruz
 
-        # AI modelini UI oluşturulduktan sonra yükle/eğit
-        self.ai_predictor.load_or_train_model()
+        # AI modelini UI oluşturulduktan sonra yükle; kayıtlı model yoksa arka planda eğit
+        self.ai_predictor.load_or_train_model(background=True)
 
         # İlk sekmelerin yüklenmesi ve veri çekimi notebook sekme değişim olayına bağlandı
         self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_change)
@@ -81,8 +85,12 @@ class GelirGiderUygulamasi:
         return validate_numeric_input(P)
 
     def on_closing(self):
-        """Uygulama kapatılırken veritabanı bağlantısını kapatır."""
+        """
+        Uygulama kapatılırken arka plan model eğitimini durdurur, yazma kuyruğunda bekleyen kayıtları commit eder
+        ve veritabanı bağlantısını kapatır.
+        """
         if messagebox.askokcancel("Çıkış", "Uygulamadan çıkmak istediğinizden emin misiniz?"):
+            self.ai_predictor.shutdown()
             self.db_manager.close()
             self.root.destroy()
 
@@ -304,6 +312,44 @@ class GelirGiderUygulamasi:
         self.category_tree.pack(fill="both", expand=True, pady=10)
         self.category_tree.bind("<ButtonRelease-1>", self.kategori_sec)
 
+        # Kategori Kuralları: açıklamada anahtar kelime/düzenli ifade geçen işlemler, yapay zeka tahmininden önce
+        # doğrudan kuralın kategorisini alır
+        rule_frame = ttk.LabelFrame(parent_frame, text="Otomatik Kategori Kuralları", padding="15")
+        rule_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        rule_input_frame = ttk.Frame(rule_frame)
+        rule_input_frame.pack(pady=5)
+
+        ttk.Label(rule_input_frame, text="Anahtar Kelime / Desen:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.rule_pattern_entry = ttk.Entry(rule_input_frame, width=30)
+        self.rule_pattern_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.rule_is_regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rule_input_frame, text="Düzenli ifade", variable=self.rule_is_regex_var).grid(
+            row=0, column=2, padx=5, pady=5, sticky="w")
+
+        ttk.Label(rule_input_frame, text="Kategori:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.rule_category_combobox = ttk.Combobox(rule_input_frame, state="readonly", width=27)
+        self.rule_category_combobox.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+
+        ttk.Label(rule_input_frame, text="Öncelik:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        self.rule_priority_spinbox = ttk.Spinbox(rule_input_frame, from_=0, to=100, width=5)
+        self.rule_priority_spinbox.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        self.rule_priority_spinbox.set(0)
+
+        rule_button_frame = ttk.Frame(rule_frame)
+        rule_button_frame.pack(pady=5)
+        ttk.Button(rule_button_frame, text="Kural Ekle", command=self.kural_ekle).grid(row=0, column=0, padx=5, pady=5)
+        ttk.Button(rule_button_frame, text="Kural Sil", command=self.kural_sil).grid(row=0, column=1, padx=5, pady=5)
+
+        self.rule_tree = ttk.Treeview(rule_frame, columns=("ID", "Desen", "Tür", "Kategori", "Öncelik", "Eşleşme"),
+                                      show="headings")
+        for column, text, width, stretch in (("ID", "ID", 50, tk.NO), ("Desen", "Desen", 200, tk.YES),
+                                             ("Tür", "Tür", 110, tk.NO), ("Kategori", "Kategori", 150, tk.YES),
+                                             ("Öncelik", "Öncelik", 70, tk.NO), ("Eşleşme", "Eşleşme", 80, tk.NO)):
+            self.rule_tree.heading(column, text=text)
+            self.rule_tree.column(column, width=width, stretch=stretch)
+        self.rule_tree.pack(fill="both", expand=True, pady=10)
+
     def kategori_ekle(self):
         category_name = self.category_name_entry.get().strip()
         category_type = self.category_type_combobox.get()
@@ -320,7 +366,6 @@ class GelirGiderUygulamasi:
             self.temizle_kategori_formu()
             self.listele_kategoriler()
             self.guncelle_kategori_listesi()
-            self.ai_predictor.load_or_train_model(force_retrain=True)
         else:
             self.show_error("Hata", "Kategori eklenirken bir sorun oluştu veya bu kategori adı zaten mevcut.")
 
@@ -335,7 +380,7 @@ class GelirGiderUygulamasi:
             return
         category_name_to_delete = self.category_tree.item(selected_item, 'values')[1]
 
-        transaction_count = self.db_manager.count_transactions_by_category(category_name_to_delete, self.kullanici_id)
+        transaction_count = self.db_manager.count_transactions_by_category(self.selected_category_id, self.kullanici_id)
 
         if transaction_count > 0:
             confirm = messagebox.askyesno(
@@ -346,10 +391,7 @@ class GelirGiderUygulamasi:
             if not confirm:
                 return
 
-            if not self.db_manager.update_transactions_category_to_null(category_name_to_delete, self.kullanici_id):
-                self.show_error("Hata", "İşlemlerin kategorisi güncellenirken bir sorun oluştu.")
-                return
-
+        # delete_category işlemlerin kategorisini boşaltır ve kategoriyi tek bir işlemde siler
         if self.db_manager.delete_category(self.selected_category_id, self.kullanici_id):
             self.show_message("Başarılı", "Kategori başarıyla silindi.")
             self.selected_category_id = None
@@ -357,10 +399,59 @@ class GelirGiderUygulamasi:
             self.listele_kategoriler()
             self.guncelle_kategori_listesi()
             self.listele_islemler()
-            self.ai_predictor.load_or_train_model(force_retrain=True)
+            self.ai_predictor.retrain_in_background()  # Kategorisi boşalan işlemler eğitim verisinden çıktı
         else:
             self.show_error("Hata", "Kategori silinirken bir sorun oluştu.")
 
+    def kural_ekle(self):
+        pattern = self.rule_pattern_entry.get().strip()
+        category = self.rule_category_combobox.get()
+        if not pattern:
+            self.show_error("Hata", "Anahtar kelime / desen boş olamaz.")
+            return
+        if not category:
+            self.show_error("Hata", "Lütfen kuralın kategorisini seçin.")
+            return
+        try:
+            priority = int(self.rule_priority_spinbox.get())
+        except ValueError:
+            self.show_error("Hata", "Öncelik bir tamsayı olmalıdır.")
+            return
+
+        if self.db_manager.insert_category_rule(pattern, category, self.kullanici_id,
+                                                is_regex=self.rule_is_regex_var.get(), priority=priority):
+            self.rule_pattern_entry.delete(0, tk.END)
+            self.rule_is_regex_var.set(False)
+            self.rule_priority_spinbox.set(0)
+            self.listele_kurallar()
+        else:
+            self.show_error("Hata", "Kural eklenemedi. Düzenli ifade geçersiz veya kategori bulunamadı.")
+
+    def kural_sil(self):
+        selected_item = self.rule_tree.selection()
+        if not selected_item:
+            self.show_error("Hata", "Lütfen silmek istediğiniz kuralı seçin.")
+            return
+        rule_id = self.rule_tree.item(selected_item, 'values')[0]
+        if self.db_manager.delete_category_rule(rule_id, self.kullanici_id):
+            self.listele_kurallar()
+        else:
+            self.show_error("Hata", "Kural silinirken bir sorun oluştu.")
+
+    def listele_kurallar(self):
+        """Kategori kurallarını eşleşme sayılarıyla Treeview'de listeler."""
+        if not (hasattr(self, 'rule_tree') and self.rule_tree.winfo_exists()):
+            return
+
+        for item in self.rule_tree.get_children():
+            self.rule_tree.delete(item)
+
+        self.ai_predictor.flush_rule_hits()  # Tahminlerde biriken eşleşmeler listeye yansısın
+        for rule_id, pattern, is_regex, category, priority, hit_count, _ in \
+                self.db_manager.get_category_rule_stats(self.kullanici_id):
+            self.rule_tree.insert("", "end", values=(rule_id, pattern, "Düzenli ifade" if is_regex else "Anahtar kelime",
+                                                     category, priority, hit_count))
+
     def kategori_sec(self, event):
         selected_item = self.category_tree.selection()
         if selected_item:
@@ -385,6 +476,7 @@ class GelirGiderUygulamasi:
         categories = self.db_manager.get_categories_for_user(self.kullanici_id)
         for cat_id, cat_name, cat_type in categories:
             self.category_tree.insert("", "end", values=(cat_id, cat_name, cat_type))
+        self.listele_kurallar()  # Silinen veya yeniden adlandırılan kategoriler kuralları da etkiler
 
     def temizle_kategori_formu(self):
         """Kategori ekleme/güncelleme formunu temizler."""
@@ -403,6 +495,8 @@ class GelirGiderUygulamasi:
             self.recurring_category_combobox['values'] = categories
         if hasattr(self, 'filter_category_combobox') and self.filter_category_combobox.winfo_exists():
             self.filter_category_combobox['values'] = ["Tümü"] + categories
+        if hasattr(self, 'rule_category_combobox') and self.rule_category_combobox.winfo_exists():
+            self.rule_category_combobox['values'] = categories
 
     # --- İşlem UI ve Fonksiyonları (Gelir/Gider) ---
     def _create_transactions_ui(self, parent_frame):
@@ -532,6 +626,9 @@ class GelirGiderUygulamasi:
         export_buttons_frame = ttk.Frame(parent_frame)
         export_buttons_frame.pack(pady=10)
 
+        self.load_more_transactions_button = ttk.Button(export_buttons_frame, text="Daha Fazla Yükle",
+                                                        command=self.daha_fazla_islem_yukle, state="disabled")
+        self.load_more_transactions_button.pack(side="left", padx=5)
         ttk.Button(export_buttons_frame, text="PDF Olarak Dışa Aktar", command=self.export_transactions_to_pdf).pack(
             side="left", padx=5)
         ttk.Button(export_buttons_frame, text="Excel Olarak Dışa Aktar",
@@ -586,7 +683,7 @@ class GelirGiderUygulamasi:
             self.temizle_islem_formu()
             self.listele_islemler()
             self.guncelle_bakiye()
-            self.ai_predictor.load_or_train_model(force_retrain=True)
+            self.ai_predictor.notify_labeled_rows(1 if category and description else 0)
         else:
             self.show_error("Hata", "İşlem eklenirken bir sorun oluştu.")
 
@@ -626,7 +723,7 @@ class GelirGiderUygulamasi:
             self.temizle_islem_formu()
             self.listele_islemler()
             self.guncelle_bakiye()
-            self.ai_predictor.load_or_train_model(force_retrain=True)
+            self.ai_predictor.notify_labeled_rows()
         else:
             self.show_error("Hata", "İşlem güncellenirken bir sorun oluştu.")
 
@@ -641,7 +738,7 @@ class GelirGiderUygulamasi:
                 self.temizle_islem_formu()
                 self.listele_islemler()
                 self.guncelle_bakiye()
-                self.ai_predictor.load_or_train_model(force_retrain=True)
+                self.ai_predictor.notify_labeled_rows()
             else:
                 self.show_error("Hata", "İşlem silinirken bir sorun oluştu.")
 
@@ -694,18 +791,34 @@ class GelirGiderUygulamasi:
 
         search_term = self.search_term_entry.get().strip()
 
-        transactions = self.db_manager.get_transactions(
-            self.kullanici_id,
-            type_filter if type_filter != "Tümü" else None,
-            category_filter if category_filter != "Tümü" else None,
-            start_date_db_format,
-            end_date_db_format,
-            search_term
-        )
+        self._transaction_filters = {
+            "type_filter": type_filter if type_filter != "Tümü" else None,
+            "category_filter": category_filter if category_filter != "Tümü" else None,
+            "start_date": start_date_db_format,
+            "end_date": end_date_db_format,
+            "search_term": search_term
+        }
+        self._transactions_next_key = None
+        self._load_transactions_page()
+
+    def _load_transactions_page(self):
+        """Aktif filtrelerle işlem listesinin sonraki sayfasını Treeview'e ekler."""
+        transactions, self._transactions_next_key = self.db_manager.get_transactions_page(
+            self.kullanici_id, **self._transaction_filters, page_size=TRANSACTIONS_PAGE_SIZE,
+            after=self._transactions_next_key)
 
         for row in transactions:
             self.transactions_tree.insert("", "end", values=row)
 
+        if hasattr(self, 'load_more_transactions_button') and self.load_more_transactions_button.winfo_exists():
+            self.load_more_transactions_button.config(
+                state="normal" if self._transactions_next_key else "disabled")
+
+    def daha_fazla_islem_yukle(self):
+        """İşlem listesine bir sonraki sayfayı yükler."""
+        if self._transactions_next_key and hasattr(self, 'transactions_tree') and self.transactions_tree.winfo_exists():
+            self._load_transactions_page()
+
     def temizle_islem_formu(self):
         if hasattr(self, 'transaction_date_entry') and self.transaction_date_entry.winfo_exists():
             self.transaction_date_entry.set_date(datetime.now())
@@ -748,9 +861,13 @@ class GelirGiderUygulamasi:
         """Kullanıcının AI modelini manuel olarak yeniden eğitmesini sağlar."""
         if messagebox.askyesno("AI Modelini Eğit",
                                "Yapay zeka modelini yeniden eğitmek istediğinizden emin misiniz? Bu işlem biraz zaman alabilir."):
-            self.ai_predictor.load_or_train_model(force_retrain=True)
-            self.show_message("Eğitim Tamamlandı", "Yapay zeka modeli başarıyla yeniden eğitildi!")
-            self.guncelle_kategori_listesi()
+            # Eğitim arka planda yapılır; bitince mesaj Tk iş parçacığında gösterilir
+            self.ai_predictor.retrain_in_background(
+                callback=lambda: self.root.after(0, self._on_manual_training_done))
+
+    def _on_manual_training_done(self):
+        self.show_message("Eğitim Tamamlandı", "Yapay zeka modeli başarıyla yeniden eğitildi!")
+        self.guncelle_kategori_listesi()
 
     # --- Tekrarlayan İşlemler UI ve Fonksiyonları ---
     def _create_recurring_transactions_ui(self, parent_frame):
@@ -1013,7 +1130,9 @@ class GelirGiderUygulamasi:
         print("Otomatik tekrarlayan işlem kontrolü başlatıldı.")
         recurring_transactions = self.db_manager.get_recurring_transactions(self.kullanici_id)
         today = datetime.now().date()
-        generated_count = 0
+        new_rows = []
+        last_generated_dates = {}
+        invalid_items = []  # Üretilen satırlarından biri geçersiz olan tekrarlayan işlemler
 
         for rec_id, type, amount, category, description, start_date_str, frequency, last_generated_date_str in recurring_transactions:
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
@@ -1025,21 +1144,10 @@ class GelirGiderUygulamasi:
             if last_generated_date < start_date:
                 next_due_date = start_date
 
+            item_rows = []
             while next_due_date <= today:
                 if next_due_date > last_generated_date:
-                    if self.db_manager.insert_transaction(type, amount, category, description,
-                                                          next_due_date.strftime('%Y-%m-%d'), self.kullanici_id):
-                        generated_count += 1
-                        print(f"Tekrarlayan işlem '{description}' ({next_due_date.strftime('%Y-%m-%d')}) oluşturuldu.")
-                    else:
-                        print(
-                            f"Hata: Tekrarlayan işlem '{description}' ({next_due_date.strftime('%Y-%m-%d')}) eklenirken sorun oluştu.")
-
-                    self.db_manager.update_recurring_transaction_last_generated_date(rec_id,
-                                                                                     next_due_date.strftime('%Y-%m-%d'))
-                    self.guncelle_bakiye()
-                    self.listele_islemler()
-                    self.ai_predictor.load_or_train_model(force_retrain=True)
+                    item_rows.append((type, amount, category, description, next_due_date.strftime('%Y-%m-%d')))
 
                 if frequency == "Günlük":
                     next_due_date += timedelta(days=1)
@@ -1067,6 +1175,42 @@ class GelirGiderUygulamasi:
                 else:
                     break
 
+            # Bir tekrarlayan işlemin satırları ya hep birlikte eklenir ya hiç eklenmez; geçersiz satırı olan
+            # işlemin son üretim tarihi ilerletilmez, düzeltildiğinde eksik tekrarlar bir sonraki kontrolde üretilir
+            if item_rows:
+                if all(self.db_manager.is_valid_transaction_row(row) for row in item_rows):
+                    new_rows.extend(item_rows)
+                    last_generated_dates[rec_id] = item_rows[-1][4]
+                else:
+                    invalid_items.append(description or str(rec_id))
+
+        if invalid_items:
+            print(f"Hata: Şu tekrarlayan işlemler geçersiz tutar/tür/tarih içerdiği için üretilmedi: "
+                  f"{', '.join(invalid_items)}")
+
+        # Üretilen tüm işlemler ve son üretim tarihleri tek bir commit ile kaydedilir;
+        # arayüz ve model de bir kez güncellenir
+        generated_count = 0
+        if new_rows:
+            with self.db_manager.unit_of_work() as uow:
+                generated_count, rejected_count = self.db_manager.insert_transactions_many(new_rows,
+                                                                                           self.kullanici_id)
+                if rejected_count:
+                    # Son üretim tarihleri reddedilen tekrarları atlamasın: hepsi geri alınır, sonraki kontrolde denenir
+                    print(f"Hata: {rejected_count} adet tekrarlayan işlem eklenirken sorun oluştu, "
+                          f"hiçbir işlem eklenmedi.")
+                    uow.mark_failed()
+                elif generated_count:
+                    for rec_id, new_last_generated_date in last_generated_dates.items():
+                        self.db_manager.update_recurring_transaction_last_generated_date(rec_id,
+                                                                                         new_last_generated_date)
+            if not uow.committed:
+                generated_count = 0
+            if generated_count:
+                self.guncelle_bakiye()
+                self.listele_islemler()
+                self.ai_predictor.notify_labeled_rows(sum(1 for row in new_rows if row[2] and row[3]))
+
         if generated_count > 0:
             self.show_message("Tekrarlayan İşlemler",
                               f"{generated_count} adet tekrarlayan işlem başarıyla oluşturuldu.")
@@ -1436,11 +1580,9 @@ class GelirGiderUygulamasi:
             self.show_error("Hata", f"'{name}' isimli bir müşteri zaten mevcut.")
             return
 
+        # Faturalar müşteriye ID ile bağlı olduğundan yeni ad tüm belgelerde kendiliğinden görünür
         if self.db_manager.update_customer(self.selected_customer_id, name, address if address else None,
                                            phone if phone else None, email if email else None, self.kullanici_id):
-            if name != current_customer_name:
-                self.db_manager.update_invoice_customer_name(current_customer_name, name, self.kullanici_id)
-
             self.show_message("Başarılı", "Müşteri başarıyla güncellendi.")
             self.temizle_musteri_formu()
             self.listele_musteriler()
@@ -1453,10 +1595,7 @@ class GelirGiderUygulamasi:
             self.show_error("Hata", "Lütfen silmek istediğiniz bir müşteri seçin.")
             return
 
-        selected_item = self.customer_tree.selection()
-        customer_name_to_delete = self.customer_tree.item(selected_item[0], 'values')[1] if selected_item else None
-
-        invoice_count = self.db_manager.count_invoices_by_customer(customer_name_to_delete, self.kullanici_id)
+        invoice_count = self.db_manager.count_invoices_by_customer(self.selected_customer_id, self.kullanici_id)
         if invoice_count > 0:
             self.show_error("Hata",
                             f"Bu müşteriye ait {invoice_count} adet fatura/teklif bulunmaktadır. Lütfen önce bu fatura/teklifleri silin.")
@@ -1622,7 +1761,10 @@ class GelirGiderUygulamasi:
         kdv_rate_str = self.product_kdv_rate_entry.get()
 
         selected_item = self.product_tree.selection()
-        current_product_name = self.product_tree.item(selected_item[0], 'values')[1] if selected_item else None
+        selected_values = self.product_tree.item(selected_item[0], 'values') if selected_item else None
+        current_product_name = selected_values[1] if selected_values else None
+        # Formun yüklendiği andaki stok; yalnızca kullanıcının yaptığı değişiklik deftere yazılır
+        previous_stock = float(selected_values[2]) if selected_values else None
 
         if not name or not stock_str or not purchase_price_str or not selling_price_str or not kdv_rate_str:
             self.show_error("Hata", "Tüm alanlar doldurulmalıdır.")
@@ -1645,7 +1787,7 @@ class GelirGiderUygulamasi:
             return
 
         if self.db_manager.update_product(self.selected_product_id, name, stock, purchase_price, selling_price,
-                                          kdv_rate, self.kullanici_id):
+                                          kdv_rate, self.kullanici_id, previous_stock=previous_stock):
             self.show_message("Başarılı", "Ürün/Hizmet başarıyla güncellendi.")
             self.temizle_urun_formu()
             self.listele_urunler()
@@ -2095,22 +2237,14 @@ class GelirGiderUygulamasi:
             self.show_error("Hata", "Fatura kalemleri tablosu henüz oluşturulmadı.")
 
     def calculate_grand_totals(self):
-        total_excl_kdv = 0.0
-        total_kdv = 0.0
-
+        items_list = []
         if hasattr(self, 'invoice_items_tree') and self.invoice_items_tree.winfo_exists():
             for item_id in self.invoice_items_tree.get_children():
                 values = self.invoice_items_tree.item(item_id, 'values')
-                quantity = float(values[1])
-                unit_price = float(values[2])
-                kdv_rate = float(values[3]) / 100.0
-
-                subtotal_before_kdv = quantity * unit_price
-                kdv_amount = subtotal_before_kdv * kdv_rate
-
-                total_excl_kdv += subtotal_before_kdv
-                total_kdv += kdv_amount
+                items_list.append({"kdv_miktari": values[4], "ara_toplam": values[5]})
 
+        # Kayıtta kullanılan hesapla aynı: kalemlerin görünen tutarları kuruş cinsinden toplanır
+        total_excl_kdv, total_kdv = calculate_invoice_totals(items_list)
         grand_total = total_excl_kdv + total_kdv
 
         if hasattr(self, 'total_excl_kdv_label') and self.total_excl_kdv_label.winfo_exists():
@@ -2125,27 +2259,13 @@ class GelirGiderUygulamasi:
                 hasattr(self, 'doc_number_entry') and self.doc_number_entry.winfo_exists()):
             return
 
-        doc_type = self.doc_type_combobox.get()
-        last_invoice_num, last_offer_num = self.db_manager.get_user_invoice_offer_nums(self.kullanici_id)
-
-        if doc_type == "Fatura":
-            new_num = last_invoice_num + 1
-            prefix = "FTR"
-        elif doc_type == "Teklif":
-            new_num = last_offer_num + 1
-            prefix = "TKLF"
-        else:
-            self.doc_number_entry.config(state="normal")
-            self.doc_number_entry.delete(0, tk.END)
-            self.doc_number_entry.config(state="readonly")
-            return
-
-        current_year = datetime.now().year
-        new_doc_number = f"{prefix}-{current_year}-{new_num:05d}"
+        # Yalnızca önizleme: numara kayıt sırasında atomik olarak ayrılır (bkz. save_invoice_offer)
+        new_doc_number = self.db_manager.peek_next_document_number(self.kullanici_id, self.doc_type_combobox.get())
 
         self.doc_number_entry.config(state="normal")
         self.doc_number_entry.delete(0, tk.END)
-        self.doc_number_entry.insert(0, new_doc_number)
+        if new_doc_number:
+            self.doc_number_entry.insert(0, new_doc_number)
         self.doc_number_entry.config(state="readonly")
 
     def save_invoice_offer(self):
@@ -2163,6 +2283,10 @@ class GelirGiderUygulamasi:
         if not self.invoice_items_tree.get_children():
             self.show_error("Hata", "Lütfen fatura/teklife en az bir kalem ekleyin.")
             return
+        customer_info = self.db_manager.get_customer_by_name(customer_name, self.kullanici_id)
+        if not customer_info:
+            self.show_error("Hata", f"'{customer_name}' isimli müşteri bulunamadı. Lütfen önce müşteriyi ekleyin.")
+            return
 
         try:
             doc_date_db_format = self._parse_date_input(doc_date_str)
@@ -2183,32 +2307,24 @@ class GelirGiderUygulamasi:
                 "ara_toplam": float(values[5])
             }
             items_list.append(item_data)
-        items_json = json.dumps(items_list)
-
-        total_excl_kdv = float(
-            self.total_excl_kdv_label.cget("text").replace("KDV Hariç Toplam: ", "").replace(" TL", ""))
-        total_kdv = float(self.total_kdv_label.cget("text").replace("Toplam KDV: ", "").replace(" TL", ""))
-
-        if self.db_manager.insert_invoice_offer(doc_type, doc_number, customer_name, doc_date_db_format,
-                                                due_valid_date_db_format,
-                                                items_json, total_excl_kdv, total_kdv, notes if notes else None, status,
-                                                self.kullanici_id):
-
-            if doc_type == "Fatura":
-                current_invoice_num, current_offer_num = self.db_manager.get_user_invoice_offer_nums(self.kullanici_id)
-                self.db_manager.update_user_invoice_offer_num(self.kullanici_id, invoice_num=current_invoice_num + 1)
-                for item_data in items_list:
-                    product_name = item_data['ad']
-                    quantity = item_data['miktar']
-                    product_info = self.db_manager.get_product_by_name(product_name, self.kullanici_id)
-                    if product_info:
-                        new_stock = product_info[2] - quantity
-                        self.db_manager.update_product_stock(product_info[0], new_stock)
-            elif doc_type == "Teklif":
-                current_invoice_num, current_offer_num = self.db_manager.get_user_invoice_offer_nums(self.kullanici_id)
-                self.db_manager.update_user_invoice_offer_num(self.kullanici_id, offer_num=current_offer_num + 1)
-
-            self.show_message("Başarılı", f"{doc_type} başarıyla kaydedildi.")
+
+        total_excl_kdv, total_kdv = calculate_invoice_totals(items_list)
+
+        # Belge numarası ayırma, belge ve stok düşümleri tek bir işlemde kaydedilir; biri başarısız olursa
+        # hiçbiri kalmaz ve ayrılan numara geri verilir. Formdaki numara yalnızca önizlemedir.
+        with self.db_manager.unit_of_work() as uow:
+            doc_number = self.db_manager.allocate_document_number(self.kullanici_id, doc_type)
+            if not doc_number or not self.db_manager.insert_invoice_offer(
+                    doc_type, doc_number, customer_info[0], doc_date_db_format, due_valid_date_db_format,
+                    items_list, total_excl_kdv, total_kdv, notes if notes else None, status, self.kullanici_id):
+                uow.mark_failed()
+            elif doc_type == "Fatura" and not self.db_manager.apply_stock_movements(
+                    [(item_data['ad'], -item_data['miktar']) for item_data in items_list], self.kullanici_id,
+                    "Satış", doc_date_db_format, doc_number):
+                uow.mark_failed()
+
+        if uow.committed:
+            self.show_message("Başarılı", f"{doc_type} {doc_number} numarasıyla başarıyla kaydedildi.")
             self.clear_invoice_offer_form()
             self.listele_faturalar_teklifler()
             self.listele_urunler()
@@ -2235,6 +2351,10 @@ class GelirGiderUygulamasi:
         if not self.invoice_items_tree.get_children():
             self.show_error("Hata", "Lütfen fatura/teklife en az bir kalem ekleyin.")
             return
+        customer_info = self.db_manager.get_customer_by_name(customer_name, self.kullanici_id)
+        if not customer_info:
+            self.show_error("Hata", f"'{customer_name}' isimli müşteri bulunamadı. Lütfen önce müşteriyi ekleyin.")
+            return
 
         try:
             doc_date_db_format = self._parse_date_input(doc_date_str)
@@ -2255,19 +2375,37 @@ class GelirGiderUygulamasi:
                 "ara_toplam": float(values[5])
             }
             items_list.append(item_data)
-        items_json = json.dumps(items_list)
 
-        total_excl_kdv = float(
-            self.total_excl_kdv_label.cget("text").replace("KDV Hariç Toplam: ", "").replace(" TL", ""))
-        total_kdv = float(self.total_kdv_label.cget("text").replace("Toplam KDV: ", "").replace(" TL", ""))
+        total_excl_kdv, total_kdv = calculate_invoice_totals(items_list)
+
+        previous_data = self.db_manager.get_invoice_offer_by_id(self.selected_invoice_offer_id, self.kullanici_id)
+        if not previous_data:
+            self.show_error("Hata", "Seçili fatura/teklif bulunamadı.")
+            return
 
-        if self.db_manager.update_invoice_offer(self.selected_invoice_offer_id, doc_type, doc_number, customer_name,
-                                                doc_date_db_format, due_valid_date_db_format, items_json,
-                                                total_excl_kdv,
-                                                total_kdv, notes if notes else None, status, self.kullanici_id):
+        # Stok, eski fatura kalemleri iade edilip yenileri düşülerek tek seferde güncellenir;
+        # değişmeyen kalemler birbirini götürür. Belge ve stok aynı işlemde kaydedilir.
+        stock_movements = []
+        if previous_data[1] == "Fatura":
+            stock_movements += [(item_data['ad'], item_data['miktar']) for item_data in previous_data[6]]
+        if doc_type == "Fatura":
+            stock_movements += [(item_data['ad'], -item_data['miktar']) for item_data in items_list]
+
+        with self.db_manager.unit_of_work() as uow:
+            if not self.db_manager.update_invoice_offer(self.selected_invoice_offer_id, doc_type, doc_number,
+                                                        customer_info[0], doc_date_db_format, due_valid_date_db_format,
+                                                        items_list, total_excl_kdv, total_kdv,
+                                                        notes if notes else None, status, self.kullanici_id):
+                uow.mark_failed()
+            elif not self.db_manager.apply_stock_movements(stock_movements, self.kullanici_id, "Satış Düzeltmesi",
+                                                           doc_date_db_format, doc_number):
+                uow.mark_failed()
+
+        if uow.committed:
             self.show_message("Başarılı", f"{doc_type} başarıyla güncellendi.")
             self.clear_invoice_offer_form()
             self.listele_faturalar_teklifler()
+            self.listele_urunler()
         else:
             self.show_error("Hata", f"{doc_type} güncellenirken bir sorun oluştu.")
 
@@ -2282,26 +2420,21 @@ class GelirGiderUygulamasi:
             return
 
         doc_type = selected_item_data[1]
-        items_json = selected_item_data[6]
+        items_list = selected_item_data[6]
 
         if messagebox.askyesno("Onay", f"Seçili {doc_type}'i silmek istediğinizden emin misiniz?"):
-            if self.db_manager.delete_invoice_offer(self.selected_invoice_offer_id, self.kullanici_id):
+            # Belge silme ve stok iadesi tek bir işlemde yapılır; stok geri yüklenemezse belge de silinmez
+            with self.db_manager.unit_of_work() as uow:
+                if not self.db_manager.delete_invoice_offer(self.selected_invoice_offer_id, self.kullanici_id):
+                    uow.mark_failed()
+                elif doc_type == "Fatura" and not self.db_manager.apply_stock_movements(
+                        [(item_data['ad'], item_data['miktar']) for item_data in items_list], self.kullanici_id,
+                        "Satış İptali", document_number=selected_item_data[2]):
+                    uow.mark_failed()
+
+            if uow.committed:
                 if doc_type == "Fatura":
-                    try:
-                        items_list = json.loads(items_json)
-                        for item_data in items_list:
-                            product_name = item_data['ad']
-                            quantity = item_data['miktar']
-                            product_info = self.db_manager.get_product_by_name(product_name, self.kullanici_id)
-                            if product_info:
-                                current_stock = product_info[2]
-                                new_stock = current_stock + quantity
-                                self.db_manager.update_product_stock(product_info[0], new_stock)
-                        self.listele_urunler()
-                    except Exception as e:
-                        print(f"Stok geri yükleme hatası: {e}")
-                        self.show_error("Hata", f"Fatura silindi ancak stok geri yüklenirken sorun oluştu: {e}")
-
+                    self.listele_urunler()
                 self.show_message("Başarılı", f"{doc_type} başarıyla silindi.")
                 self.clear_invoice_offer_form()
                 self.listele_faturalar_teklifler()
@@ -2357,8 +2490,7 @@ class GelirGiderUygulamasi:
                     for item in self.invoice_items_tree.get_children():
                         self.invoice_items_tree.delete(item)
 
-                    items_list = json.loads(doc_detail[6])
-                    for item_data in items_list:
+                    for item_data in doc_detail[6]:
                         self.invoice_items_tree.insert("", "end", values=(
                             item_data.get("ad", ""),
                             f"{item_data.get('miktar', 0):.2f}",
@@ -2447,15 +2579,14 @@ class GelirGiderUygulamasi:
             return
 
         try:
-            doc_id, doc_type, doc_number, customer_name, doc_date, due_validity_date, items_json, \
-                total_excl_kdv, total_kdv, total_with_kdv, notes, status = doc_detail
-
-            items_list = json.loads(items_json)
+            doc_id, doc_type, doc_number, customer_name, doc_date, due_validity_date, items_list, \
+                total_excl_kdv, total_kdv, total_with_kdv, notes, status, customer_id = doc_detail
 
             doc_data = {
                 "doc_type": doc_type,
                 "doc_number": doc_number,
                 "customer_name": customer_name,
+                "customer_id": customer_id,
                 "doc_date": doc_date,
                 "due_valid_date": due_validity_date,
                 "items": items_list,
@@ -2602,21 +2733,15 @@ class GelirGiderUygulamasi:
         chart_window.title("Aylık Bakiye Trend Grafiği")
         chart_window.geometry("800x500")
 
-        time_series_raw_data = self.db_manager.get_monthly_balance_trend(self.kullanici_id, num_months=12)
+        monthly_trend_data = self.db_manager.get_monthly_balance_trend(self.kullanici_id, num_months=12)
 
         fig_balance, ax = plt.subplots(figsize=(8, 4))
 
-        if time_series_raw_data:
-            df = pd.DataFrame(time_series_raw_data, columns=['date', 'type', 'amount'])
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
-            df['signed_amount'] = df.apply(lambda row: row['amount'] if row['type'] == 'Gelir' else -row['amount'],
-                                           axis=1)
-            df = df.sort_values('date')
-            df['cumulative_balance'] = df['signed_amount'].cumsum()
-            monthly_cumulative_balance = df['cumulative_balance'].resample('ME').last().ffill().fillna(0)
-
-            monthly_cumulative_balance.plot(ax=ax, kind='line', marker='o')
+        if monthly_trend_data:
+            months = [datetime.strptime(year_month, '%Y-%m') for year_month, _, _ in monthly_trend_data]
+            balances = [balance for _, _, balance in monthly_trend_data]
+
+            ax.plot(months, balances, marker='o')
             ax.set_title('Aylık Kümülatif Bakiye Trendi')
             ax.set_xlabel('Tarih')
             ax.set_ylabel('Bakiye (TL)')
@@ -2671,22 +2796,13 @@ class GelirGiderUygulamasi:
         total_sales_kdv = self.db_manager.get_total_sales_kdv(start_date_db_format, end_date_db_format,
                                                               self.kullanici_id)
 
-        invoice_item_jsons = self.db_manager.get_invoice_jsons_for_tax_report(start_date_db_format, end_date_db_format,
-                                                                              self.kullanici_id)
-
-        kdv_by_rate = {}
-
-        for item_json_tuple in invoice_item_jsons:
-            items_list = json.loads(item_json_tuple[0])
-            for item in items_list:
-                kdv_rate = item.get("kdv_orani", 0)
-                kdv_amount = item.get("kdv_miktari", 0)
-                kdv_by_rate[kdv_rate] = kdv_by_rate.get(kdv_rate, 0) + kdv_amount
+        kdv_by_rate = self.db_manager.get_sales_kdv_by_rate(start_date_db_format, end_date_db_format,
+                                                            self.kullanici_id)
 
         report_text_lines.append("--- Detaylı Satış KDV Dökümü ---")
         kdv_detail_data = [["KDV Oranı (%)", "KDV Miktarı (TL)"]]
         if kdv_by_rate:
-            for rate, amount in sorted(kdv_by_rate.items()):
+            for rate, amount in kdv_by_rate:
                 report_text_lines.append(f"KDV Oranı %{rate:.2f}: {amount:.2f} TL")
                 kdv_detail_data.append([f"{rate:.2f}%", f"{amount:.2f} TL"])
         else:
@@ -2755,13 +2871,13 @@ class GelirGiderUygulamasi:
         #         self.show_error("PDF Raporu Hatası", f"Vergi raporu PDF oluşturulurken hata oluştu: {e}")
 
     def export_transactions_to_pdf(self):
-        """Ana listedeki gelir/gider verilerini PDF'e aktarır."""
-        data_to_export = []
+        """Ana listedeki filtreye uyan gelir/gider verilerini PDF'e aktarır."""
         headers = [self.transactions_tree.heading(col_id)['text'] for col_id in self.transactions_tree["columns"]]
 
-        for item_id in self.transactions_tree.get_children():
-            values = self.transactions_tree.item(item_id, 'values')
-            data_to_export.append([str(v) for v in values])  # Tüm değerleri string'e çevir
+        # Liste sayfalı yüklendiğinden, filtreye uyan tüm işlemler veritabanından sayfa sayfa okunur
+        data_to_export = [[str(v) for v in row]  # Tüm değerleri string'e çevir
+                          for row in self.db_manager.iter_transactions(self.kullanici_id,
+                                                                       **self._transaction_filters)]
 
         if not data_to_export:
             self.show_message("Bilgi", "Dışa aktarılacak işlem verisi bulunamadı.")
@@ -2798,14 +2914,12 @@ class GelirGiderUygulamasi:
             print(f"Hata: İşlemleri PDF'e aktarırken: {e}")
 
     def export_transactions_to_excel(self):
-        """Ana listedeki gelir/gider verilerini Excel'e aktarır."""
-        data_to_export = []
+        """Ana listedeki filtreye uyan gelir/gider verilerini Excel'e aktarır."""
         # Not: self.tree yerine self.transactions_tree kullanılıyor
         headers = [self.transactions_tree.heading(col_id)['text'] for col_id in self.transactions_tree["columns"]]
 
-        for item_id in self.transactions_tree.get_children():
-            values = self.transactions_tree.item(item_id, 'values')
-            data_to_export.append(values)
+        # Liste sayfalı yüklendiğinden, filtreye uyan tüm işlemler veritabanından sayfa sayfa okunur
+        data_to_export = list(self.db_manager.iter_transactions(self.kullanici_id, **self._transaction_filters))
 
         if not data_to_export:
             self.show_message("Bilgi", "Dışa aktarılacak işlem verisi bulunamadı.")
@@ -215,7 +215,11 @@ class PDFGenerator:
         notes = doc_data.get("notes", "")
         status = doc_data.get("status", "N/A")
 
-        customer_info = self.db_manager.get_customer_by_name(customer_name, self.user_id)
+        customer_id = doc_data.get("customer_id")
+        if customer_id is not None:
+            customer_info = self.db_manager.get_customer_by_id(customer_id, self.user_id)
+        else:
+            customer_info = self.db_manager.get_customer_by_name(customer_name, self.user_id)
         customer_address = customer_info[2] if customer_info and len(customer_info) > 2 and customer_info[2] else "Belirtilmemiş"
         customer_phone = customer_info[3] if customer_info and len(customer_info) > 3 and customer_info[3] else "Belirtilmemiş"
         customer_email = customer_info[4] if customer_info and len(customer_info) > 4 and customer_info[4] else "Belirtilmemiş"